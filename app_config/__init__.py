@@ -6,6 +6,10 @@ from models.shorten_url import Urlshort, UrlShortenerClicks, ShortUrlClickLocati
 from models.blogs import Catgories, Blogs
 from models.qrcode import QRCodeCategories, QRCodeData, QrCodeStyling, SocialMedia
 from models.qrcode_unauth import QRCodeDataUnauth
+from models.short_code import ShortCode
+from models.click_rollup import ClickRollup
+from models.click_dimension import ClickDimension
+from models.user_counters import UserCounters
 from models.payment import PaymentPlans, Subscriptions, Transactions
 from models.admin_models import Admin, AdminSession
 from models.giftlink import (
@@ -32,6 +36,7 @@ from endpoints import (
     CloudNaryBlueprint,
     GiftlinkBlueprint,
 )
+from commands import register_commands
 from utils import return_response
 from http_status import HttpStatus
 from status_res import StatusRes
@@ -156,4 +161,6 @@ def create_app(config_name="development"):
     app.register_blueprint(GiftlinkBlueprint, url_prefix="/api/v1")
     app.register_blueprint(RedirectUrlBlueprint)
 
+    register_commands(app)
+
     return app
@@ -0,0 +1,205 @@
+import bisect
+import datetime
+import ipaddress
+import json
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from connection.redis_connection import redis_conn
+from logger import logger
+
+load_dotenv()
+
+# one cidr per line, published crawler and uptime monitor ranges
+BOT_RANGES_PATH = os.environ.get("BOT_RANGES_PATH", "bot_ranges.txt")
+# comma separated lists fetched by flask bots refresh, plain text or the
+# {"prefixes": [{"ipv4Prefix": ...}]} json published by search engines
+BOT_RANGES_URLS = os.environ.get("BOT_RANGES_URLS", "")
+# how often (seconds) a worker stats the ranges file to pick up a refresh
+BOT_RANGES_RELOAD_CHECK = int(os.environ.get("BOT_RANGES_RELOAD_CHECK", 60))
+BOT_HITS_TTL_DAYS = int(os.environ.get("BOT_HITS_TTL_DAYS", 400))
+
+
+class RangeSet:
+    """Sorted, merged ip ranges searched with bisect."""
+
+    def __init__(self, networks, mtime=None):
+        self.mtime = mtime
+        self.ranges = {4: ([], []), 6: ([], [])}
+        merged = {4: [], 6: []}
+        for network in sorted(networks, key=lambda n: (n.version, n.network_address)):
+            start = int(network.network_address)
+            end = int(network.broadcast_address)
+            spans = merged[network.version]
+            if spans and start <= spans[-1][1] + 1:
+                spans[-1][1] = max(spans[-1][1], end)
+            else:
+                spans.append([start, end])
+        for version, spans in merged.items():
+            starts, ends = self.ranges[version]
+            for start, end in spans:
+                starts.append(start)
+                ends.append(end)
+
+    def __len__(self):
+        return sum(len(starts) for starts, _ in self.ranges.values())
+
+    def __contains__(self, ip):
+        if ip.version == 6 and ip.ipv4_mapped:
+            ip = ip.ipv4_mapped
+        starts, ends = self.ranges[ip.version]
+        value = int(ip)
+        index = bisect.bisect_right(starts, value) - 1
+        return index >= 0 and value <= ends[index]
+
+
+def parse_ranges(text):
+    """Networks of a ranges list, either plain cidr lines or prefixes json."""
+    networks = []
+    try:
+        prefixes = json.loads(text).get("prefixes", [])
+        lines = [
+            prefix.get("ipv4Prefix") or prefix.get("ipv6Prefix") or ""
+            for prefix in prefixes
+        ]
+    except (ValueError, AttributeError):
+        lines = text.splitlines()
+    for line in lines:
+        line = line.split("#")[0].strip()
+        if not line:
+            continue
+        try:
+            networks.append(ipaddress.ip_network(line, strict=False))
+        except ValueError:
+            continue
+    return networks
+
+
+def write_ranges(networks, path=BOT_RANGES_PATH):
+    """Write networks to the ranges file, running workers reload it."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        for network in networks:
+            fh.write(f"{network}\n")
+    os.replace(tmp_path, path)
+
+
+_ranges = None
+_last_check = 0.0
+_lock = threading.Lock()
+
+
+def _load_ranges():
+    global _ranges, _last_check
+
+    now = time.monotonic()
+    if _ranges is not None and now - _last_check < BOT_RANGES_RELOAD_CHECK:
+        return _ranges
+
+    with _lock:
+        if _ranges is not None and now - _last_check < BOT_RANGES_RELOAD_CHECK:
+            return _ranges
+        _last_check = now
+        try:
+            mtime = os.path.getmtime(BOT_RANGES_PATH)
+        except OSError:
+            # no list deployed, only the user agent marks bots
+            if _ranges is None:
+                _ranges = RangeSet([])
+            return _ranges
+
+        if _ranges is None or mtime != _ranges.mtime:
+            try:
+                with open(BOT_RANGES_PATH, encoding="utf-8") as fh:
+                    _ranges = RangeSet(parse_ranges(fh.read()), mtime)
+                logger.info(f"bot ranges loaded: {len(_ranges)} ranges")
+            except Exception as e:
+                logger.error(f"{e}: error@bot_filter/_load_ranges")
+        return _ranges
+
+
+def is_bot_ip(ip_address):
+    try:
+        ip = ipaddress.ip_address((ip_address or "").split(",")[0].strip())
+    except ValueError:
+        return False
+    return ip in _load_ranges()
+
+
+def is_bot(agent, ip_address):
+    """True for a classified bot user agent or an ip in the bot ranges."""
+    return agent.is_bot or is_bot_ip(ip_address)
+
+
+def _key(kind, target_id):
+    return f"bots:{kind}:{target_id}"
+
+
+def _user_key(kind, user_id):
+    return f"bots:user:{kind}:{user_id}"
+
+
+def _days(start, end):
+    day = start.date() if isinstance(start, datetime.datetime) else start
+    end = end.date() if isinstance(end, datetime.datetime) else end
+    while day < end:
+        yield day
+        day += datetime.timedelta(days=1)
+
+
+def record_bot_hit(kind, target_id, user_id=None):
+    """Count a bot hit of a link, the only write a bot ever causes.
+
+    The hit is also counted for the owner of the link so that the totals of
+    a user are read without listing every link.
+    """
+    keys = [_key(kind, target_id)]
+    if user_id:
+        keys.append(_user_key(kind, user_id))
+    try:
+        pipe = redis_conn.pipeline()
+        for key in keys:
+            pipe.hincrby(key, f"{datetime.datetime.utcnow():%Y%m%d}", 1)
+            pipe.expire(key, BOT_HITS_TTL_DAYS * 86400)
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"{e}: error@bot_filter/record_bot_hit")
+
+
+def bots_by_day(kind, target_ids, start, end):
+    """Bot hits of the links summed for every day in [start, end)."""
+    days = list(_days(start, end))
+    totals = dict.fromkeys(days, 0)
+    if not days or not target_ids:
+        return totals
+    fields = [f"{day:%Y%m%d}" for day in days]
+    try:
+        pipe = redis_conn.pipeline()
+        for target_id in target_ids:
+            pipe.hmget(_key(kind, target_id), fields)
+        for counts in pipe.execute():
+            for day, count in zip(days, counts):
+                totals[day] += int(count or 0)
+    except Exception as e:
+        logger.error(f"{e}: error@bot_filter/bots_by_day")
+    return totals
+
+
+def user_bots_by_day(kind, user_id, start, end):
+    """Bot hits of all the links of kind of a user for every day in [start, end)."""
+    days = list(_days(start, end))
+    totals = dict.fromkeys(days, 0)
+    if not days:
+        return totals
+    try:
+        counts = redis_conn.get_connection().hmget(
+            _user_key(kind, user_id), [f"{day:%Y%m%d}" for day in days]
+        )
+        for day, count in zip(days, counts):
+            totals[day] = int(count or 0)
+    except Exception as e:
+        logger.error(f"{e}: error@bot_filter/user_bots_by_day")
+    return totals
@@ -1,4 +1,5 @@
 from celery.schedules import crontab
+from click_stream import CLICK_STREAM_FLUSH_INTERVAL
 
 
 # CELERY_IMPORTS = ("celery_config.cron",)
@@ -31,4 +32,15 @@ accept_content = ["json", "msgpack", "yaml"]
 task_serializer = "json"
 result_serializer = "json"
 
+beat_schedule = {
+    "drain-click-stream": {
+        "task": "celery_config.utils.celery_works.drain_click_stream",
+        "schedule": CLICK_STREAM_FLUSH_INTERVAL,
+    },
+    "maintain-click-partitions": {
+        "task": "celery_config.utils.celery_works.maintain_partitions",
+        "schedule": crontab(minute=15, hour=0),
+    },
+}
+
 # broker_connection_retry_on_startup = True
@@ -1,7 +1,23 @@
 from celery_config.settings import celery, shared_task
 from models.shorten_url import Urlshort
 from models.qrcode import QRCodeData
+from models.short_code import ShortCode
 from crud import (
+    resolve_short_url,
+    ingest_click_events,
+    maintain_click_partitions,
+    increment_link_clicks,
+    add_user_counter,
+    export_path,
+    create_short_urls,
+    set_bulk_job,
+    fill_link_title,
+    format_click_rows,
+    iter_click_rows,
+    prune_exports,
+    set_export_job,
+    write_click_export,
+    count_visitors,
     save_qrcode_clicks,
     save_url_clicks,
     save_transactions,
@@ -10,15 +26,34 @@ from crud import (
 )
 from extensions import db
 from logger import logger
+import click_stream
+import page_title
+import datetime
+from unique_visitors import add_visitors
+import time
 
 
 @shared_task
-def save_clicks_for_analytics(short_url, payload):
-    url = Urlshort.query.filter_by(short_url=short_url).first()
-    if not url:
-        url = QRCodeData.query.filter_by(short_url=short_url).first()
-        if not url:
+def save_clicks_for_analytics(short_url, payload, kind=None, target_id=None):
+    # the redirect already resolved the code, tasks queued by older workers
+    # only carry the code and are resolved through the registry
+    if not kind:
+        link = resolve_short_url(short_url)
+        if not link:
             return ""
+        kind, target_id = link["kind"], link["id"]
+
+    if kind == ShortCode.SHORT_URL:
+        url = db.session.get(Urlshort, target_id)
+    elif kind == ShortCode.QRCODE:
+        url = db.session.get(QRCodeData, target_id)
+    else:
+        # unauthenticated qr codes are not tracked
+        return ""
+    if not url:
+        return ""
+
+    if kind == ShortCode.QRCODE:
         save_qrcode_clicks(url.id, payload)
     else:
         if url.want_qr_code:
@@ -26,18 +61,143 @@ def save_clicks_for_analytics(short_url, payload):
             if qr_url:
                 print(qr_url.id, "qr_url.id")
                 save_qrcode_clicks(qr_url.id, payload)
-                qr_url.clicks += 1
+                increment_link_clicks(QRCodeData, {qr_url.id: 1})
+                add_user_counter(qr_url.user_id, qr_code_clicks=1)
                 db.session.commit()
         save_url_clicks(url.id, payload)
 
     print("saving url clicks +1")
-    url.clicks += 1
+    increment_link_clicks(type(url), {url.id: 1})
+    if kind == ShortCode.QRCODE:
+        add_user_counter(url.user_id, qr_code_clicks=1)
+    else:
+        add_user_counter(url.user_id, short_url_clicks=1)
     db.session.commit()
+
+    visitors, now = {}, datetime.datetime.utcnow()
+    count_visitors(visitors, kind, url.id, url.user_id, now, payload.get("ip_address"))
+    if kind == ShortCode.SHORT_URL and url.want_qr_code and url.qr_code_rel:
+        qr_url = url.qr_code_rel
+        count_visitors(
+            visitors,
+            ShortCode.QRCODE,
+            qr_url.id,
+            qr_url.user_id,
+            now,
+            payload.get("ip_address"),
+        )
+    add_visitors(visitors)
     print(url.url, "the real url")
 
     return True
 
 
+@shared_task
+def drain_click_stream(max_batches=20):
+    # beat fires this every CLICK_STREAM_FLUSH_INTERVAL seconds, the lock keeps
+    # a slow drain from overlapping with the next one
+    lock_ttl = int(click_stream.CLICK_STREAM_FLUSH_INTERVAL * max_batches) + 30
+    if not click_stream.acquire_drain_lock(lock_ttl):
+        return 0
+
+    ingested = 0
+    try:
+        for _ in range(max_batches):
+            events = click_stream.read_batch()
+            if not events:
+                break
+            started = time.perf_counter()
+            try:
+                ingest_click_events(events)
+            except Exception as e:
+                # left pending, the batch is claimed again on a later drain
+                # until click_stream dead-letters it
+                logger.exception("traceback@celery_works/drain_click_stream")
+                logger.error(f"{e}: error@celery_works/drain_click_stream")
+                db.session.rollback()
+                break
+            click_stream.ack(events)
+            click_stream.record_flush(
+                len(events), (time.perf_counter() - started) * 1000
+            )
+            ingested += len(events)
+            if len(events) < click_stream.CLICK_STREAM_BATCH_SIZE:
+                break
+    finally:
+        click_stream.release_drain_lock()
+    return ingested
+
+
+@shared_task
+def export_clicks(
+    job_id, user_id, target_type, fmt, start=None, end=None, link_id=None
+):
+    set_export_job(job_id, status="running")
+    try:
+        rows = iter_click_rows(
+            target_type,
+            user_id,
+            datetime.date.fromisoformat(start) if start else None,
+            datetime.date.fromisoformat(end) if end else None,
+            link_id,
+        )
+        size = write_click_export(
+            export_path(job_id, fmt), format_click_rows(rows, fmt)
+        )
+        set_export_job(job_id, status="done", size=size)
+    except Exception as e:
+        logger.exception("traceback@celery_works/export_clicks")
+        logger.error(f"{e}: error@celery_works/export_clicks")
+        db.session.rollback()
+        set_export_job(job_id, status="failed")
+        return False
+    prune_exports()
+    return True
+
+
+@shared_task
+def maintain_partitions():
+    try:
+        report = maintain_click_partitions()
+    except Exception as e:
+        logger.exception("traceback@celery_works/maintain_partitions")
+        logger.error(f"{e}: error@celery_works/maintain_partitions")
+        db.session.rollback()
+        return False
+    return {table: len(dropped) for table, dropped in report.items()}
+
+
+@shared_task
+def fetch_link_title(kind, link_id, url, placeholder):
+    try:
+        title = page_title.fetch_title(url)
+        if title:
+            fill_link_title(kind, link_id, placeholder, title)
+    except Exception as e:
+        logger.exception("traceback@celery_works/fetch_link_title")
+        logger.error(f"{e}: error@celery_works/fetch_link_title")
+        db.session.rollback()
+        return False
+    return True
+
+
+@shared_task
+def create_bulk_short_urls(job_id, user_id, rows, want_qr_code=False):
+    set_bulk_job(job_id, status="running")
+    try:
+        links = create_short_urls(job_id, user_id, rows, want_qr_code)
+    except Exception as e:
+        logger.exception("traceback@celery_works/create_bulk_short_urls")
+        logger.error(f"{e}: error@celery_works/create_bulk_short_urls")
+        db.session.rollback()
+        # the chunks committed before the failure stay on the job
+        set_bulk_job(job_id, status="failed")
+        return False
+    # the links are already on the job, written chunk by chunk
+    set_bulk_job(job_id, status="done")
+    return len(links)
+
+
 # SAVE FROM VERIFY TRANSACTIONS
 @shared_task
 def save_transaction_from_verify_transaction(
@@ -0,0 +1,212 @@
+import os
+import socket
+import time
+
+from dotenv import load_dotenv
+from redis.exceptions import ResponseError
+
+from connection.redis_connection import redis_conn
+from logger import logger
+
+load_dotenv()
+
+STREAM_KEY = "clicks:stream"
+GROUP = "click-ingest"
+DEAD_LETTER_KEY = "clicks:dead"
+METRICS_KEY = "clicks:metrics"
+LOCK_KEY = "clicks:drain_lock"
+
+CLICK_STREAM_BATCH_SIZE = int(os.environ.get("CLICK_STREAM_BATCH_SIZE", 500))
+# seconds between two drains of the stream by celery beat
+CLICK_STREAM_FLUSH_INTERVAL = float(os.environ.get("CLICK_STREAM_FLUSH_INTERVAL", 5))
+# hard cap on the stream, oldest events are trimmed past it
+CLICK_STREAM_MAXLEN = int(os.environ.get("CLICK_STREAM_MAXLEN", 1000000))
+# events left unacked this long by a dead consumer are claimed again
+CLICK_STREAM_CLAIM_IDLE_MS = int(os.environ.get("CLICK_STREAM_CLAIM_IDLE_MS", 60000))
+# deliveries after which a pending event goes to the dead-letter stream
+# instead of failing its batch again
+CLICK_STREAM_MAX_DELIVERIES = int(os.environ.get("CLICK_STREAM_MAX_DELIVERIES", 5))
+
+CONSUMER = f"{socket.gethostname()}-{os.getpid()}"
+
+# stream field -> event key, short names keep each entry small
+FIELDS = {
+    "k": "kind",
+    "t": "target_id",
+    "ts": "ts",
+    "ip": "ip_address",
+    "co": "country",
+    "ci": "city",
+    "dv": "device",
+    "br": "browser_name",
+}
+
+
+def publish_click(kind, target_id, payload):
+    """Append a click to the stream, the redirect never waits on the database."""
+    entry = {
+        "k": kind,
+        "t": target_id,
+        "ts": int(time.time()),
+        "ip": payload.get("ip_address") or "",
+        "co": payload.get("country") or "",
+        "ci": payload.get("city") or "",
+        "dv": payload.get("device") or "",
+        "br": payload.get("browser_name") or "",
+    }
+    try:
+        redis_conn.get_connection().xadd(
+            STREAM_KEY, entry, maxlen=CLICK_STREAM_MAXLEN, approximate=True
+        )
+        return True
+    except Exception as e:
+        logger.error(f"{e}: error@click_stream/publish_click")
+        return False
+
+
+def _ensure_group(connection):
+    try:
+        connection.xgroup_create(STREAM_KEY, GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def _decode(entry_id, fields):
+    event = {FIELDS[key]: value for key, value in fields.items() if key in FIELDS}
+    event["ts"] = int(event.get("ts") or 0)
+    event["entry_id"] = entry_id
+    return event
+
+
+def _drop_dead_letters(connection, entries):
+    # claimed entries delivered too often move to the dead-letter stream, a
+    # batch that cannot be ingested must not be claimed forever
+    pending = connection.xpending_range(
+        STREAM_KEY,
+        GROUP,
+        min=entries[0][0],
+        max=entries[-1][0],
+        count=len(entries) + CLICK_STREAM_BATCH_SIZE,
+        consumername=CONSUMER,
+    )
+    deliveries = {item["message_id"]: item["times_delivered"] for item in pending}
+    dead = [
+        entry
+        for entry in entries
+        if deliveries.get(entry[0], 0) > CLICK_STREAM_MAX_DELIVERIES
+    ]
+    if not dead:
+        return entries
+    dead_ids = [entry_id for entry_id, _ in dead]
+    pipe = connection.pipeline()
+    for entry_id, fields in dead:
+        pipe.xadd(
+            DEAD_LETTER_KEY,
+            dict(fields, id=entry_id),
+            maxlen=CLICK_STREAM_MAXLEN,
+            approximate=True,
+        )
+    pipe.xack(STREAM_KEY, GROUP, *dead_ids)
+    pipe.xdel(STREAM_KEY, *dead_ids)
+    pipe.hincrby(METRICS_KEY, "dead_lettered", len(dead))
+    pipe.execute()
+    logger.error(
+        f"{len(dead)} click events moved to {DEAD_LETTER_KEY} after "
+        f"{CLICK_STREAM_MAX_DELIVERIES} deliveries: error@click_stream/read_batch"
+    )
+    dead_ids = set(dead_ids)
+    return [entry for entry in entries if entry[0] not in dead_ids]
+
+
+def read_batch(count=CLICK_STREAM_BATCH_SIZE):
+    """Read up to count events for this consumer.
+
+    Events a crashed consumer left pending, or a failed batch, are claimed
+    first; those delivered more than CLICK_STREAM_MAX_DELIVERIES times are
+    moved to the dead-letter stream instead.
+    """
+    connection = redis_conn.get_connection()
+    _ensure_group(connection)
+
+    claimed = connection.xautoclaim(
+        STREAM_KEY, GROUP, CONSUMER, CLICK_STREAM_CLAIM_IDLE_MS, count=count
+    )
+    entries = [entry for entry in claimed[1] if entry and entry[1]]
+    if entries:
+        entries = _drop_dead_letters(connection, entries)
+
+    if len(entries) < count:
+        response = connection.xreadgroup(
+            GROUP, CONSUMER, {STREAM_KEY: ">"}, count=count - len(entries)
+        )
+        for _, stream_entries in response or []:
+            entries.extend(stream_entries)
+
+    return [_decode(entry_id, fields) for entry_id, fields in entries]
+
+
+def ack(events):
+    entry_ids = [event["entry_id"] for event in events]
+    if not entry_ids:
+        return
+    pipe = redis_conn.pipeline()
+    pipe.xack(STREAM_KEY, GROUP, *entry_ids)
+    pipe.xdel(STREAM_KEY, *entry_ids)
+    pipe.execute()
+
+
+def acquire_drain_lock(ttl):
+    return redis_conn.get_connection().set(LOCK_KEY, CONSUMER, nx=True, ex=ttl)
+
+
+def release_drain_lock():
+    connection = redis_conn.get_connection()
+    if connection.get(LOCK_KEY) == CONSUMER:
+        connection.delete(LOCK_KEY)
+
+
+def record_flush(batch_size, duration_ms):
+    pipe = redis_conn.pipeline()
+    pipe.hincrby(METRICS_KEY, "ingested", batch_size)
+    pipe.hincrby(METRICS_KEY, "batches", 1)
+    pipe.hset(
+        METRICS_KEY,
+        mapping={
+            "last_batch_size": batch_size,
+            "last_flush_ms": round(duration_ms, 2),
+            "last_flush_at": int(time.time()),
+        },
+    )
+    pipe.execute()
+
+
+def pipeline_metrics():
+    """Backpressure view of the stream: backlog, unacked events and flush stats."""
+    connection = redis_conn.get_connection()
+    _ensure_group(connection)
+
+    backlog = connection.xlen(STREAM_KEY)
+    pending = connection.xpending(STREAM_KEY, GROUP)
+    metrics = connection.hgetall(METRICS_KEY)
+
+    oldest_age = 0
+    first = connection.xrange(STREAM_KEY, count=1)
+    if first:
+        first_ms = int(first[0][0].split("-")[0])
+        oldest_age = max(0, round(time.time() - first_ms / 1000, 2))
+
+    return {
+        "backlog": backlog,
+        "pending": pending.get("pending", 0) if pending else 0,
+        "oldest_event_age_seconds": oldest_age,
+        "max_length": CLICK_STREAM_MAXLEN,
+        "batch_size": CLICK_STREAM_BATCH_SIZE,
+        "flush_interval": CLICK_STREAM_FLUSH_INTERVAL,
+        "ingested": int(metrics.get("ingested", 0)),
+        "batches": int(metrics.get("batches", 0)),
+        "dead_lettered": int(metrics.get("dead_lettered", 0)),
+        "last_batch_size": int(metrics.get("last_batch_size", 0)),
+        "last_flush_ms": float(metrics.get("last_flush_ms", 0)),
+        "last_flush_at": int(metrics.get("last_flush_at", 0)),
+    }
@@ -0,0 +1,145 @@
+import os
+import random
+import secrets
+import string
+import threading
+
+from dotenv import load_dotenv
+from hashids import Hashids
+
+from connection.redis_connection import redis_conn
+from logger import logger
+
+load_dotenv()
+
+# numbers a worker takes from redis at once, unused ones are skipped for good
+SHORT_CODE_BLOCK_SIZE = int(os.environ.get("SHORT_CODE_BLOCK_SIZE", 100))
+# required, a known salt lets anyone enumerate the links in creation order
+SHORT_CODE_SALT = os.environ.get("SHORT_CODE_SALT")
+if not SHORT_CODE_SALT:
+    raise RuntimeError("SHORT_CODE_SALT must be set")
+# hashids part of a code, one longer than the old random codes so that the
+# two never meet
+SHORT_CODE_MIN_LENGTH = int(os.environ.get("SHORT_CODE_MIN_LENGTH", 6))
+
+SEQUENCE_KEY = "short_codes:sequence"
+
+# the first letter tells which kind of link a code belongs to
+URL_SHORT_INITIALS = "ABCDEFGHI"
+UN_AUTH_INITIALS = "JKLMNOPQ"
+QR_CODE_INITIALS = "RSTUVWXYZ"
+
+# the registry compares codes lower-cased, a single-case alphabet keeps two
+# numbers from encoding to codes that only differ by case
+hashids = Hashids(
+    salt=SHORT_CODE_SALT,
+    min_length=SHORT_CODE_MIN_LENGTH,
+    alphabet=string.ascii_lowercase + string.digits,
+)
+
+
+class BlockAllocator:
+    """Hands out numbers from blocks reserved in redis with one INCRBY.
+
+    Every number is reserved for one worker only, so codes built from them
+    never collide and creating a link needs no lookup.
+    """
+
+    def __init__(self, block_size=SHORT_CODE_BLOCK_SIZE):
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def take(self):
+        with self._lock:
+            # a forked worker must not share the block of its parent
+            if self._pid != os.getpid() or self._next >= self._end:
+                self._end = _reserve(self.block_size)
+                self._next = self._end - self.block_size
+                self._pid = os.getpid()
+            number = self._next
+            self._next += 1
+            return number
+
+
+_allocator = BlockAllocator()
+
+
+def _reserve(size):
+    """Reserve size numbers, returns the end of the range (exclusive)."""
+    conn = redis_conn.get_connection()
+    if not conn.exists(SEQUENCE_KEY):
+        # a lost counter restarts past every code already handed out
+        conn.set(SEQUENCE_KEY, _highest_issued(), nx=True)
+    return conn.incrby(SEQUENCE_KEY, size) + 1
+
+
+def _highest_issued():
+    from extensions import db
+    from models.short_code import ShortCode
+
+    highest = 0
+    codes = db.session.query(ShortCode.code).filter(
+        db.func.length(ShortCode.code) > SHORT_CODE_MIN_LENGTH
+    )
+    for (code,) in codes.yield_per(10000):
+        decoded = hashids.decode(code[1:])
+        if decoded:
+            highest = max(highest, decoded[0])
+    return highest
+
+
+def _random_code():
+    # the old scheme, only used while redis is unreachable; the registry
+    # still rejects a code that is already taken
+    characters = string.ascii_uppercase + string.ascii_lowercase + string.digits
+    return "".join(secrets.choice(characters) for _ in range(5))
+
+
+def _initial(url_short, un_auth):
+    if url_short:
+        initials = URL_SHORT_INITIALS
+    elif un_auth:
+        initials = UN_AUTH_INITIALS
+    else:
+        initials = QR_CODE_INITIALS
+    initial = random.choice(initials)
+    return random.choice([initial.lower(), initial.upper()])
+
+
+def is_reserved(code):
+    """True for a code the allocator hands out or will hand out one day.
+
+    Custom codes must not take one, the link that gets its number later
+    would fail to register.
+    """
+    code = code.lower()
+    return len(code) > SHORT_CODE_MIN_LENGTH and bool(hashids.decode(code[1:]))
+
+
+def allocate(url_short=False, un_auth=False):
+    """Return a new short code for a url, an unauth qr code or a qr code."""
+    initial = _initial(url_short, un_auth)
+    try:
+        return f"{initial}{hashids.encode(_allocator.take())}"
+    except Exception as e:
+        logger.error(f"{e}: error@code_allocator/allocate")
+        return f"{initial}{_random_code()}"
+
+
+def allocate_many(count, url_short=False, un_auth=False):
+    """Return count new short codes, reserved with a single INCRBY."""
+    if count <= 0:
+        return []
+    try:
+        end = _reserve(count)
+        numbers = range(end - count, end)
+        return [
+            f"{_initial(url_short, un_auth)}{hashids.encode(number)}"
+            for number in numbers
+        ]
+    except Exception as e:
+        logger.error(f"{e}: error@code_allocator/allocate_many")
+        return [f"{_initial(url_short, un_auth)}{_random_code()}" for _ in range(count)]
@@ -0,0 +1,167 @@
+import hashlib
+import math
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from connection.redis_connection import redis_conn
+from logger import logger
+
+load_dotenv()
+
+CODE_FILTER_ENABLED = os.environ.get("CODE_FILTER_ENABLED", "true").lower() == "true"
+# false positive rate of the filter, a false positive only costs the lookup
+# every code paid before
+CODE_FILTER_FP_RATE = float(os.environ.get("CODE_FILTER_FP_RATE", 0.001))
+# room left for codes created after a build, the filter is rebuilt past it
+CODE_FILTER_MIN_CAPACITY = int(os.environ.get("CODE_FILTER_MIN_CAPACITY", 100000))
+# deleted codes stay in the filter until the next rebuild
+CODE_FILTER_REBUILD_INTERVAL = int(
+    os.environ.get("CODE_FILTER_REBUILD_INTERVAL", 21600)
+)
+
+CHANNEL = "short_codes:changes"
+ADDED = "add"
+DELETED = "del"
+
+
+class BloomFilter:
+    """Fixed size bloom filter over a bytearray, k positions by double hashing."""
+
+    def __init__(self, capacity, fp_rate=CODE_FILTER_FP_RATE):
+        self.capacity = max(capacity, 1)
+        self.size = max(8, int(-self.capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, code):
+        digest = hashlib.blake2b(code.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, code):
+        for position in self._positions(code):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, code):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(code)
+        )
+
+
+_filter = None
+_stale = 0
+_built_at = 0.0
+_thread = None
+_lock = threading.Lock()
+
+
+def might_exist(short_url):
+    """False only when short_url is certainly not a live code.
+
+    Until this worker's filter is built every code might exist.
+    """
+    current = _filter
+    if not CODE_FILTER_ENABLED or current is None or not short_url:
+        return True
+    return short_url.lower() in current
+
+
+def publish_change(action, *short_urls):
+    """Tell every worker about created (ADDED) or removed (DELETED) codes."""
+    codes = [short_url.lower() for short_url in short_urls if short_url]
+    if not codes:
+        return
+    if action == ADDED and _filter is not None:
+        # this worker serves the new code right away, whatever redis does
+        for code in codes:
+            _filter.add(code)
+    try:
+        pipe = redis_conn.pipeline()
+        for code in codes:
+            pipe.publish(CHANNEL, f"{action}:{code}")
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"{e}: error@code_filter/publish_change")
+
+
+def _build(app):
+    global _filter, _stale, _built_at
+    from extensions import db
+    from models.short_code import ShortCode
+
+    with app.app_context():
+        try:
+            total = db.session.query(ShortCode.code).count()
+            bloom = BloomFilter(max(total * 2, CODE_FILTER_MIN_CAPACITY))
+            for (code,) in db.session.query(ShortCode.code).yield_per(10000):
+                bloom.add(code)
+        finally:
+            db.session.remove()
+    _filter, _stale, _built_at = bloom, 0, time.monotonic()
+    logger.info(f"code filter built: {bloom.count} codes, {len(bloom.bits)} bytes")
+
+
+def _needs_rebuild():
+    return (
+        _filter.count >= _filter.capacity
+        or _stale > _filter.count // 10
+        or time.monotonic() - _built_at > CODE_FILTER_REBUILD_INTERVAL
+    )
+
+
+def _apply(message):
+    global _stale
+    action, _, code = message.partition(":")
+    if action == ADDED:
+        _filter.add(code)
+    elif action == DELETED:
+        _stale += 1
+
+
+def _follow(app):
+    global _filter
+    while True:
+        pubsub = None
+        try:
+            pubsub = redis_conn.get_connection().pubsub(ignore_subscribe_messages=True)
+            # subscribed before the build, changes made while it runs wait in
+            # the socket and are applied right after
+            pubsub.subscribe(CHANNEL)
+            # the old filter misses codes created since the last subscription
+            # closed, misses are not trusted until the new one is built
+            _filter = None
+            _build(app)
+            while not _needs_rebuild():
+                message = pubsub.get_message(timeout=1.0)
+                if message and message["type"] == "message":
+                    _apply(message["data"])
+        except Exception as e:
+            # a missed change could hide a new code, misses are no longer
+            # trusted until the filter is built again
+            _filter = None
+            logger.error(f"{e}: error@code_filter/_follow")
+            time.sleep(5)
+        finally:
+            if pubsub is not None:
+                pubsub.close()
+
+
+def start(app):
+    """Build this worker's filter and follow the changes in a daemon thread."""
+    global _thread
+    if not CODE_FILTER_ENABLED or _thread is not None:
+        return
+    with _lock:
+        if _thread is not None:
+            return
+        _thread = threading.Thread(
+            target=_follow, args=(app,), name="code-filter", daemon=True
+        )
+        _thread.start()
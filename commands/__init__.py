@@ -0,0 +1,215 @@
+import gzip
+import os
+import shutil
+import tempfile
+
+import click
+import requests
+from flask.cli import AppGroup
+from sqlalchemy import text
+
+import bot_filter
+import geoip
+from extensions import db
+from crud import (
+    PARTITIONED_TABLES,
+    backfill_click_rollups,
+    backfill_short_codes,
+    backfill_url_hashes,
+    encode_legacy_click_locations,
+    maintain_click_partitions,
+    normalize_daily_clicks,
+    partition_click_table,
+    rebuild_user_counters,
+)
+from models.qrcode import QRCodeData, QrCodeClickLocation, QrcodeRecord
+from models.qrcode_unauth import QRCodeDataUnauth
+from models.shorten_url import ShortUrlClickLocation, UrlShortenerClicks, Urlshort
+
+geoip_cli = AppGroup("geoip", help="Manage the offline geoip table.")
+short_codes_cli = AppGroup("short-codes", help="Manage the short code registry.")
+clicks_cli = AppGroup("clicks", help="Maintain the click tables.")
+bots_cli = AppGroup("bots", help="Manage the bot ip ranges.")
+user_counters_cli = AppGroup("user-counters", help="Maintain the dashboard counters.")
+ids_cli = AppGroup("ids", help="Migrate primary keys.")
+links_cli = AppGroup("links", help="Maintain the link tables.")
+
+# tables whose string ids become native uuid columns, new rows get uuid7 ids
+UUID_ID_TABLES = (
+    "short_url_click_location",
+    "qr_code_click_location",
+    "url_shortener_clicks",
+    "qr_code_record",
+    "transactions",
+)
+
+
+@geoip_cli.command("load")
+@click.argument("csv_path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--output", default=geoip.GEOIP_DB_PATH, show_default=True)
+def geoip_load(csv_path, output):
+    """Compile CSV_PATH into the table used by the redirect path."""
+    v4_count, v6_count = geoip.compile_table(csv_path, output)
+    click.echo(f"geoip table written to {output}: {v4_count} v4, {v6_count} v6")
+
+
+@geoip_cli.command("refresh")
+@click.option("--url", default=lambda: os.environ.get("GEOIP_SOURCE_URL"))
+@click.option("--output", default=geoip.GEOIP_DB_PATH, show_default=True)
+def geoip_refresh(url, output):
+    """Download the csv (optionally gzipped) from URL and recompile the table."""
+    if not url:
+        raise click.UsageError("pass --url or set GEOIP_SOURCE_URL")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        download = os.path.join(tmp_dir, "geoip.download")
+        with requests.get(url, stream=True, timeout=(5, 60)) as response:
+            response.raise_for_status()
+            with open(download, "wb") as fh:
+                for chunk in response.iter_content(chunk_size=1 << 16):
+                    fh.write(chunk)
+
+        csv_path = download
+        with open(download, "rb") as fh:
+            gzipped = fh.read(2) == b"\x1f\x8b"
+        if gzipped:
+            csv_path = os.path.join(tmp_dir, "geoip.csv")
+            with gzip.open(download, "rb") as src, open(csv_path, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+
+        v4_count, v6_count = geoip.compile_table(csv_path, output)
+    click.echo(f"geoip table written to {output}: {v4_count} v4, {v6_count} v6")
+
+
+@bots_cli.command("refresh")
+@click.option("--url", "urls", multiple=True)
+@click.option("--output", default=bot_filter.BOT_RANGES_PATH, show_default=True)
+def bots_refresh(urls, output):
+    """Download the bot ip range lists (URL or BOT_RANGES_URLS) into one file."""
+    urls = urls or [url for url in bot_filter.BOT_RANGES_URLS.split(",") if url]
+    if not urls:
+        raise click.UsageError("pass --url or set BOT_RANGES_URLS")
+
+    networks = []
+    for url in urls:
+        response = requests.get(url, timeout=(5, 60))
+        response.raise_for_status()
+        found = bot_filter.parse_ranges(response.text)
+        click.echo(f"{url}: {len(found)} ranges")
+        networks.extend(found)
+    bot_filter.write_ranges(networks, output)
+    click.echo(f"bot ranges written to {output}: {len(networks)} ranges")
+
+
+@short_codes_cli.command("backfill")
+@click.option("--batch-size", default=1000, show_default=True)
+def short_codes_backfill(batch_size):
+    """Register codes of links created before the registry existed."""
+    totals = backfill_short_codes(batch_size)
+    for kind, added in totals.items():
+        click.echo(f"{kind}: {added} codes registered")
+
+
+@links_cli.command("hash-urls")
+@click.option("--batch-size", default=1000, show_default=True)
+@click.option("--rehash", is_flag=True, help="Hash every url again.")
+def links_hash_urls(batch_size, rehash):
+    """Fill the url digests used by the duplicate checks."""
+    for model in (Urlshort, QRCodeData, QRCodeDataUnauth):
+        hashed = backfill_url_hashes(model, batch_size, rehash)
+        click.echo(f"{model.__tablename__}: {hashed} urls hashed")
+
+
+@clicks_cli.command("normalize-daily")
+def clicks_normalize_daily():
+    """Merge legacy daily click rows into one row per link per day."""
+    removed = normalize_daily_clicks(
+        UrlShortenerClicks,
+        UrlShortenerClicks.url_id,
+        UrlShortenerClicks.count,
+        UrlShortenerClicks.created,
+    )
+    click.echo(f"url_shortener_clicks: {removed} duplicate rows merged")
+    removed = normalize_daily_clicks(
+        QrcodeRecord, QrcodeRecord.qr_code_id, QrcodeRecord.clicks, QrcodeRecord.date
+    )
+    click.echo(f"qr_code_record: {removed} duplicate rows merged")
+
+
+@clicks_cli.command("rebuild-rollups")
+@click.option("--workers", default=4, show_default=True)
+@click.option("--chunk-size", default=500, show_default=True)
+def clicks_rebuild_rollups(workers, chunk_size):
+    """Rebuild the analytics rollups from the raw click rows."""
+    totals = backfill_click_rollups(workers, chunk_size)
+    for target_type, links in totals.items():
+        click.echo(f"{target_type}: rollups rebuilt for {links} links")
+
+
+@clicks_cli.command("encode-dimensions")
+@click.option("--batch-size", default=1000, show_default=True)
+def clicks_encode_dimensions(batch_size):
+    """Move legacy click rows to the dimension dictionary and hashed ips."""
+    for location_model in (ShortUrlClickLocation, QrCodeClickLocation):
+        encoded = encode_legacy_click_locations(location_model, batch_size)
+        click.echo(f"{location_model.__tablename__}: {encoded} rows encoded")
+
+
+@clicks_cli.command("partition")
+def clicks_partition():
+    """Convert the raw click tables to monthly partitions (postgres only)."""
+    if db.session.get_bind().dialect.name != "postgresql":
+        raise click.UsageError("partitioning needs a postgres database")
+    for table in PARTITIONED_TABLES:
+        converted = partition_click_table(table)
+        click.echo(f"{table}: {'partitioned' if converted else 'already partitioned'}")
+
+
+@clicks_cli.command("maintain-partitions")
+@click.option("--no-retention", is_flag=True, help="Only create upcoming partitions.")
+def clicks_maintain_partitions(no_retention):
+    """Create upcoming click partitions and drop the expired ones."""
+    report = maintain_click_partitions(retention=not no_retention)
+    for table, dropped in report.items():
+        click.echo(f"{table}: {len(dropped)} partitions dropped")
+
+
+@user_counters_cli.command("rebuild")
+def user_counters_rebuild():
+    """Recompute every user's dashboard counters from the underlying rows."""
+    users = rebuild_user_counters()
+    click.echo(f"user_counters: rebuilt for {users} users")
+
+
+@ids_cli.command("to-uuid")
+def ids_to_uuid():
+    """Convert the string ids of the high volume tables to native uuid."""
+    if db.session.get_bind().dialect.name != "postgresql":
+        raise click.UsageError("native uuid ids need a postgres database")
+    for table in UUID_ID_TABLES:
+        column_type = db.session.execute(
+            text(
+                "SELECT data_type FROM information_schema.columns "
+                "WHERE table_name = :table AND column_name = 'id'"
+            ),
+            {"table": table},
+        ).scalar()
+        if column_type == "uuid":
+            click.echo(f"{table}: already uuid")
+            continue
+        # every existing id came from uuid4, the cast keeps them as they are
+        db.session.execute(
+            text(f"ALTER TABLE {table} ALTER COLUMN id TYPE uuid USING id::uuid")
+        )
+        db.session.commit()
+        click.echo(f"{table}: id converted to uuid")
+
+
+def register_commands(app):
+    app.cli.add_command(geoip_cli)
+    app.cli.add_command(short_codes_cli)
+    app.cli.add_command(bots_cli)
+    app.cli.add_command(clicks_cli)
+    app.cli.add_command(user_counters_cli)
+    app.cli.add_command(links_cli)
+    app.cli.add_command(ids_cli)
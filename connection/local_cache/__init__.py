@@ -0,0 +1,169 @@
+import json
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+from logger import logger
+
+load_dotenv()
+
+L1_CACHE_ENABLED = os.environ.get("L1_CACHE_ENABLED", "true").lower() == "true"
+# entries kept per worker, least recently used ones go first
+L1_CACHE_SIZE = int(os.environ.get("L1_CACHE_SIZE", 10000))
+# seconds a value is served from the worker, per key namespace (the part of
+# the key before the first ":"), namespaces not listed always go to redis
+L1_CACHE_TTLS = {
+    "redirect": 30,
+    "qrcode_categories": 300,
+    "categories": 300,
+    "blog": 120,
+    "all_blogs": 60,
+    "cat_blogs": 60,
+    "user_load_gift_link": 30,
+    "short_urls": 10,
+    "short_url": 10,
+    "qrcodes": 10,
+    "qrcode": 10,
+    **json.loads(os.environ.get("L1_CACHE_TTLS", "{}")),
+}
+
+CHANNEL = "cache:invalidate"
+
+
+class LocalCache:
+    """Bounded TTL/LRU cache of redis values inside one worker.
+
+    Values are only served while the worker follows the invalidation
+    channel, a write or delete anywhere evicts the key in every worker.
+    """
+
+    def __init__(self, redis, size=L1_CACHE_SIZE, ttls=None):
+        # the RedisConnection, its client is looked up on every use
+        self.redis = redis
+        self.size = size
+        self.ttls = L1_CACHE_TTLS if ttls is None else ttls
+        self.sender = f"{socket.gethostname()}-{os.getpid()}"
+        self._entries = OrderedDict()
+        # generation of the last eviction of recently evicted keys, a fill
+        # started before an eviction of its key is dropped; keys pushed out
+        # of it share _floor, the generation of the last one pushed out
+        self._evicted = OrderedDict()
+        self._generation = 0
+        self._floor = 0
+        self._lock = threading.Lock()
+        self._live = False
+        self._pid = None
+
+    def ttl(self, key):
+        return self.ttls.get(key.split(":", 1)[0]) if L1_CACHE_ENABLED else None
+
+    def get(self, key):
+        self._ensure_listener()
+        if not self._live:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def generation(self, key):
+        """Token to pass to put when filling key from a value read after it."""
+        with self._lock:
+            return self._evicted.get(key, self._floor)
+
+    def put(self, key, value, expire=None, generation=None):
+        ttl = self.ttl(key)
+        if not ttl or value is None or not self._live:
+            return
+        if expire:
+            ttl = min(ttl, int(expire))
+        with self._lock:
+            if (
+                generation is not None
+                and self._evicted.get(key, self._floor) != generation
+            ):
+                # evicted since the value was read, it may be stale
+                return
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def evict(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+                self._generation += 1
+                self._evicted[key] = self._generation
+                self._evicted.move_to_end(key)
+            while len(self._evicted) > self.size:
+                self._floor = self._evicted.popitem(last=False)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._evicted.clear()
+            self._generation += 1
+            self._floor = self._generation
+
+    def broadcast(self, *keys):
+        """Evict keys here and tell the other workers to do the same."""
+        keys = [key for key in keys if self.ttl(key)]
+        if not keys:
+            return
+        self.evict(*keys)
+        try:
+            pipe = self.redis.get_connection().pipeline()
+            for key in keys:
+                pipe.publish(CHANNEL, f"{self.sender}|{key}")
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"{e}: error@local_cache/broadcast")
+
+    def _ensure_listener(self):
+        # started lazily so that every forked worker gets its own thread
+        if self._pid == os.getpid() or not L1_CACHE_ENABLED:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.sender = f"{socket.gethostname()}-{self._pid}"
+            self._entries.clear()
+            self._live = False
+        threading.Thread(target=self._listen, name="l1-cache", daemon=True).start()
+
+    def _listen(self):
+        while True:
+            pubsub = None
+            try:
+                pubsub = self.redis.get_connection().pubsub(
+                    ignore_subscribe_messages=True
+                )
+                pubsub.subscribe(CHANNEL)
+                self._live = True
+                for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    sender, _, key = message["data"].partition("|")
+                    if sender != self.sender:
+                        self.evict(key)
+            except Exception as e:
+                logger.error(f"{e}: error@local_cache/_listen")
+            finally:
+                # an eviction may have been missed, nothing local is trusted
+                self._live = False
+                self.clear()
+                if pubsub is not None:
+                    pubsub.close()
+            time.sleep(5)
@@ -2,6 +2,7 @@ import redis
 import os
 from dotenv import load_dotenv
 
+from connection.local_cache import LocalCache
 from logger import logger
 
 load_dotenv()
@@ -13,6 +14,8 @@ class RedisConnection:
             self.connection = redis.Redis.from_url(url, decode_responses=True)
         except Exception as e:
             logger.exception(e)
+        # in-process copy of the hot namespaces, see connection.local_cache
+        self.local = LocalCache(self)
 
     def get_connection(self):
         return self.connection
@@ -21,13 +24,25 @@ class RedisConnection:
         self.connection.close()
 
     def set(self, key, value, expire=os.environ.get("REDIS_EXPIRE_TIME")):
-        return self.connection.set(key, value, ex=expire)
+        result = self.connection.set(key, value, ex=expire)
+        self.local.broadcast(key)
+        self.local.put(key, value, expire)
+        return result
 
     def get(self, key):
-        return self.connection.get(key)
-
-    def delete(self, key):
-        return self.connection.delete(key)
+        value = self.local.get(key)
+        if value is None:
+            generation = self.local.generation(key)
+            value = self.connection.get(key)
+            self.local.put(key, value, generation=generation)
+        return value
+
+    def delete(self, *keys):
+        if not keys:
+            return 0
+        result = self.connection.delete(*keys)
+        self.local.broadcast(*keys)
+        return result
 
     def pipeline(self):
         return self.connection.pipeline()
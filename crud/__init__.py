@@ -7,3 +7,15 @@ from .payment import *
 from .biolink import *
 from .admin import *
 from .giftlink import *
+from .short_code import *
+from .resolver import *
+from .click_ingest import *
+from .click_rollup import *
+from .user_counters import *
+from .top_links import *
+from .timeseries import *
+from .click_export import *
+from .click_partitions import *
+from .click_dimensions import *
+from .link_title import *
+from .bulk_links import *
@@ -1,7 +1,7 @@
 from models.bio_link import BioLink
 from extensions import db
 from datetime import datetime, timedelta
-from sqlalchemy import extract
+from func import month_bounds
 
 # save bio link
 # def save_bio_link(bio_link):
@@ -12,10 +12,9 @@ from sqlalchemy import extract
 
 def get_current_bio_link_count(current_user):
     """Return the current count of BioLink records."""
-    now = datetime.utcnow()
+    start, end = month_bounds(datetime.utcnow())
     return (
         BioLink.query.filter_by(user=current_user)
-        .filter(extract("year", BioLink.created) == now.year)
-        .filter(extract("month", BioLink.created) == now.month)
+        .filter(BioLink.created >= start, BioLink.created < end)
         .count()
     )
@@ -0,0 +1,260 @@
+import csv
+import io
+import json
+import os
+
+from dotenv import load_dotenv
+from sqlalchemy import insert
+
+import code_allocator
+import url_canonical
+from connection.redis_connection import redis_conn
+from extensions import db
+from func import hex_id, url_hash
+from link_cache import invalidate_link
+from models.qrcode import QRCodeData
+from models.short_code import ShortCode
+from models.shorten_url import Urlshort
+from page_title import TITLE_MAX_LENGTH, placeholder_title, queue_title_fetch
+from .short_code import register_short_codes
+from .short_url import validate_url
+from .user_counters import add_user_counter
+
+load_dotenv()
+
+# urls accepted by one bulk request
+BULK_MAX_URLS = int(os.environ.get("BULK_MAX_URLS", 1000))
+# links inserted and committed together, progress moves chunk by chunk
+BULK_CHUNK_SIZE = int(os.environ.get("BULK_CHUNK_SIZE", 500))
+# how long the status (and the created links) of a job are kept around
+BULK_JOB_TTL = int(os.environ.get("BULK_JOB_TTL", 86400))
+# invalid rows reported back, the rest are only counted
+BULK_MAX_ERRORS = 100
+
+
+def parse_bulk_json(items):
+    """Rows of a json array of urls or of {"url": ..., "title": ...} objects."""
+    if not isinstance(items, list):
+        return None
+    rows = []
+    for item in items:
+        if isinstance(item, dict):
+            rows.append({"url": item.get("url"), "title": item.get("title")})
+        else:
+            rows.append({"url": item, "title": None})
+    return rows
+
+
+def parse_bulk_csv(stream):
+    """Rows of an uploaded csv, url first and an optional title second.
+
+    A header row is skipped when its first cell is "url".
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    rows = []
+    for index, record in enumerate(csv.reader(text)):
+        if not record or not any(cell.strip() for cell in record):
+            continue
+        if index == 0 and record[0].strip().lower() == "url":
+            continue
+        rows.append({"url": record[0], "title": record[1] if len(record) > 1 else None})
+        if len(rows) > BULK_MAX_URLS:
+            # enough to reject the upload without reading the rest
+            break
+    return rows
+
+
+def validate_bulk_rows(rows):
+    """Split rows into the valid ones and errors, in a single pass."""
+    valid, errors = [], []
+    for index, row in enumerate(rows):
+        url = row["url"].strip() if isinstance(row["url"], str) else ""
+        if not url or not validate_url(url):
+            if len(errors) < BULK_MAX_ERRORS:
+                errors.append({"index": index, "url": row["url"]})
+            continue
+        title = row["title"].strip() if isinstance(row["title"], str) else ""
+        valid.append(
+            {
+                "url": url_canonical.canonicalize(url),
+                "title": title[:TITLE_MAX_LENGTH] or None,
+            }
+        )
+    return valid, errors
+
+
+def _job_key(job_id):
+    return f"bulk_links:{job_id}"
+
+
+def set_bulk_job(job_id, **fields):
+    pipe = redis_conn.pipeline()
+    pipe.hset(_job_key(job_id), mapping=fields)
+    pipe.expire(_job_key(job_id), BULK_JOB_TTL)
+    pipe.execute()
+
+
+def get_bulk_job(job_id, user_id):
+    """Status of a bulk job, None if it does not exist or is not the user's."""
+    job = redis_conn.get_connection().hgetall(_job_key(job_id))
+    if not job or job.get("user_id") != user_id:
+        return None
+    return job
+
+
+def _reserved_key(user_id):
+    return f"bulk_links:reserved:{user_id}"
+
+
+def reserved_short_links(user_id):
+    """Short links held by the user's queued or running bulk jobs."""
+    reserved = redis_conn.get_connection().get(_reserved_key(user_id))
+    return max(int(reserved or 0), 0)
+
+
+def reserve_short_links(user_id, count, allowance):
+    """Hold count short links of allowance for a bulk job, False if they don't fit.
+
+    allowance is what the plan leaves after the links already created, the
+    increment makes two jobs enqueued together unable to both take the rest.
+    """
+    pipe = redis_conn.pipeline()
+    pipe.incrby(_reserved_key(user_id), count)
+    pipe.expire(_reserved_key(user_id), BULK_JOB_TTL)
+    reserved, _ = pipe.execute()
+    if reserved > allowance:
+        release_short_links(user_id, count)
+        return False
+    return True
+
+
+def release_short_links(user_id, count):
+    if not count:
+        return
+    conn = redis_conn.get_connection()
+    if conn.decrby(_reserved_key(user_id), count) < 0:
+        # the key expired under a long job, nothing is held anymore
+        conn.delete(_reserved_key(user_id))
+
+
+def _insert_chunk(user_id, rows, want_qr_code):
+    codes = code_allocator.allocate_many(len(rows), url_short=True)
+    placeholder = placeholder_title()
+    links = [
+        {
+            "id": hex_id(),
+            "url": row["url"],
+            "url_hash": url_hash(row["url"]),
+            "short_url": code,
+            "title": row["title"] or placeholder,
+            "want_qr_code": want_qr_code,
+            "user_id": user_id,
+        }
+        for row, code in zip(rows, codes)
+    ]
+    db.session.execute(insert(Urlshort), links)
+    register_short_codes(
+        [
+            (link["short_url"], ShortCode.SHORT_URL, link["id"], link["url"])
+            for link in links
+        ]
+    )
+    if want_qr_code:
+        # same rows save_want_qr_code adds for a single link
+        db.session.execute(
+            insert(QRCodeData),
+            [
+                {
+                    "id": hex_id(),
+                    "url": link["url"],
+                    "url_hash": link["url_hash"],
+                    "short_url": link["short_url"],
+                    "short_url_id": link["id"],
+                    "category": "url",
+                    "user_id": user_id,
+                    "title": link["title"][:150],
+                }
+                for link in links
+            ],
+        )
+    add_user_counter(
+        user_id, short_links=len(links), qr_codes=len(links) if want_qr_code else 0
+    )
+    db.session.commit()
+    invalidate_link(*codes)
+    for row, link in zip(rows, links):
+        if not row["title"]:
+            queue_title_fetch("short_url", link["id"], link["url"], placeholder)
+    return links
+
+
+def _existing_links(user_id, hashes):
+    # {url_hash: short code} of the user's links among hashes, one probe
+    if not hashes:
+        return {}
+    rows = db.session.query(Urlshort.url_hash, Urlshort.short_url).filter(
+        Urlshort.user_id == user_id, Urlshort.url_hash.in_(hashes)
+    )
+    return {digest: short_url for digest, short_url in rows}
+
+
+def create_short_urls(job_id, user_id, rows, want_qr_code=False):
+    """Create the short urls of a bulk job BULK_CHUNK_SIZE at a time.
+
+    A url the user already shortened, or that came earlier in the batch, is
+    skipped and reported in the job's duplicates with the code of its link.
+    Every chunk commits on its own and the links created so far are written
+    to the job after each one, a job failing half way still reports them.
+    The quota reserved for the rows is given back as each chunk is done and
+    in full for the rows left when the job fails.
+    Returns the created links as {"id", "url", "short_link"} dicts.
+    """
+    created, duplicates = [], []
+    # url_hash -> short code of the links created by this job
+    codes = {}
+    released = 0
+    try:
+        for start in range(0, len(rows), BULK_CHUNK_SIZE):
+            chunk = rows[start : start + BULK_CHUNK_SIZE]
+            hashes = [url_hash(row["url"]) for row in chunk]
+            existing = _existing_links(user_id, set(hashes) - codes.keys())
+            fresh, repeated = {}, []
+            for row, digest in zip(chunk, hashes):
+                if digest in codes or digest in existing:
+                    short_link = codes.get(digest) or existing[digest]
+                    duplicates.append({"url": row["url"], "short_link": short_link})
+                elif digest in fresh:
+                    repeated.append((row, digest))
+                else:
+                    fresh[digest] = row
+            links = (
+                _insert_chunk(user_id, list(fresh.values()), want_qr_code)
+                if fresh
+                else []
+            )
+            # created links count against the plan now, skipped ones never will
+            release_short_links(user_id, len(chunk))
+            released += len(chunk)
+            for link in links:
+                codes[link["url_hash"]] = link["short_url"]
+                created.append(
+                    {
+                        "id": link["id"],
+                        "url": link["url"],
+                        "short_link": link["short_url"],
+                    }
+                )
+            duplicates.extend(
+                {"url": row["url"], "short_link": codes[digest]}
+                for row, digest in repeated
+            )
+            set_bulk_job(
+                job_id,
+                done=start + len(chunk),
+                links=json.dumps(created),
+                skipped=len(duplicates),
+                duplicates=json.dumps(duplicates),
+            )
+    finally:
+        release_short_links(user_id, len(rows) - released)
+    return created
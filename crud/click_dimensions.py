@@ -0,0 +1,192 @@
+import hashlib
+import os
+import threading
+
+from dotenv import load_dotenv
+from sqlalchemy import bindparam, select, tuple_
+
+from extensions import db
+from geoip import UNKNOWN
+from logger import logger
+from models.click_dimension import ClickDimension
+from models.click_rollup import ClickRollup
+from .upsert import dialect_insert
+
+load_dotenv()
+
+# key of the ip hash, changing it makes old and new hashes of an ip differ;
+# without it no ip hash is stored, an unkeyed hash of an ip is reversible
+IP_HASH_KEY = os.environ.get("IP_HASH_KEY", "").encode("utf-8")[:64]
+if not IP_HASH_KEY:
+    logger.warning("IP_HASH_KEY is not set, click ip hashes are not stored")
+
+# click location column holding the id of each dimension
+DIMENSION_COLUMNS = {
+    dimension: f"{dimension}_id" for dimension in ClickRollup.DIMENSIONS
+}
+
+# the dictionary only grows and ids never change, both maps are safe to keep
+# for the life of the process
+_ids = {}
+_names = {}
+_lock = threading.Lock()
+
+
+def hash_ip(ip_address):
+    """16 byte keyed blake2b of an ip, enough to tell visitors apart.
+
+    None without an ip or without IP_HASH_KEY.
+    """
+    if not ip_address or not IP_HASH_KEY:
+        return None
+    return hashlib.blake2b(
+        ip_address.strip().encode("utf-8"), digest_size=16, key=IP_HASH_KEY
+    ).digest()
+
+
+def _remember(rows):
+    with _lock:
+        for dimension_id, dimension, value in rows:
+            _ids[(dimension, value)] = dimension_id
+            _names[dimension_id] = value
+
+
+def dimension_ids(pairs):
+    """{(dimension, value): id} for the pairs, unknown values get an id first.
+
+    Empty values have no id, they read back as UNKNOWN.
+    """
+    pairs = {(dimension, value[:250]) for dimension, value in pairs if value}
+    missing = [pair for pair in pairs if pair not in _ids]
+    if missing:
+        # committed on its own connection, an id is never cached for a value
+        # whose insert is rolled back with the caller's transaction
+        with db.engine.begin() as connection:
+            stmt = dialect_insert(ClickDimension).values(
+                [
+                    {"dimension": dimension, "value": value}
+                    for dimension, value in missing
+                ]
+            )
+            connection.execute(
+                stmt.on_conflict_do_nothing(index_elements=["dimension", "value"])
+            )
+            _remember(
+                connection.execute(
+                    select(
+                        ClickDimension.id,
+                        ClickDimension.dimension,
+                        ClickDimension.value,
+                    ).where(
+                        tuple_(ClickDimension.dimension, ClickDimension.value).in_(
+                            missing
+                        )
+                    )
+                )
+            )
+    return {pair: _ids[pair] for pair in pairs}
+
+
+def dimension_names(ids):
+    """{id: value} for the given dimension ids."""
+    ids = {dimension_id for dimension_id in ids if dimension_id is not None}
+    missing = [dimension_id for dimension_id in ids if dimension_id not in _names]
+    if missing:
+        _remember(
+            db.session.execute(
+                select(
+                    ClickDimension.id, ClickDimension.dimension, ClickDimension.value
+                ).where(ClickDimension.id.in_(missing))
+            )
+        )
+    return {dimension_id: _names.get(dimension_id, UNKNOWN) for dimension_id in ids}
+
+
+def encode_click_locations(rows):
+    """Swap the text dimensions and ip of click location rows for ids and a hash.
+
+    rows are dicts with country, city, device, browser and ip_address keys,
+    the result only holds the encoded columns plus the other keys as given.
+    """
+    ids = dimension_ids(
+        (dimension, row.get(dimension))
+        for row in rows
+        for dimension in ClickRollup.DIMENSIONS
+    )
+    encoded = []
+    for row in rows:
+        row = dict(row)
+        for dimension, column in DIMENSION_COLUMNS.items():
+            value = (row.pop(dimension, None) or "")[:250]
+            row[column] = ids.get((dimension, value))
+        row["ip_hash"] = hash_ip(row.pop("ip_address", None))
+        encoded.append(row)
+    return encoded
+
+
+def decode_click_dimensions(location):
+    """{dimension: name} of a click location row, legacy text columns included."""
+    names = dimension_names(
+        getattr(location, column) for column in DIMENSION_COLUMNS.values()
+    )
+    return {
+        dimension: names.get(getattr(location, column))
+        or getattr(location, dimension)
+        or UNKNOWN
+        for dimension, column in DIMENSION_COLUMNS.items()
+    }
+
+
+def encode_legacy_click_locations(location_model, batch_size=1000):
+    """Encode the click rows written before the dimension dictionary.
+
+    Rows still holding text dimensions get their ids and ip hash, then the
+    text columns are emptied. Batches commit on their own so the command can
+    be stopped and run again. Returns the number of rows encoded.
+    """
+    table = location_model.__table__
+    legacy = (
+        table.c.country.isnot(None)
+        | table.c.city.isnot(None)
+        | table.c.device.isnot(None)
+        | table.c.browser.isnot(None)
+        | table.c.ip_address.isnot(None)
+    )
+    encoded = 0
+    while True:
+        rows = (
+            db.session.execute(
+                select(
+                    table.c.id,
+                    table.c.ip_address,
+                    *[table.c[dimension] for dimension in ClickRollup.DIMENSIONS],
+                )
+                .where(legacy)
+                .limit(batch_size)
+            )
+            .mappings()
+            .all()
+        )
+        if not rows:
+            return encoded
+        db.session.execute(
+            table.update()
+            .where(table.c.id == bindparam("b_id"))
+            .values(
+                ip_address=None,
+                country=None,
+                city=None,
+                device=None,
+                browser=None,
+                **{
+                    column: bindparam(f"b_{column}")
+                    for column in ("ip_hash", *DIMENSION_COLUMNS.values())
+                },
+            ),
+            [
+                {f"b_{key}": value for key, value in row.items()}
+                for row in encode_click_locations([dict(row) for row in rows])
+            ],
+        )
+        db.session.commit()
+        encoded += len(rows)
@@ -0,0 +1,176 @@
+import csv
+import datetime
+import gzip
+import io
+import json
+import os
+import time
+
+from dotenv import load_dotenv
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased
+
+from connection.redis_connection import redis_conn
+from extensions import db
+from models.click_dimension import ClickDimension
+from models.qrcode import QRCodeData, QrCodeClickLocation
+from models.short_code import ShortCode
+from models.shorten_url import Urlshort, ShortUrlClickLocation
+from .click_dimensions import DIMENSION_COLUMNS
+
+load_dotenv()
+
+EXPORT_FORMATS = ("csv", "ndjson")
+EXPORT_COLUMNS = (
+    "link_id",
+    "short_url",
+    "created",
+    "ip_hash",
+    "country",
+    "city",
+    "device",
+    "browser",
+)
+# rows fetched per round trip of the server side cursor
+EXPORT_BATCH_SIZE = int(os.environ.get("CLICK_EXPORT_BATCH_SIZE", 2000))
+EXPORT_DIR = os.path.abspath(os.environ.get("CLICK_EXPORT_DIR", "exports"))
+# how long a finished export job (and its status) is kept around
+EXPORT_JOB_TTL = int(os.environ.get("CLICK_EXPORT_JOB_TTL", 86400))
+
+EXPORT_SOURCES = {
+    ShortCode.SHORT_URL: (
+        Urlshort,
+        ShortUrlClickLocation,
+        ShortUrlClickLocation.url_id,
+    ),
+    ShortCode.QRCODE: (QRCodeData, QrCodeClickLocation, QrCodeClickLocation.qr_code_id),
+}
+
+
+def iter_click_rows(target_type, user_id, start=None, end=None, link_id=None):
+    """Yield the raw clicks of a user's links as tuples of EXPORT_COLUMNS.
+
+    Rows come through a server side cursor EXPORT_BATCH_SIZE at a time,
+    nothing is loaded as ORM objects and memory does not grow with the export.
+    start and end are dates, both included.
+    """
+    link_model, location_model, target_column = EXPORT_SOURCES[target_type]
+    # names are decoded in the query, legacy rows still carry the text
+    names = {dimension: aliased(ClickDimension) for dimension in DIMENSION_COLUMNS}
+    stmt = select(
+        target_column,
+        link_model.short_url,
+        location_model.created,
+        location_model.ip_hash,
+        *[
+            func.coalesce(names[dimension].value, getattr(location_model, dimension))
+            for dimension in DIMENSION_COLUMNS
+        ],
+    ).join(link_model, link_model.id == target_column)
+    for dimension, column in DIMENSION_COLUMNS.items():
+        stmt = stmt.outerjoin(
+            names[dimension],
+            names[dimension].id == getattr(location_model, column),
+        )
+    stmt = (
+        stmt.where(
+            link_model.user_id == user_id,
+            link_model.id == link_id if link_id else True,
+        )
+        .order_by(target_column, location_model.created)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    if start:
+        stmt = stmt.where(
+            location_model.created >= datetime.datetime.combine(start, datetime.time())
+        )
+    if end:
+        stmt = stmt.where(
+            location_model.created
+            < datetime.datetime.combine(end, datetime.time())
+            + datetime.timedelta(days=1)
+        )
+
+    result = db.session.execute(stmt)
+    try:
+        for partition in result.partitions():
+            yield from partition
+    finally:
+        result.close()
+
+
+def _value(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.hex()
+    return value
+
+
+def format_click_rows(rows, fmt):
+    """Turn rows into text chunks of csv (with a header) or ndjson."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == "csv" else None
+    if writer:
+        writer.writerow(EXPORT_COLUMNS)
+
+    for count, row in enumerate(rows, 1):
+        if writer:
+            writer.writerow([_value(value) for value in row])
+        else:
+            record = dict(zip(EXPORT_COLUMNS, map(_value, row)))
+            buffer.write(json.dumps(record, separators=(",", ":")) + "\n")
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def write_click_export(path, chunks):
+    """Write the chunks to a gzip file, returns the number of bytes written."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8", newline="") as fh:
+        for chunk in chunks:
+            fh.write(chunk)
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+def _job_key(job_id):
+    return f"click_export:{job_id}"
+
+
+def export_path(job_id, fmt):
+    return os.path.join(EXPORT_DIR, f"{job_id}.{fmt}.gz")
+
+
+def set_export_job(job_id, **fields):
+    pipe = redis_conn.pipeline()
+    pipe.hset(_job_key(job_id), mapping=fields)
+    pipe.expire(_job_key(job_id), EXPORT_JOB_TTL)
+    pipe.execute()
+
+
+def get_export_job(job_id, user_id):
+    """Status of an export job, None if it does not exist or is not the user's."""
+    job = redis_conn.get_connection().hgetall(_job_key(job_id))
+    if not job or job.get("user_id") != user_id:
+        return None
+    return job
+
+
+def prune_exports():
+    """Remove export files older than EXPORT_JOB_TTL."""
+    if not os.path.isdir(EXPORT_DIR):
+        return 0
+    cutoff = time.time() - EXPORT_JOB_TTL
+    removed = 0
+    for name in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, name)
+        if os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+            os.remove(path)
+            removed += 1
+    return removed
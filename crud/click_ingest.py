@@ -0,0 +1,277 @@
+import datetime
+from collections import Counter
+
+from sqlalchemy import bindparam, func, insert, update
+
+from extensions import db
+from func import day_start, hex_id, uuid7
+from geoip import UNKNOWN
+from unique_visitors import add_visitors, link_scope, user_scope
+from models.click_rollup import ClickRollup
+from models.qrcode import QRCodeData, QrcodeRecord, QrCodeClickLocation
+from models.short_code import ShortCode
+from models.shorten_url import Urlshort, UrlShortenerClicks, ShortUrlClickLocation
+from .click_dimensions import encode_click_locations
+from .upsert import dialect_insert
+from .user_counters import add_user_counters
+
+
+def _event_time(event):
+    return datetime.datetime.fromtimestamp(event["ts"], datetime.timezone.utc).replace(
+        tzinfo=None
+    )
+
+
+def _location_row(event, created):
+    return {
+        "ip_address": event.get("ip_address"),
+        "country": event.get("country"),
+        "city": event.get("city"),
+        "device": event.get("device"),
+        "browser": event.get("browser_name"),
+        "created": created,
+    }
+
+
+def upsert_daily_clicks(model, target_column, count_column, date_column, daily):
+    """Add {(target_id, day): clicks} to the daily click table atomically.
+
+    One INSERT ... ON CONFLICT (target, day) DO UPDATE SET n = n + excluded.n,
+    concurrent writers can neither lose increments nor create a second row
+    for the same day.
+    """
+    if not daily:
+        return
+    rows = [
+        {
+            "id": uuid7(),
+            target_column.key: target_id,
+            count_column.key: clicks,
+            date_column.key: day_start(day),
+        }
+        for (target_id, day), clicks in daily.items()
+    ]
+    stmt = dialect_insert(model).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[target_column.key, date_column.key],
+        set_={
+            count_column.key: getattr(model.__table__.c, count_column.key)
+            + getattr(stmt.excluded, count_column.key)
+        },
+    )
+    db.session.execute(stmt)
+
+
+def increment_link_clicks(model, totals):
+    """UPDATE ... SET clicks = clicks + n for {link_id: n}."""
+    if not totals:
+        return
+    db.session.execute(
+        update(model.__table__)
+        .where(model.__table__.c.id == bindparam("b_id"))
+        .values(clicks=func.coalesce(model.clicks, 0) + bindparam("n")),
+        [{"b_id": target_id, "n": clicks} for target_id, clicks in totals.items()],
+    )
+
+
+def count_rollups(rollups, target_type, target_id, created, location):
+    """Add one click to {(type, id, day, dimension, value): clicks}."""
+    day = day_start(created)
+    for dimension in ClickRollup.DIMENSIONS:
+        value = (location.get(dimension) or UNKNOWN)[:250]
+        rollups[(target_type, target_id, day, dimension, value)] += 1
+
+
+def upsert_click_rollups(rollups, chunk_size=1000):
+    """Add the counts built by count_rollups to click_rollups atomically."""
+    rows = [
+        {
+            "id": hex_id(),
+            "target_type": target_type,
+            "target_id": target_id,
+            "day": day,
+            "dimension": dimension,
+            "value": value,
+            "clicks": clicks,
+        }
+        for (target_type, target_id, day, dimension, value), clicks in rollups.items()
+    ]
+    for start in range(0, len(rows), chunk_size):
+        stmt = dialect_insert(ClickRollup).values(rows[start : start + chunk_size])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["target_type", "target_id", "day", "dimension", "value"],
+            set_={"clicks": ClickRollup.__table__.c.clicks + stmt.excluded.clicks},
+        )
+        db.session.execute(stmt)
+
+
+def count_visitors(visitors, kind, target_id, user_id, created, ip_address):
+    """Add a visitor to the per link and per owner HyperLogLogs of the day."""
+    if not ip_address:
+        return
+    day = created.date()
+    visitors.setdefault((link_scope(kind, target_id), day), set()).add(ip_address)
+    if user_id:
+        visitors.setdefault((user_scope(kind, user_id), day), set()).add(ip_address)
+
+
+def ingest_click_events(events):
+    """Write a batch of click events with a handful of bulk statements.
+
+    Clicks are aggregated per link and per day in memory first, the whole
+    batch is committed once.
+    """
+    url_ids = {e["target_id"] for e in events if e.get("kind") == ShortCode.SHORT_URL}
+    qr_ids = {e["target_id"] for e in events if e.get("kind") == ShortCode.QRCODE}
+
+    # links deleted since the click are dropped, short urls with a qr code
+    # also count as a scan of that qr code
+    linked_qr, owners = {}, {}
+    if url_ids:
+        for url_id, qr_id, user_id in (
+            db.session.query(Urlshort.id, QRCodeData.id, Urlshort.user_id)
+            .outerjoin(
+                QRCodeData,
+                (QRCodeData.short_url_id == Urlshort.id) & Urlshort.want_qr_code,
+            )
+            .filter(Urlshort.id.in_(url_ids))
+        ):
+            linked_qr[url_id] = qr_id
+            owners[url_id] = user_id
+            if qr_id:
+                owners[qr_id] = user_id
+    if qr_ids:
+        found = dict(
+            db.session.query(QRCodeData.id, QRCodeData.user_id).filter(
+                QRCodeData.id.in_(qr_ids)
+            )
+        )
+        owners.update(found)
+        qr_ids = set(found)
+
+    url_events = [
+        e
+        for e in events
+        if e.get("kind") == ShortCode.SHORT_URL and e["target_id"] in linked_qr
+    ]
+    qr_events = [
+        e
+        for e in events
+        if e.get("kind") == ShortCode.QRCODE and e["target_id"] in qr_ids
+    ]
+    for event in url_events:
+        qr_id = linked_qr.get(event["target_id"])
+        if qr_id:
+            qr_events.append(dict(event, kind=ShortCode.QRCODE, target_id=qr_id))
+
+    url_locations, qr_locations = [], []
+    url_daily, qr_daily = Counter(), Counter()
+    url_totals, qr_totals = Counter(), Counter()
+    rollups = Counter()
+    visitors = {}
+
+    for event in url_events:
+        created = _event_time(event)
+        location = _location_row(event, created)
+        url_locations.append(dict(location, url_id=event["target_id"]))
+        count_rollups(
+            rollups, ShortCode.SHORT_URL, event["target_id"], created, location
+        )
+        count_visitors(
+            visitors,
+            ShortCode.SHORT_URL,
+            event["target_id"],
+            owners[event["target_id"]],
+            created,
+            event.get("ip_address"),
+        )
+        url_daily[(event["target_id"], created.date())] += 1
+        url_totals[event["target_id"]] += 1
+
+    for event in qr_events:
+        created = _event_time(event)
+        location = _location_row(event, created)
+        qr_locations.append(dict(location, qr_code_id=event["target_id"]))
+        count_rollups(rollups, ShortCode.QRCODE, event["target_id"], created, location)
+        count_visitors(
+            visitors,
+            ShortCode.QRCODE,
+            event["target_id"],
+            owners[event["target_id"]],
+            created,
+            event.get("ip_address"),
+        )
+        qr_daily[(event["target_id"], created.date())] += 1
+        qr_totals[event["target_id"]] += 1
+
+    # one dictionary lookup for the whole batch, the raw rows only keep ids
+    encoded = encode_click_locations(url_locations + qr_locations)
+    if url_locations:
+        db.session.execute(insert(ShortUrlClickLocation), encoded[: len(url_locations)])
+    if qr_locations:
+        db.session.execute(insert(QrCodeClickLocation), encoded[len(url_locations) :])
+
+    upsert_daily_clicks(
+        UrlShortenerClicks,
+        UrlShortenerClicks.url_id,
+        UrlShortenerClicks.count,
+        UrlShortenerClicks.created,
+        url_daily,
+    )
+    upsert_daily_clicks(
+        QrcodeRecord,
+        QrcodeRecord.qr_code_id,
+        QrcodeRecord.clicks,
+        QrcodeRecord.date,
+        qr_daily,
+    )
+    increment_link_clicks(Urlshort, url_totals)
+    increment_link_clicks(QRCodeData, qr_totals)
+
+    user_clicks = {}
+    for field, totals in (
+        ("short_url_clicks", url_totals),
+        ("qr_code_clicks", qr_totals),
+    ):
+        for target_id, clicks in totals.items():
+            user_clicks.setdefault(owners[target_id], Counter())[field] += clicks
+    add_user_counters(user_clicks)
+    upsert_click_rollups(rollups)
+
+    db.session.commit()
+    # PFADD is idempotent, a batch retried after a failed ack adds nothing
+    add_visitors(visitors)
+    return len(url_events) + len(qr_events)
+
+
+def normalize_daily_clicks(model, target_column, count_column, date_column):
+    """Merge daily rows written before the (target, day) key into one row per day.
+
+    Returns the number of rows removed.
+    """
+    groups = {}
+    query = db.session.query(model).order_by(target_column, date_column)
+    for row in query.yield_per(1000):
+        key = (getattr(row, target_column.key), getattr(row, date_column.key).date())
+        groups.setdefault(key, []).append(row)
+
+    removed = 0
+    for (_, day), rows in groups.items():
+        midnight = day_start(day)
+        if len(rows) == 1 and getattr(rows[0], date_column.key) == midnight:
+            continue
+        keep = next(
+            (row for row in rows if getattr(row, date_column.key) == midnight),
+            rows[0],
+        )
+        total = sum(getattr(row, count_column.key) or 0 for row in rows)
+        for row in rows:
+            if row is not keep:
+                db.session.delete(row)
+                removed += 1
+        db.session.flush()
+        setattr(keep, count_column.key, total)
+        setattr(keep, date_column.key, midnight)
+        db.session.flush()
+    db.session.commit()
+    return removed
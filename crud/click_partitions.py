@@ -0,0 +1,263 @@
+import datetime
+import gzip
+import os
+import re
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+from extensions import db
+from logger import logger
+from .click_rollup import mark_retention_applied, rollups_ready
+
+load_dotenv()
+
+# raw click tables range-partitioned by month on created (postgres only)
+PARTITIONED_TABLES = ("short_url_click_location", "qr_code_click_location")
+# monthly partitions created ahead of time by the beat job
+CLICK_PARTITIONS_AHEAD = int(os.environ.get("CLICK_PARTITIONS_AHEAD", 3))
+# months of raw clicks kept, 0 keeps everything
+CLICK_RETENTION_MONTHS = int(os.environ.get("CLICK_RETENTION_MONTHS", 0))
+# "archive" copies a partition to CLICK_ARCHIVE_DIR before dropping it,
+# "drop" only drops it
+CLICK_RETENTION_MODE = os.environ.get("CLICK_RETENTION_MODE", "archive")
+CLICK_ARCHIVE_DIR = os.path.abspath(
+    os.environ.get("CLICK_ARCHIVE_DIR", "archives/clicks")
+)
+
+_UPPER_BOUND = re.compile(r"TO \('([^']+)'\)")
+
+
+def _month_start(dt, months=0):
+    month = dt.year * 12 + dt.month - 1 + months
+    return datetime.datetime(month // 12, month % 12 + 1, 1)
+
+
+def _is_postgres():
+    return db.session.get_bind().dialect.name == "postgresql"
+
+
+def is_partitioned(table):
+    return bool(
+        db.session.execute(
+            text(
+                "SELECT 1 FROM pg_partitioned_table "
+                "WHERE partrelid = to_regclass(:table)"
+            ),
+            {"table": table},
+        ).scalar()
+    )
+
+
+def partition_click_table(table, now=None):
+    """Turn table into a table partitioned by month on created.
+
+    The existing table is renamed to <table>_legacy and attached as the
+    partition of everything before the start of next month (of the month
+    after when run on the last day), the monthly partitions start there so
+    no row is moved. Rows without created get the oldest created of the
+    table first, no range partition accepts them.
+
+    A CHECK (created < bound) constraint is validated before anything is
+    locked, it lets the attach skip its scan of the rows. The primary key
+    becomes (id, created) as postgres requires the partition key in every
+    unique index, the attach builds that index on the old rows, the one
+    scan done while the table is locked.
+    """
+    if is_partitioned(table):
+        return False
+    now = now or datetime.datetime.utcnow()
+    # a day of margin, the bound must not pass while the command runs
+    bound = _month_start(now + datetime.timedelta(days=1), 1)
+    legacy = f"{table}_legacy"
+    check = f"{table}_created_bound"
+    params = {"table": table}
+
+    fixed = db.session.execute(
+        text(
+            f"UPDATE {table} SET created = "
+            f"(SELECT coalesce(min(created), now()) FROM {table}) "
+            f"WHERE created IS NULL"
+        )
+    ).rowcount
+    if fixed:
+        logger.info(f"{table}: {fixed} rows without created dated back")
+    db.session.execute(
+        text(
+            f"ALTER TABLE {table} ADD CONSTRAINT {check} "
+            f"CHECK (created IS NOT NULL AND created < '{bound:%Y-%m-%d}') NOT VALID"
+        )
+    )
+    db.session.commit()
+    # validating only takes a lock that lets the clicks come in meanwhile
+    db.session.execute(text(f"ALTER TABLE {table} VALIDATE CONSTRAINT {check}"))
+    db.session.commit()
+
+    pkey = db.session.execute(
+        text(
+            "SELECT conname FROM pg_constraint "
+            "WHERE conrelid = to_regclass(:table) AND contype = 'p'"
+        ),
+        params,
+    ).scalar()
+    indexes = db.session.execute(
+        text(
+            "SELECT indexname, indexdef FROM pg_indexes "
+            "WHERE tablename = :table AND indexname <> :pkey"
+        ),
+        dict(params, pkey=pkey or ""),
+    ).all()
+    foreign_keys = db.session.execute(
+        text(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = to_regclass(:table) AND contype = 'f'"
+        ),
+        params,
+    ).all()
+
+    # index names are unique per schema, the legacy ones step aside so the
+    # parent can take them over, attaching matches them back by definition
+    db.session.execute(text(f"ALTER TABLE {table} RENAME TO {legacy}"))
+    if pkey:
+        db.session.execute(
+            text(f"ALTER TABLE {legacy} RENAME CONSTRAINT {pkey} TO {legacy}_pkey")
+        )
+    for name, _ in indexes:
+        db.session.execute(text(f"ALTER INDEX {name} RENAME TO {name}_legacy"))
+    # the validated check proves it, setting it scans nothing
+    db.session.execute(text(f"ALTER TABLE {legacy} ALTER COLUMN created SET NOT NULL"))
+
+    db.session.execute(
+        text(
+            f"CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS) "
+            f"PARTITION BY RANGE (created)"
+        )
+    )
+    db.session.execute(
+        text(
+            f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id, created)"
+        )
+    )
+    for _, definition in indexes:
+        db.session.execute(text(definition))
+    for name, definition in foreign_keys:
+        db.session.execute(
+            text(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+        )
+    db.session.execute(
+        text(
+            f"ALTER TABLE {table} ATTACH PARTITION {legacy} "
+            f"FOR VALUES FROM (MINVALUE) TO ('{bound:%Y-%m-%d}')"
+        )
+    )
+    # rows that miss every monthly partition land here instead of failing
+    db.session.execute(
+        text(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+    )
+    ensure_partitions(table, now)
+    db.session.commit()
+    logger.info(f"{table} partitioned by month from {bound:%Y-%m}")
+    return True
+
+
+def ensure_partitions(table, now=None, ahead=CLICK_PARTITIONS_AHEAD):
+    """Create the monthly partitions of the current month and the next ones.
+
+    Months still covered by the legacy partition are skipped.
+    """
+    now = now or datetime.datetime.utcnow()
+    covered = dict(list_partitions(table)).get(f"{table}_legacy")
+    for offset in range(ahead + 1):
+        start, end = _month_start(now, offset), _month_start(now, offset + 1)
+        if covered and start < covered:
+            continue
+        db.session.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {table}_p{start:%Y%m} "
+                f"PARTITION OF {table} "
+                f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+            )
+        )
+
+
+def list_partitions(table):
+    """[(partition, upper bound or None)] of table, None for the default one."""
+    rows = db.session.execute(
+        text(
+            "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) "
+            "FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = to_regclass(:table)"
+        ),
+        {"table": table},
+    )
+    partitions = []
+    for name, bound in rows:
+        match = _UPPER_BOUND.search(bound or "")
+        upper = datetime.datetime.fromisoformat(match.group(1)) if match else None
+        partitions.append((name, upper))
+    return partitions
+
+
+def archive_partition(partition):
+    """COPY a partition into a gzip csv file, returns its path."""
+    os.makedirs(CLICK_ARCHIVE_DIR, exist_ok=True)
+    path = os.path.join(CLICK_ARCHIVE_DIR, f"{partition}.csv.gz")
+    cursor = db.session.connection().connection.cursor()
+    try:
+        with gzip.open(f"{path}.tmp", "wt", encoding="utf-8") as fh:
+            cursor.copy_expert(
+                f"COPY {partition} TO STDOUT WITH (FORMAT csv, HEADER)", fh
+            )
+    finally:
+        cursor.close()
+    os.replace(f"{path}.tmp", path)
+    return path
+
+
+def apply_retention(table, now=None, months=CLICK_RETENTION_MONTHS):
+    """Detach and drop the partitions entirely older than the retention window.
+
+    The daily click tables and the per day rollups keep counting the dropped
+    range, what only the raw rows had is lost: the hourly timeseries and the
+    top dimensions read from the raw rows (before the rollups are ready)
+    come back empty for it. The end of the dropped range is recorded first
+    so that backfill_click_rollups leaves the rollups before it alone.
+    """
+    if months <= 0:
+        return []
+    cutoff = _month_start(now or datetime.datetime.utcnow(), -months)
+    dropped = []
+    for partition, upper in list_partitions(table):
+        if upper is None or upper > cutoff:
+            continue
+        mark_retention_applied(table, upper)
+        if CLICK_RETENTION_MODE == "archive":
+            path = archive_partition(partition)
+            logger.info(f"{partition} archived to {path}")
+        db.session.execute(text(f"ALTER TABLE {table} DETACH PARTITION {partition}"))
+        db.session.execute(text(f"DROP TABLE {partition}"))
+        db.session.commit()
+        dropped.append(partition)
+        logger.info(f"{partition} dropped by the {months} months retention")
+    return dropped
+
+
+def maintain_click_partitions(now=None, retention=True):
+    """Create upcoming partitions and apply retention on every click table.
+
+    Does nothing on databases other than postgres or on tables that have
+    not been partitioned yet (flask clicks partition). Raw rows are only
+    dropped once the rollups have been backfilled from them.
+    """
+    if not _is_postgres():
+        return {}
+    retention = retention and rollups_ready()
+    report = {}
+    for table in PARTITIONED_TABLES:
+        if not is_partitioned(table):
+            continue
+        ensure_partitions(table, now)
+        db.session.commit()
+        report[table] = apply_retention(table, now) if retention else []
+    return report
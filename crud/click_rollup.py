@@ -0,0 +1,347 @@
+import datetime
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from sqlalchemy import func, literal, literal_column, select, tuple_, union_all
+
+from connection.redis_connection import redis_conn
+from extensions import db
+from func import day_start
+from geoip import UNKNOWN
+from logger import logger
+from models.click_rollup import ClickRollup
+from models.qrcode import QRCodeData, QrCodeClickLocation
+from models.short_code import ShortCode
+from models.shorten_url import Urlshort, ShortUrlClickLocation
+from .click_dimensions import DIMENSION_COLUMNS, dimension_names
+from .click_ingest import upsert_click_rollups
+
+# response key for each dimension
+DIMENSION_KEYS = {
+    ClickRollup.COUNTRY: "top_countries",
+    ClickRollup.CITY: "top_cities",
+    ClickRollup.DEVICE: "top_devices",
+    ClickRollup.BROWSER: "top_browsers",
+}
+
+# set once the rollups have been rebuilt from the raw rows, until then the
+# analytics read the raw click location rows
+ROLLUPS_READY_KEY = "analytics:rollups_ready"
+_rollups_ready = False
+
+
+def rollups_ready():
+    global _rollups_ready
+    if not _rollups_ready:
+        try:
+            _rollups_ready = bool(redis_conn.get(ROLLUPS_READY_KEY))
+        except Exception as e:
+            logger.error(f"{e}: error@click_rollup/rollups_ready")
+    return _rollups_ready
+
+
+def mark_rollups_ready():
+    redis_conn.get_connection().set(ROLLUPS_READY_KEY, 1)
+
+
+# first instant still stored in a raw click table, set by the retention
+# before it drops partitions; the rollups before it cannot be rebuilt
+RETENTION_KEY = "analytics:retention_applied_before:{table}"
+
+
+def retention_applied_before(table):
+    value = redis_conn.get_connection().get(RETENTION_KEY.format(table=table))
+    return datetime.datetime.fromisoformat(value) if value else None
+
+
+def mark_retention_applied(table, before):
+    """Record that the raw clicks of table before `before` are gone."""
+    current = retention_applied_before(table)
+    if current is None or before > current:
+        redis_conn.get_connection().set(
+            RETENTION_KEY.format(table=table), before.isoformat()
+        )
+
+
+def _reshape(rows):
+    # (dimension, value, count, total) ranked rows -> response format
+    result = {key: [] for key in DIMENSION_KEYS.values()}
+    for dimension, value, count, total in rows:
+        result[DIMENSION_KEYS[dimension]].append(
+            {
+                "name": value,
+                "count": count,
+                "percentage": round((count / total * 100), 2) if total else 0,
+            }
+        )
+    return result
+
+
+def get_top_dimensions(target_type, link_model, user_id, target_id=None, limit=7):
+    """Top values of every dimension for a user's links, read from the rollups.
+
+    A single query ranks the values of each dimension with a window function,
+    the share of each value is taken against that dimension's total.
+    """
+    clicks = func.sum(ClickRollup.clicks)
+    ranked = (
+        db.session.query(
+            ClickRollup.dimension,
+            ClickRollup.value,
+            clicks.label("count"),
+            func.sum(clicks).over(partition_by=ClickRollup.dimension).label("total"),
+            func.row_number()
+            .over(
+                partition_by=ClickRollup.dimension,
+                order_by=(clicks.desc(), ClickRollup.value),
+            )
+            .label("rank"),
+        )
+        .join(link_model, link_model.id == ClickRollup.target_id)
+        .filter(
+            ClickRollup.target_type == target_type,
+            link_model.user_id == user_id,
+            link_model.id == target_id if target_id else True,
+        )
+        .group_by(ClickRollup.dimension, ClickRollup.value)
+        .subquery()
+    )
+    rows = (
+        db.session.query(
+            ranked.c.dimension, ranked.c.value, ranked.c.count, ranked.c.total
+        )
+        .filter(ranked.c.rank <= limit)
+        .order_by(ranked.c.dimension, ranked.c.rank)
+    )
+    return _reshape(rows)
+
+
+def _dimension_key(location_model, dimension):
+    # rows are grouped on the dictionary id, rows written before the
+    # dictionary still carry the text until flask clicks encode-dimensions
+    return (
+        getattr(location_model, DIMENSION_COLUMNS[dimension]),
+        func.nullif(getattr(location_model, dimension), literal_column("''")),
+    )
+
+
+def _decode_ranked(rows, limit):
+    """Names for [(dimension, id, legacy text, count, total)] ranked rows.
+
+    Only the top rows of each dimension are decoded. A value counted both
+    under its id and as legacy text is merged back into one entry.
+    """
+    rows = list(rows)
+    names = dimension_names(row[1] for row in rows)
+    merged, totals = Counter(), {}
+    for dimension, dimension_id, legacy, count, total in rows:
+        name = names.get(dimension_id) or legacy or UNKNOWN
+        merged[(dimension, name)] += count
+        totals[dimension] = total
+    ranked = sorted(merged.items(), key=lambda item: (item[0][0], -item[1], item[0][1]))
+    result, kept = [], Counter()
+    for (dimension, name), count in ranked:
+        kept[dimension] += 1
+        if kept[dimension] <= limit:
+            result.append((dimension, name, count, totals[dimension]))
+    return result
+
+
+def _raw_grouping_sets(location_model, filters, limit):
+    # one scan: GROUP BY GROUPING SETS ((country_id, country), ..., ())
+    keys = [_dimension_key(location_model, d) for d in ClickRollup.DIMENSIONS]
+    grouping = func.grouping(*[dimension_id for dimension_id, _ in keys])
+    clicks = func.count()
+    # ties are broken on the dimension columns, the other dimensions are
+    # null within a grouping set
+    tiebreak = [column for key in keys for column in key]
+    columns = []
+    for (dimension_id, legacy), dimension in zip(keys, ClickRollup.DIMENSIONS):
+        columns += [dimension_id.label(f"{dimension}_id"), legacy.label(dimension)]
+    grouped = (
+        select(
+            grouping.label("grouping"),
+            *columns,
+            clicks.label("count"),
+            func.row_number()
+            .over(partition_by=grouping, order_by=(clicks.desc(), *tiebreak))
+            .label("rank"),
+        )
+        .select_from(location_model)
+        .where(*filters)
+        .group_by(func.grouping_sets(*[tuple_(*key) for key in keys], tuple_()))
+        .subquery()
+    )
+    rows = db.session.execute(
+        select(grouped).where((grouped.c.rank <= limit) | (grouped.c.grouping == 15))
+    ).mappings()
+
+    # grouping() sets a bit for every column left out of the grouping set,
+    # country is the highest bit
+    bits = {
+        15 ^ (1 << (3 - i)): dimension
+        for i, dimension in enumerate(ClickRollup.DIMENSIONS)
+    }
+    total, ranked = 0, []
+    for row in rows:
+        if row["grouping"] == 15:
+            total = row["count"]
+            continue
+        dimension = bits[row["grouping"]]
+        ranked.append((dimension, row[f"{dimension}_id"], row[dimension], row["count"]))
+    return _decode_ranked(
+        [(dimension, *rest, total) for dimension, *rest in ranked], limit
+    )
+
+
+def _raw_union(location_model, filters, limit):
+    # sqlite has no GROUPING SETS, the same sets as one UNION ALL statement
+    parts = []
+    for dimension in ClickRollup.DIMENSIONS:
+        dimension_id, legacy = _dimension_key(location_model, dimension)
+        parts.append(
+            select(
+                literal(dimension).label("dimension"),
+                dimension_id.label("dimension_id"),
+                legacy.label("legacy"),
+                func.count().label("count"),
+            )
+            .select_from(location_model)
+            .where(*filters)
+            .group_by(dimension_id, legacy)
+        )
+    grouped = union_all(*parts).subquery()
+    ranked = select(
+        grouped.c.dimension,
+        grouped.c.dimension_id,
+        grouped.c.legacy,
+        grouped.c.count,
+        func.sum(grouped.c.count).over(partition_by=grouped.c.dimension).label("total"),
+        func.row_number()
+        .over(
+            partition_by=grouped.c.dimension,
+            order_by=(
+                grouped.c.count.desc(),
+                grouped.c.dimension_id,
+                grouped.c.legacy,
+            ),
+        )
+        .label("rank"),
+    ).subquery()
+    rows = db.session.execute(
+        select(
+            ranked.c.dimension,
+            ranked.c.dimension_id,
+            ranked.c.legacy,
+            ranked.c.count,
+            ranked.c.total,
+        ).where(ranked.c.rank <= limit)
+    )
+    return _decode_ranked(rows, limit)
+
+
+def get_raw_top_dimensions(target_column, link_model, user_id, target_id=None, limit=7):
+    """Same breakdown as get_top_dimensions, read from the raw click location rows.
+
+    Used until the rollups are rebuilt, it costs one statement per call.
+    """
+    location_model = target_column.class_
+    filters = [
+        target_column.in_(
+            select(link_model.id).where(
+                link_model.user_id == user_id,
+                link_model.id == target_id if target_id else True,
+            )
+        )
+    ]
+    if db.session.get_bind().dialect.name == "postgresql":
+        return _reshape(_raw_grouping_sets(location_model, filters, limit))
+    return _reshape(_raw_union(location_model, filters, limit))
+
+
+def _as_day(value):
+    # func.date() comes back as a string on sqlite
+    if isinstance(value, str):
+        value = datetime.date.fromisoformat(value)
+    return day_start(value)
+
+
+def _rebuild_chunk(app, target_type, target_column, target_ids, since=None):
+    location_model = target_column.class_
+    with app.app_context():
+        try:
+            day = func.date(location_model.created)
+            rollups = Counter()
+            for dimension in ClickRollup.DIMENSIONS:
+                dimension_id, legacy = _dimension_key(location_model, dimension)
+                rows = (
+                    db.session.query(
+                        target_column, day, dimension_id, legacy, func.count()
+                    )
+                    .filter(
+                        target_column.in_(target_ids),
+                        location_model.created >= since if since else True,
+                    )
+                    .group_by(target_column, day, dimension_id, legacy)
+                    .all()
+                )
+                names = dimension_names(row[2] for row in rows)
+                for target_id, row_day, value_id, value, clicks in rows:
+                    value = (names.get(value_id) or value or UNKNOWN)[:250]
+                    key = (target_type, target_id, _as_day(row_day), dimension, value)
+                    rollups[key] += clicks
+
+            ClickRollup.query.filter(
+                ClickRollup.target_type == target_type,
+                ClickRollup.target_id.in_(target_ids),
+                ClickRollup.day >= since if since else True,
+            ).delete(synchronize_session=False)
+            upsert_click_rollups(rollups)
+            db.session.commit()
+            return len(target_ids)
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            db.session.remove()
+
+
+def backfill_click_rollups(workers=4, chunk_size=500):
+    """Rebuild click_rollups from the raw click location rows.
+
+    Links are split in chunks of chunk_size ids, each chunk is recomputed and
+    swapped in its own transaction by a pool of workers with their own
+    session. Run it while the click stream is not being drained, clicks
+    ingested into a chunk while it is rebuilt can be lost. Once retention
+    has dropped raw partitions only the days still stored are rebuilt, the
+    rollups of the dropped range are kept as they are.
+    """
+    app = current_app._get_current_object()
+    sources = (
+        (ShortCode.SHORT_URL, Urlshort, ShortUrlClickLocation.url_id),
+        (ShortCode.QRCODE, QRCodeData, QrCodeClickLocation.qr_code_id),
+    )
+
+    totals = {}
+    for target_type, link_model, target_column in sources:
+        since = retention_applied_before(target_column.class_.__tablename__)
+        ids = [
+            link_id
+            for (link_id,) in db.session.query(link_model.id).order_by(link_model.id)
+        ]
+        chunks = [ids[i : i + chunk_size] for i in range(0, len(ids), chunk_size)]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            done = pool.map(
+                lambda chunk: _rebuild_chunk(
+                    app, target_type, target_column, chunk, since
+                ),
+                chunks,
+            )
+            totals[target_type] = sum(done)
+        logger.info(
+            f"click rollups rebuilt for {totals[target_type]} {target_type}"
+            + (f" from {since:%Y-%m-%d}" if since else "")
+        )
+    mark_rollups_ready()
+    return totals
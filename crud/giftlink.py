@@ -12,6 +12,8 @@ from models.giftlink import (
 from models.payment import Transactions
 from sqlalchemy import func
 from logger import logger
+from link_cache import invalidate_gift_link
+from .user_counters import add_user_counter
 
 
 def save_or_update_bank_details(
@@ -269,6 +271,7 @@ def update_gift_link(
     gift_link.goal_amount = goal_amount or gift_link.goal_amount
     gift_link.start_amount = start_amount or gift_link.start_amount
     gift_link.update()
+    invalidate_gift_link(gift_link.slug)
     return True
 
 
@@ -469,6 +472,7 @@ def save_donation(
         user_id=user_id,
     )
     db.session.add(donation)
+    add_user_counter(user_id, supporters=1, donations=amount or 0)
     db.session.commit()
     return True
 
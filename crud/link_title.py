@@ -0,0 +1,34 @@
+from extensions import db
+from connection.redis_connection import redis_conn
+from models.qrcode import QRCodeData
+from models.shorten_url import Urlshort
+
+TITLE_MODELS = {"short_url": Urlshort, "qrcode": QRCodeData}
+
+
+def fill_link_title(kind, link_id, placeholder, title):
+    """Replace the placeholder title of a new link and of its qr code.
+
+    A title changed by the user in the meantime is left alone. Returns the
+    number of rows updated.
+    """
+    model = TITLE_MODELS[kind]
+    link = db.session.get(model, link_id)
+    if link is None:
+        return 0
+    updated = 0
+    rows = [link]
+    if kind == "short_url" and link.qr_code_rel:
+        rows.append(link.qr_code_rel)
+    for row in rows:
+        if row.title == placeholder:
+            row.title = title
+            updated += 1
+    if not updated:
+        return 0
+    db.session.commit()
+    keys = [f"{kind}:{link.user_id}:{link_id}"]
+    if kind == "short_url" and link.qr_code_rel:
+        keys.append(f"qrcode:{link.user_id}:{link.qr_code_rel.id}")
+    redis_conn.delete(*keys)
+    return updated
@@ -1,4 +1,5 @@
-from models.payment import PaymentPlans, Subscriptions
+from models.payment import PaymentPlans, Subscriptions, Transactions
+from func import is_uuid
 from datetime import datetime, timedelta
 from logger import logger
 
@@ -176,6 +177,8 @@ def get_transactions(
 
 # get one transaction
 def get_one_transaction(transaction_id, user_id):
+    if not is_uuid(transaction_id):
+        return None
     transaction = Transactions.query.filter_by(
         id=transaction_id, user_id=user_id
     ).first()
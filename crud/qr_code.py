@@ -7,11 +7,29 @@ from models.qrcode import (
     QrFrame,
     QrCodeClickLocation,
 )
+import url_canonical
 from extensions import db
 from utils import gen_short_code
-from sqlalchemy import func, extract
+from sqlalchemy import func
+from collections import Counter
 from datetime import datetime
+from func import month_bounds, url_hash
 from logger import logger
+from link_cache import invalidate_link
+from models.short_code import ShortCode
+from .short_code import (
+    register_short_code,
+    sync_short_code,
+)
+from .click_ingest import count_rollups, upsert_click_rollups, upsert_daily_clicks
+from .click_dimensions import encode_click_locations
+from .click_rollup import (
+    get_raw_top_dimensions,
+    get_top_dimensions,
+    rollups_ready,
+)
+from .user_counters import add_user_counter
+from .top_links import get_top_qrcodes
 
 
 def save_qrcode_category(name):
@@ -27,7 +45,7 @@ def get_qrcode_categories():
 
 def save_qrcode_data(qrcode_data_payload, user_id):
     qrcode_data = QRCodeData(
-        url=qrcode_data_payload["url"],
+        url=url_canonical.canonical_url(qrcode_data_payload["url"]),
         phone_number=qrcode_data_payload["phone_number"],
         message=qrcode_data_payload["message"],
         email=qrcode_data_payload["email"],
@@ -107,7 +125,14 @@ def save_qrcode_data(qrcode_data_payload, user_id):
         db.session.add(qr_frame)
 
     db.session.add(qrcode_data)
+    if qrcode_data.short_url:
+        db.session.flush()
+        register_short_code(
+            qrcode_data.short_url, ShortCode.QRCODE, qrcode_data.id, qrcode_data.url
+        )
+    add_user_counter(user_id, qr_codes=1)
     db.session.commit()
+    invalidate_link(qrcode_data.short_url)
     return qrcode_data
 
 
@@ -150,7 +175,9 @@ def update_qrcode_data(qrcode_data_payload, user_id, qr_id):
     if not qrcode_data:
         return False
 
-    qrcode_data.url = qrcode_data_payload.get("url") or qrcode_data.url
+    qrcode_data.url = (
+        url_canonical.canonical_url(qrcode_data_payload.get("url")) or qrcode_data.url
+    )
     qrcode_data.phone_number = (
         qrcode_data_payload.get("phone_number") or qrcode_data.phone_number
     )
@@ -218,6 +245,12 @@ def update_qrcode_data(qrcode_data_payload, user_id, qr_id):
         if qrcode_data.short_url_id:
             qrcode_data.url_shortener.hidden = qrcode_data_payload.get("hidden")
 
+    sync_short_code(
+        qrcode_data.short_url,
+        url=qrcode_data_payload.get("url"),
+        hidden=qrcode_data_payload.get("hidden"),
+    )
+
     if qrcode_data_payload.get("social_media"):
         for social_media in qrcode_data_payload.get("social_media"):
             each_social = SocialMedia.query.filter_by(id=social_media["id"]).first()
@@ -260,6 +293,7 @@ def update_qrcode_data(qrcode_data_payload, user_id, qr_id):
             qr_frame.save()
 
     qrcode_data.update()
+    invalidate_link(qrcode_data.short_url)
 
     return True
 
@@ -331,19 +365,12 @@ def qrcode_styling(payload, qrcode_id, user_id):
     return qr_styling, False
 
 
-def get_url_by_short_url(short_url):
-    original_url = QRCodeData.query.filter(
-        func.lower(QRCodeData.short_url) == short_url.lower()
-    ).first()
-    return original_url.url if original_url else None
-
-
 # check if url and category already exists
 def check_url_category_exists(url, category, user_id):
     return QRCodeData.query.filter(
-        func.lower(QRCodeData.url) == url.lower(),
-        func.lower(QRCodeData.category) == category.lower(),
         QRCodeData.user_id == user_id,
+        QRCodeData.url_hash == url_hash(url),
+        func.lower(QRCodeData.category) == category.lower(),
     ).first()
 
 
@@ -355,7 +382,7 @@ def save_want_qr_code(
     if qr_style is None:
         qr_style = {}
     qr_code_data = QRCodeData(
-        url=url,
+        url=url_canonical.canonical_url(url),
         short_url=short_url,
         short_url_id=short_id,
         category=category,
@@ -390,16 +417,13 @@ def save_want_qr_code(
         # Implement this later
         pass
 
+    add_user_counter(user_id, qr_codes=1)
     db.session.commit()
+    invalidate_link(short_url)
 
     return qr_code_data
 
 
-# CHECK SHORT URL EXIST
-def check_short_url_exist(short_url):
-    return QRCodeData.query.filter(QRCodeData.short_url == short_url).first()
-
-
 # duplicate qr code
 def duplicate_qr_code(qr_code_id, user_id, short_url):
     try:
@@ -407,7 +431,7 @@ def duplicate_qr_code(qr_code_id, user_id, short_url):
         if not qr_code:
             return None
 
-        sh_url = (gen_short_code() if qr_code.url else None,)
+        sh_url = gen_short_code() if qr_code.url else None
 
         new_qr_code = QRCodeData(
             url=qr_code.url,
@@ -448,6 +472,14 @@ def duplicate_qr_code(qr_code_id, user_id, short_url):
         )
 
         db.session.add(new_qr_code)
+        db.session.flush()
+        if new_qr_code.short_url:
+            register_short_code(
+                new_qr_code.short_url,
+                ShortCode.QRCODE,
+                new_qr_code.id,
+                new_qr_code.url,
+            )
 
         if qr_code.qr_style:
             qr_code_styling = qr_code.qr_style
@@ -467,7 +499,9 @@ def duplicate_qr_code(qr_code_id, user_id, short_url):
 
             db.session.add(new_qr_styling)
 
+        add_user_counter(new_qr_code.user_id, qr_codes=1)
         db.session.commit()
+        invalidate_link(new_qr_code.short_url)
         return qr_code
     except Exception as e:
         logger.error(e)
@@ -477,40 +511,22 @@ def duplicate_qr_code(qr_code_id, user_id, short_url):
 
 def get_current_qr_code_count(current_user):
     """Return the count of QRCodeData records created in the current month."""
-    now = datetime.utcnow()  # Use datetime.now() if your app isn't in UTC
+    start, end = month_bounds(datetime.utcnow())
     return (
         QRCodeData.query.filter_by(user=current_user)
-        .filter(extract("year", QRCodeData.created) == now.year)
-        .filter(extract("month", QRCodeData.created) == now.month)
+        .filter(QRCodeData.created >= start, QRCodeData.created < end)
         .count()
     )
 
 
 def save_qrcode_clicks(url_id, payload):
-    import datetime
-
-    # Get today's date components
-    today = datetime.datetime.today()
-    current_year = today.year
-    current_month = today.month
-    current_day = today.day
-
-    # Query to find today's clicks for the given url_id
-    clicks = QrcodeRecord.query.filter(
-        QrcodeRecord.qr_code_id == url_id,
-        extract("year", QrcodeRecord.date) == current_year,
-        extract("month", QrcodeRecord.date) == current_month,
-        extract("day", QrcodeRecord.date) == current_day,
-    ).first()
-
-    if not clicks:
-        print("save new click record")
-        new_record = QrcodeRecord(clicks=1, qr_code_id=url_id)
-        db.session.add(new_record)
-    else:
-        print("update click record")
-        clicks.clicks += 1
-
+    upsert_daily_clicks(
+        QrcodeRecord,
+        QrcodeRecord.qr_code_id,
+        QrcodeRecord.clicks,
+        QrcodeRecord.date,
+        {(url_id, datetime.utcnow().date()): 1},
+    )
     db.session.commit()
     save_qrcode_click_location(
         payload["ip_address"],
@@ -524,121 +540,52 @@ def save_qrcode_clicks(url_id, payload):
 
 
 def save_qrcode_click_location(ip_address, country, city, device, browser, url_id):
-    new_record = QrCodeClickLocation(
-        ip_address=ip_address,
-        country=country,
-        city=city,
-        device=device,
-        browser=browser,
-        qr_code_id=url_id,
+    (location,) = encode_click_locations(
+        [
+            {
+                "ip_address": ip_address,
+                "country": country,
+                "city": city,
+                "device": device,
+                "browser": browser,
+            }
+        ]
     )
+    new_record = QrCodeClickLocation(qr_code_id=url_id, **location)
     db.session.add(new_record)
+    rollups = Counter()
+    count_rollups(
+        rollups,
+        ShortCode.QRCODE,
+        url_id,
+        datetime.utcnow(),
+        {"country": country, "city": city, "device": device, "browser": browser},
+    )
+    upsert_click_rollups(rollups)
     db.session.commit()
     return True
 
 
-# most 7 clicked qrcodes for a user
-def get_top_7_qrcodes(user_id, qr_id=None):
-    top_qrs = (
-        QrcodeRecord.query.join(QRCodeData, QRCodeData.id == QrcodeRecord.qr_code_id)
-        .filter(
-            QRCodeData.user_id == user_id, QRCodeData.id == qr_id if qr_id else True
-        )
-        .order_by(QrcodeRecord.clicks.desc())
-        .limit(7)
-        .all()
-    )
-    return [top_qr.to_dict_qrcode_data() for top_qr in top_qrs]
-
-
-def get_top_location_qrcodes(user_id, qr_id=None):
-    # Total clicks for the user
-    total_clicks = (
-        QrCodeClickLocation.query.join(QRCodeData)
-        .filter(QRCodeData.user_id == user_id)
-        .count()
+def get_qrcode_clicks_in_range(user_id, start, end, qr_id=None):
+    """Daily click rows of a user's qr codes with start <= date < end."""
+    return QrcodeRecord.query.join(
+        QRCodeData, QRCodeData.id == QrcodeRecord.qr_code_id
+    ).filter(
+        QRCodeData.user_id == user_id,
+        QRCodeData.id == qr_id if qr_id else True,
+        QrcodeRecord.date >= start,
+        QrcodeRecord.date < end,
     )
 
-    # Top countries
-    top_countries = (
-        db.session.query(
-            QrCodeClickLocation.country,
-            func.count(QrCodeClickLocation.id).label("count"),
-        )
-        .join(QRCodeData, QRCodeData.id == QrCodeClickLocation.qr_code_id)
-        .filter(
-            QRCodeData.user_id == user_id, QRCodeData.id == qr_id if qr_id else True
-        )
-        .group_by(QrCodeClickLocation.country)
-        .order_by(func.count(QrCodeClickLocation.id).desc())
-        .limit(7)
-        .all()
-    )
 
-    # Top cities
-    top_cities = (
-        db.session.query(
-            QrCodeClickLocation.city, func.count(QrCodeClickLocation.id).label("count")
-        )
-        .join(QRCodeData, QRCodeData.id == QrCodeClickLocation.qr_code_id)
-        .filter(
-            QRCodeData.user_id == user_id, QRCodeData.id == qr_id if qr_id else True
-        )
-        .group_by(QrCodeClickLocation.city)
-        .order_by(func.count(QrCodeClickLocation.id).desc())
-        .limit(7)
-        .all()
-    )
+# most 7 clicked qrcodes for a user
+def get_top_7_qrcodes(user_id, qr_id=None, window="all"):
+    return get_top_qrcodes(user_id, window, qr_id)
 
-    # Top devices
-    top_devices = (
-        db.session.query(
-            QrCodeClickLocation.device,
-            func.count(QrCodeClickLocation.id).label("count"),
-        )
-        .join(QRCodeData, QRCodeData.id == QrCodeClickLocation.qr_code_id)
-        .filter(
-            QRCodeData.user_id == user_id, QRCodeData.id == qr_id if qr_id else True
-        )
-        .group_by(QrCodeClickLocation.device)
-        .order_by(func.count(QrCodeClickLocation.id).desc())
-        .limit(7)
-        .all()
-    )
 
-    # Top browsers
-    top_browsers = (
-        db.session.query(
-            QrCodeClickLocation.browser,
-            func.count(QrCodeClickLocation.id).label("count"),
-        )
-        .join(QRCodeData, QRCodeData.id == QrCodeClickLocation.qr_code_id)
-        .filter(
-            QRCodeData.user_id == user_id, QRCodeData.id == qr_id if qr_id else True
+def get_top_location_qrcodes(user_id, qr_id=None):
+    if not rollups_ready():
+        return get_raw_top_dimensions(
+            QrCodeClickLocation.qr_code_id, QRCodeData, user_id, qr_id
         )
-        .group_by(QrCodeClickLocation.browser)
-        .order_by(func.count(QrCodeClickLocation.id).desc())
-        .limit(7)
-        .all()
-    )
-
-    # Helper function to calculate percentages
-    def calculate_percentage(data):
-        return [
-            {
-                "name": item[0],  # The grouped value (country, city, device, browser)
-                "count": item[1],  # The count value
-                "percentage": (
-                    round((item[1] / total_clicks * 100), 2) if total_clicks > 0 else 0
-                ),
-            }
-            for item in data
-        ]
-
-    # Creating the final output
-    return {
-        "top_countries": calculate_percentage(top_countries),
-        "top_cities": calculate_percentage(top_cities),
-        "top_devices": calculate_percentage(top_devices),
-        "top_browsers": calculate_percentage(top_browsers),
-    }
+    return get_top_dimensions(ShortCode.QRCODE, QRCodeData, user_id, qr_id)
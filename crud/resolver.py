@@ -0,0 +1,29 @@
+from extensions import db
+from models.qrcode import QRCodeData
+from models.short_code import ShortCode
+from models.shorten_url import Urlshort
+from .short_code import get_short_code
+
+# link tables of the kinds that have an owner
+OWNER_MODELS = {ShortCode.SHORT_URL: Urlshort, ShortCode.QRCODE: QRCodeData}
+
+
+def resolve_short_url(short_url):
+    """Resolve a short code to its destination and link metadata, or None.
+
+    A primary key probe on the short_codes registry, plus one on the link
+    table for the owner of short urls and qr codes. The result is cached, so
+    both only run on a cache miss.
+    """
+    short_code = get_short_code(short_url)
+    if short_code is None:
+        return None
+    link = short_code.to_link()
+    model = OWNER_MODELS.get(short_code.kind)
+    if model is not None:
+        link["user_id"] = (
+            db.session.query(model.user_id)
+            .filter(model.id == short_code.target_id)
+            .scalar()
+        )
+    return link
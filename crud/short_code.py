@@ -0,0 +1,170 @@
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+
+import code_filter
+from extensions import db
+from logger import logger
+from models.qrcode import QRCodeData
+from models.qrcode_unauth import QRCodeDataUnauth
+from models.short_code import ShortCode
+from models.shorten_url import Urlshort
+
+
+def _queue_change(action, short_url):
+    # published once the transaction commits, a worker rebuilding its filter
+    # never reads the table before a code it was told about exists
+    db.session.info.setdefault("code_changes", []).append((action, short_url))
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_changes(session):
+    changes = session.info.pop("code_changes", None)
+    if not changes:
+        return
+    for action in (code_filter.ADDED, code_filter.DELETED):
+        code_filter.publish_change(
+            action, *[code for change, code in changes if change == action]
+        )
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_changes(session):
+    session.info.pop("code_changes", None)
+
+
+def get_short_code(short_url):
+    if not short_url:
+        return None
+    return db.session.get(ShortCode, short_url.lower())
+
+
+def check_short_url_exist(short_url):
+    """Return the registry row when short_url is taken by any link kind."""
+    return get_short_code(short_url)
+
+
+def register_short_code(short_url, kind, target_id, url, hidden=False):
+    """Add short_url to the registry in the caller's transaction.
+
+    A code already taken by another link fails with IntegrityError on flush.
+    """
+    short_code = ShortCode(
+        code=short_url.lower(),
+        short_url=short_url,
+        kind=kind,
+        target_id=target_id,
+        url=url,
+        hidden=bool(hidden),
+    )
+    db.session.add(short_code)
+    _queue_change(code_filter.ADDED, short_url)
+    return short_code
+
+
+def register_short_codes(rows):
+    """Add (short_url, kind, target_id, url) rows with one multi-row INSERT."""
+    if not rows:
+        return
+    db.session.execute(
+        insert(ShortCode),
+        [
+            {
+                "code": short_url.lower(),
+                "short_url": short_url,
+                "kind": kind,
+                "target_id": target_id,
+                "url": url,
+                "hidden": False,
+            }
+            for short_url, kind, target_id, url in rows
+        ],
+    )
+    for row in rows:
+        _queue_change(code_filter.ADDED, row[0])
+
+
+def sync_short_code(short_url, url=None, hidden=None):
+    short_code = get_short_code(short_url)
+    if not short_code:
+        return None
+    if url:
+        short_code.url = url
+    if isinstance(hidden, bool):
+        short_code.hidden = hidden
+    return short_code
+
+
+def rename_short_code(old_short_url, new_short_url):
+    """Move a registry row to a new code, in the caller's transaction."""
+    short_code = get_short_code(old_short_url)
+    if not short_code:
+        return None
+    db.session.delete(short_code)
+    db.session.flush()
+    _queue_change(code_filter.DELETED, old_short_url)
+    return register_short_code(
+        new_short_url,
+        short_code.kind,
+        short_code.target_id,
+        short_code.url,
+        short_code.hidden,
+    )
+
+
+def delete_short_code(short_url):
+    short_code = get_short_code(short_url)
+    if short_code:
+        db.session.delete(short_code)
+        _queue_change(code_filter.DELETED, short_url)
+    return short_code
+
+
+def _backfill_rows(rows, kind, seen):
+    codes = [row.short_url.lower() for row in rows]
+    existing = {
+        code
+        for (code,) in db.session.query(ShortCode.code).filter(
+            ShortCode.code.in_(codes)
+        )
+    }
+    added = 0
+    for row in rows:
+        code = row.short_url.lower()
+        if code in existing or code in seen:
+            if code not in existing:
+                logger.info(f"short code {row.short_url} is already registered")
+            continue
+        seen.add(code)
+        register_short_code(
+            row.short_url, kind, row.id, row.url, getattr(row, "hidden", False)
+        )
+        added += 1
+    db.session.commit()
+    return added
+
+
+def backfill_short_codes(batch_size=1000):
+    """Register every existing code that is not in the registry yet."""
+    sources = (
+        (Urlshort, ShortCode.SHORT_URL, Urlshort.query),
+        # qr codes created for a short url share its code
+        (
+            QRCodeData,
+            ShortCode.QRCODE,
+            QRCodeData.query.filter(QRCodeData.short_url_id.is_(None)),
+        ),
+        (QRCodeDataUnauth, ShortCode.QRCODE_UNAUTH, QRCodeDataUnauth.query),
+    )
+    totals = {}
+    for model, kind, query in sources:
+        seen, batch, added = set(), [], 0
+        query = query.filter(model.short_url.isnot(None)).order_by(model.created)
+        for row in query.yield_per(batch_size):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                added += _backfill_rows(batch, kind, seen)
+                batch = []
+        if batch:
+            added += _backfill_rows(batch, kind, seen)
+        totals[kind] = added
+    return totals
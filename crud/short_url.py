@@ -1,42 +1,36 @@
 # from urllib import request
-from urllib.parse import urlparse
 import requests
 
 # from urllib.error import HTTPError, URLError
-import uuid
-import hashlib
 import datetime
+from collections import Counter
+import url_canonical
 from extensions import db
-from func import hex_id
-from sqlalchemy import func
-from sqlalchemy import extract
+from func import hex_id, month_bounds, url_hash
+from sqlalchemy import bindparam, func, select
 from logger import logger
 from models.shorten_url import UrlShortenerClicks, ShortUrlClickLocation, Urlshort
+from models.short_code import ShortCode
+from .short_code import register_short_code
+from .click_ingest import count_rollups, upsert_click_rollups, upsert_daily_clicks
+from .click_dimensions import encode_click_locations
+from .click_rollup import (
+    get_raw_top_dimensions,
+    get_top_dimensions,
+    rollups_ready,
+)
+from .user_counters import add_user_counter
+from .top_links import get_top_short_urls
 
 
 def save_url_clicks(url_id, payload):
-    # Get today's date components
-    today = datetime.datetime.today()
-    current_year = today.year
-    current_month = today.month
-    current_day = today.day
-
-    # Query to find today's clicks for the given url_id
-    clicks = UrlShortenerClicks.query.filter(
-        UrlShortenerClicks.url_id == url_id,
-        extract("year", UrlShortenerClicks.created) == current_year,
-        extract("month", UrlShortenerClicks.created) == current_month,
-        extract("day", UrlShortenerClicks.created) == current_day,
-    ).first()
-
-    if not clicks:
-        logger.info("save new click record")
-        new_clicks = UrlShortenerClicks(count=1, url_id=url_id)
-        db.session.add(new_clicks)
-    else:
-        logger.info("update click record")
-        clicks.count += 1
-
+    upsert_daily_clicks(
+        UrlShortenerClicks,
+        UrlShortenerClicks.url_id,
+        UrlShortenerClicks.count,
+        UrlShortenerClicks.created,
+        {(url_id, datetime.datetime.utcnow().date()): 1},
+    )
     db.session.commit()
     save_url_click_location(
         payload["ip_address"],
@@ -49,22 +43,6 @@ def save_url_clicks(url_id, payload):
     return True
 
 
-# generate short url
-def generate_short_url():
-    last_url = Urlshort.query.order_by(Urlshort.id.desc()).first()
-
-    if not last_url:
-        # If no URLs exist in the database, initialize the counter to 1
-        new_uuid = uuid.uuid4().hex
-    else:
-        # Use the last UUID if it exists
-        new_uuid = last_url.id
-
-    # Generate the short URL using the counter
-    hashid = hashlib.sha256(new_uuid.encode()).hexdigest()[:8]
-    return hashid
-
-
 # validate url
 # def validate_url(url):
 #     if not url.startswith("http://") and not url.startswith("https://"):
@@ -103,47 +81,92 @@ def generate_short_url():
 
 
 def validate_url(url):
-    if not url.startswith("http://") and not url.startswith("https://"):
-        url = "http://" + url
-
-    parsed = urlparse(url)
-    return all([parsed.scheme in ("http", "https"), parsed.netloc])
+    return url_canonical.is_valid(url)
 
 
 def save_url_click_location(ip_address, country, city, device, browser, url_id):
-    new_record = ShortUrlClickLocation(
-        ip_address=ip_address,
-        country=country,
-        city=city,
-        device=device,
-        browser=browser,
-        url_id=url_id,
+    (location,) = encode_click_locations(
+        [
+            {
+                "ip_address": ip_address,
+                "country": country,
+                "city": city,
+                "device": device,
+                "browser": browser,
+            }
+        ]
     )
+    new_record = ShortUrlClickLocation(url_id=url_id, **location)
     db.session.add(new_record)
+    rollups = Counter()
+    count_rollups(
+        rollups,
+        ShortCode.SHORT_URL,
+        url_id,
+        datetime.datetime.utcnow(),
+        {"country": country, "city": city, "device": device, "browser": browser},
+    )
+    upsert_click_rollups(rollups)
     db.session.commit()
     return True
 
 
-def get_original_url_by_short_url(short_url):
-    origin_url = Urlshort.query.filter(
-        func.lower(Urlshort.short_url) == short_url.lower()
-    ).first()
-    return origin_url.url if origin_url else None
-
-
-def save_shorten_url(url, short_url, title, want_qr_code, user_id):
+def save_shorten_url(url, short_url, title, want_qr_code, user_id, has_half_back=False):
+    url = url_canonical.canonical_url(url)
     new_record = Urlshort(
         url=url,
         short_url=short_url,
         title=title,
         want_qr_code=want_qr_code,
         user_id=user_id,
+        has_half_back=has_half_back,
     )
     db.session.add(new_record)
+    db.session.flush()
+    register_short_code(short_url, ShortCode.SHORT_URL, new_record.id, url)
+    add_user_counter(user_id, short_links=1)
     db.session.commit()
     return new_record
 
 
+def check_url_exists(url, user_id):
+    """The user's short url for url, one probe of (user_id, url_hash)."""
+    return Urlshort.query.filter_by(user_id=user_id, url_hash=url_hash(url)).first()
+
+
+def backfill_url_hashes(model, batch_size=1000, rehash=False):
+    """Fill url_hash for rows written before the column existed.
+
+    With rehash every row is hashed again, needed after the canonical form
+    changes (URL_STRIP_TRACKING_PARAMS, URL_STRIP_TRAILING_SLASH). Batches commit on their own so the
+    command can be stopped and run again. Returns the number of rows hashed.
+    """
+    table = model.__table__
+    pending = table.c.url.isnot(None) & (table.c.url != "")
+    if not rehash:
+        pending = pending & table.c.url_hash.is_(None)
+    hashed = 0
+    last_id = ""
+    while True:
+        rows = db.session.execute(
+            select(table.c.id, table.c.url)
+            .where(pending, table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return hashed
+        db.session.execute(
+            table.update()
+            .where(table.c.id == bindparam("b_id"))
+            .values(url_hash=bindparam("b_url_hash")),
+            [{"b_id": row.id, "b_url_hash": url_hash(row.url)} for row in rows],
+        )
+        db.session.commit()
+        hashed += len(rows)
+        last_id = rows[-1].id
+
+
 def get_shorten_url_for_user(page, per_page, user_id, hidden):
     query = Urlshort.query.filter_by(user_id=user_id, hidden=hidden)
 
@@ -161,126 +184,36 @@ def get_shorten_url_for_user(page, per_page, user_id, hidden):
     }
 
 
-def check_short_url_exist(short_url):
-    return Urlshort.query.filter(Urlshort.short_url == short_url).first()
-
-
 def get_current_shortlink_count(current_user):
     """Return the current count of Urlshort records."""
-    now = datetime.datetime.utcnow()
+    start, end = month_bounds(datetime.datetime.utcnow())
     return (
         Urlshort.query.filter_by(user=current_user)
-        .filter(extract("year", Urlshort.created) == now.year)
-        .filter(extract("month", Urlshort.created) == now.month)
+        .filter(Urlshort.created >= start, Urlshort.created < end)
         .count()
     )
 
 
-# most 7 click url
-def get_most_clicked_url_short(user_id, short_id=None):
-    top_shorts = (
-        UrlShortenerClicks.query.join(
-            Urlshort, Urlshort.id == UrlShortenerClicks.url_id
-        )
-        .filter(
-            Urlshort.user_id == user_id, Urlshort.id == short_id if short_id else True
-        )
-        .order_by(UrlShortenerClicks.count.desc())
-        .limit(7)
-        .all()
+def get_url_clicks_in_range(user_id, start, end, url_id=None):
+    """Daily click rows of a user's short urls with start <= created < end."""
+    return UrlShortenerClicks.query.join(
+        Urlshort, Urlshort.id == UrlShortenerClicks.url_id
+    ).filter(
+        Urlshort.user_id == user_id,
+        Urlshort.id == url_id if url_id else True,
+        UrlShortenerClicks.created >= start,
+        UrlShortenerClicks.created < end,
     )
-    return [top_short.to_dict_urlshort() for top_short in top_shorts]
 
 
-def get_top_location_short_url(user_id, short_id=None):
-    # Total clicks for the user
-    total_clicks = (
-        ShortUrlClickLocation.query.join(Urlshort)
-        .filter(Urlshort.user_id == user_id)
-        .count()
-    )
-
-    # Top countries
-    top_countries = (
-        db.session.query(
-            ShortUrlClickLocation.country,
-            func.count(ShortUrlClickLocation.id).label("count"),
-        )
-        .join(Urlshort, Urlshort.id == ShortUrlClickLocation.url_id)
-        .filter(
-            Urlshort.user_id == user_id, Urlshort.id == short_id if short_id else True
-        )
-        .group_by(ShortUrlClickLocation.country)
-        .order_by(func.count(ShortUrlClickLocation.id).desc())
-        .limit(7)
-        .all()
-    )
-
-    # Top cities
-    top_cities = (
-        db.session.query(
-            ShortUrlClickLocation.city,
-            func.count(ShortUrlClickLocation.id).label("count"),
-        )
-        .join(Urlshort, Urlshort.id == ShortUrlClickLocation.url_id)
-        .filter(
-            Urlshort.user_id == user_id, Urlshort.id == short_id if short_id else True
-        )
-        .group_by(ShortUrlClickLocation.city)
-        .order_by(func.count(ShortUrlClickLocation.id).desc())
-        .limit(7)
-        .all()
-    )
+# most 7 click url
+def get_most_clicked_url_short(user_id, short_id=None, window="all"):
+    return get_top_short_urls(user_id, window, short_id)
 
-    # Top devices
-    top_devices = (
-        db.session.query(
-            ShortUrlClickLocation.device,
-            func.count(ShortUrlClickLocation.id).label("count"),
-        )
-        .join(Urlshort, Urlshort.id == ShortUrlClickLocation.url_id)
-        .filter(
-            Urlshort.user_id == user_id, Urlshort.id == short_id if short_id else True
-        )
-        .group_by(ShortUrlClickLocation.device)
-        .order_by(func.count(ShortUrlClickLocation.id).desc())
-        .limit(7)
-        .all()
-    )
 
-    # Top browsers
-    top_browsers = (
-        db.session.query(
-            ShortUrlClickLocation.browser,
-            func.count(ShortUrlClickLocation.id).label("count"),
-        )
-        .join(Urlshort, Urlshort.id == ShortUrlClickLocation.url_id)
-        .filter(
-            Urlshort.user_id == user_id, Urlshort.id == short_id if short_id else True
+def get_top_location_short_url(user_id, short_id=None):
+    if not rollups_ready():
+        return get_raw_top_dimensions(
+            ShortUrlClickLocation.url_id, Urlshort, user_id, short_id
         )
-        .group_by(ShortUrlClickLocation.browser)
-        .order_by(func.count(ShortUrlClickLocation.id).desc())
-        .limit(7)
-        .all()
-    )
-
-    # Helper function to calculate percentages
-    def calculate_percentage(data):
-        return [
-            {
-                "name": item[0],  # The grouped value (country, city, device, browser)
-                "count": item[1],  # The count value
-                "percentage": (
-                    round((item[1] / total_clicks * 100), 2) if total_clicks > 0 else 0
-                ),
-            }
-            for item in data
-        ]
-
-    # Creating the final output
-    return {
-        "top_countries": calculate_percentage(top_countries),
-        "top_cities": calculate_percentage(top_cities),
-        "top_devices": calculate_percentage(top_devices),
-        "top_browsers": calculate_percentage(top_browsers),
-    }
+    return get_top_dimensions(ShortCode.SHORT_URL, Urlshort, user_id, short_id)
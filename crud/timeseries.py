@@ -0,0 +1,144 @@
+import datetime
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import func
+
+from extensions import db
+from models.qrcode import QRCodeData, QrcodeRecord, QrCodeClickLocation
+from models.short_code import ShortCode
+from models.shorten_url import Urlshort, UrlShortenerClicks, ShortUrlClickLocation
+
+GRANULARITIES = ("hour", "day", "week", "month")
+# longest range, in days, a single series may cover
+MAX_RANGE_DAYS = {"hour": 31, "day": 1100, "week": 1100, "month": 1100}
+
+UTC = datetime.timezone.utc
+
+# link model, then daily table (target, count, day) and raw click rows
+SOURCES = {
+    ShortCode.SHORT_URL: (
+        Urlshort,
+        (
+            UrlShortenerClicks.url_id,
+            UrlShortenerClicks.count,
+            UrlShortenerClicks.created,
+        ),
+        ShortUrlClickLocation,
+        ShortUrlClickLocation.url_id,
+    ),
+    ShortCode.QRCODE: (
+        QRCodeData,
+        (QrcodeRecord.qr_code_id, QrcodeRecord.clicks, QrcodeRecord.date),
+        QrCodeClickLocation,
+        QrCodeClickLocation.qr_code_id,
+    ),
+}
+
+
+def bucket_start(dt, granularity):
+    if granularity == "hour":
+        return dt.replace(minute=0, second=0, microsecond=0)
+    day = datetime.datetime.combine(dt.date(), datetime.time())
+    if granularity == "week":
+        return day - datetime.timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(dt, granularity):
+    if granularity == "hour":
+        return dt + datetime.timedelta(hours=1)
+    if granularity == "week":
+        return dt + datetime.timedelta(weeks=1)
+    if granularity == "month":
+        return (dt.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+    return dt + datetime.timedelta(days=1)
+
+
+def _hour_of(column):
+    if db.session.get_bind().dialect.name == "postgresql":
+        return func.date_trunc("hour", column)
+    return func.strftime("%Y-%m-%d %H:00:00", column)
+
+
+def _as_datetime(value):
+    # sqlite hands back strings for computed date expressions
+    if isinstance(value, str):
+        return datetime.datetime.fromisoformat(value)
+    if not isinstance(value, datetime.datetime):
+        return datetime.datetime.combine(value, datetime.time())
+    return value
+
+
+def _hourly_counts(target_type, owned, start, end):
+    # utc hour -> clicks, from the raw click rows of the range
+    link_model, _, location_model, target_column = SOURCES[target_type]
+    hour = _hour_of(location_model.created)
+    rows = (
+        db.session.query(hour, func.count())
+        .join(link_model, link_model.id == target_column)
+        .filter(*owned, location_model.created >= start, location_model.created < end)
+        .group_by(hour)
+    )
+    return {_as_datetime(bucket): clicks for bucket, clicks in rows}
+
+
+def _daily_counts(target_type, owned, start, end):
+    # utc day -> clicks, from the pre-bucketed daily table
+    link_model, (target_column, count_column, date_column), _, _ = SOURCES[target_type]
+    rows = (
+        db.session.query(date_column, func.sum(count_column))
+        .join(link_model, link_model.id == target_column)
+        .filter(*owned, date_column >= start, date_column < end)
+        .group_by(date_column)
+    )
+    return {_as_datetime(day): clicks or 0 for day, clicks in rows}
+
+
+def get_click_timeseries(
+    target_type, user_id, start, end, granularity="day", tz="UTC", target_id=None
+):
+    """Clicks of a user's links (or one link) between the dates start and end
+    included, per bucket of granularity, with empty buckets filled with 0.
+
+    Hourly series are read from the raw click rows and shifted to tz, longer
+    buckets are summed from the daily tables whose days are utc days, they
+    only come in UTC and tz must be "UTC" for them.
+    """
+    if granularity != "hour" and tz != "UTC":
+        raise ValueError("tz only applies to hourly series")
+    zone = ZoneInfo(tz)
+    link_model = SOURCES[target_type][0]
+    owned = (
+        link_model.user_id == user_id,
+        link_model.id == target_id if target_id else True,
+    )
+    first = datetime.datetime.combine(start, datetime.time())
+    stop = datetime.datetime.combine(end, datetime.time()) + datetime.timedelta(days=1)
+
+    if granularity == "hour":
+
+        def to_utc(local):
+            return local.replace(tzinfo=zone).astimezone(UTC).replace(tzinfo=None)
+
+        counts = _hourly_counts(target_type, owned, to_utc(first), to_utc(stop))
+        local = {}
+        for hour, clicks in counts.items():
+            hour = hour.replace(tzinfo=UTC).astimezone(zone).replace(tzinfo=None)
+            key = bucket_start(hour, "hour")
+            local[key] = local.get(key, 0) + clicks
+        counts = local
+    else:
+        daily = _daily_counts(target_type, owned, first, stop)
+        counts = {}
+        for day, clicks in daily.items():
+            key = bucket_start(day, granularity)
+            counts[key] = counts.get(key, 0) + clicks
+
+    series = []
+    bucket = bucket_start(first, granularity)
+    while bucket < stop:
+        series.append({"bucket": bucket.isoformat(), "clicks": counts.get(bucket, 0)})
+        bucket = next_bucket(bucket, granularity)
+    return series
@@ -0,0 +1,85 @@
+import datetime
+
+from flask import request
+from sqlalchemy import func
+
+from extensions import db
+from func import day_start
+from models.qrcode import QRCodeData, QrcodeRecord
+from models.shorten_url import Urlshort, UrlShortenerClicks
+from utils import return_host_url
+
+# ranking window -> number of days counted back from today, None is all time
+TOP_LINK_WINDOWS = {"7d": 7, "30d": 30, "all": None}
+
+
+def _top_links(daily, link_model, user_id, window, link_id, limit):
+    target_column, count_column, date_column = daily
+    days = TOP_LINK_WINDOWS[window]
+    columns = (link_model.id, link_model.url, link_model.short_url, link_model.title)
+    owned = (
+        link_model.user_id == user_id,
+        link_model.id == link_id if link_id else True,
+    )
+
+    if days is None:
+        # the running total on the link is the all time sum of its daily rows
+        return (
+            db.session.query(*columns, link_model.clicks.label("clicks"))
+            .filter(*owned, link_model.clicks > 0)
+            .order_by(link_model.clicks.desc())
+            .limit(limit)
+            .all()
+        )
+
+    since = day_start(datetime.datetime.utcnow()) - datetime.timedelta(days=days - 1)
+    clicks = func.sum(count_column).label("clicks")
+    return (
+        db.session.query(*columns, clicks)
+        .join(link_model, link_model.id == target_column)
+        .filter(*owned, date_column >= since)
+        .group_by(*columns)
+        .order_by(clicks.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+def _link_dict(row, count_key):
+    return {
+        "id": row.id,
+        count_key: row.clicks,
+        "long_url": row.url,
+        "short_url": f"{return_host_url(request.host_url)}{row.short_url}",
+        "title": row.title,
+    }
+
+
+def get_top_short_urls(user_id, window="all", short_id=None, limit=7):
+    """Most clicked short urls of a user, summed over the window, in one query."""
+    rows = _top_links(
+        (
+            UrlShortenerClicks.url_id,
+            UrlShortenerClicks.count,
+            UrlShortenerClicks.created,
+        ),
+        Urlshort,
+        user_id,
+        window,
+        short_id,
+        limit,
+    )
+    return [_link_dict(row, "count") for row in rows]
+
+
+def get_top_qrcodes(user_id, window="all", qr_id=None, limit=7):
+    """Most scanned qr codes of a user, summed over the window, in one query."""
+    rows = _top_links(
+        (QrcodeRecord.qr_code_id, QrcodeRecord.clicks, QrcodeRecord.date),
+        QRCodeData,
+        user_id,
+        window,
+        qr_id,
+        limit,
+    )
+    return [_link_dict(row, "clicks") for row in rows]
@@ -1,12 +1,17 @@
 from sqlalchemy import func
+import url_canonical
 from extensions import db
+from func import url_hash
 from models.qrcode_unauth import QRCodeDataUnauth
 from utils import gen_short_code
+from link_cache import invalidate_link
+from models.short_code import ShortCode
+from .short_code import register_short_code
 
 
 def save_qrcode_data_unauth(qrcode_data_payload):
     qrcode_data = QRCodeDataUnauth(
-        url=qrcode_data_payload["url"],
+        url=url_canonical.canonical_url(qrcode_data_payload["url"]),
         phone_number=qrcode_data_payload["phone_number"],
         message=qrcode_data_payload["message"],
         email=qrcode_data_payload["email"],
@@ -39,19 +44,21 @@ def save_qrcode_data_unauth(qrcode_data_payload):
     )
 
     db.session.add(qrcode_data)
+    if qrcode_data.short_url:
+        db.session.flush()
+        register_short_code(
+            qrcode_data.short_url,
+            ShortCode.QRCODE_UNAUTH,
+            qrcode_data.id,
+            qrcode_data.url,
+        )
     db.session.commit()
+    invalidate_link(qrcode_data.short_url)
     return qrcode_data
 
 
 def check_unauth_url_category_exists(url, category):
     return QRCodeDataUnauth.query.filter(
-        func.lower(QRCodeDataUnauth.url) == url.lower(),
+        QRCodeDataUnauth.url_hash == url_hash(url),
         func.lower(QRCodeDataUnauth.category) == category.lower(),
     ).first()
-
-
-def get_unauth_url_by_short_url(short_url):
-    original_url = QRCodeDataUnauth.query.filter(
-        func.lower(QRCodeDataUnauth.short_url) == short_url.lower()
-    ).first()
-    return original_url.url if original_url else None
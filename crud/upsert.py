@@ -0,0 +1,14 @@
+from sqlalchemy.dialects import postgresql, sqlite
+
+from extensions import db
+
+
+def dialect_insert(model):
+    """INSERT for model that supports on_conflict_do_update on the bound dialect.
+
+    ON CONFLICT is spelled the same on postgres and sqlite, but lives in the
+    dialect modules.
+    """
+    if db.session.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(model.__table__)
+    return sqlite.insert(model.__table__)
@@ -9,6 +9,7 @@ from models.qrcode import QRCodeData
 from models.giftlink import Donation
 from logger import logger
 from extensions import db
+from .user_counters import get_user_counters
 
 
 def authenticate(email, password):
@@ -145,29 +146,13 @@ def user_statistics(user_id):
         total clicks on short links
         total donations
         """
-        total_qr = QRCodeData.query.filter_by(user_id=user_id).count()
-        total_supporters = Donation.query.filter_by(user_id=user_id).count()
-        total_short_links = Urlshort.query.filter_by(user_id=user_id).count()
-        total_clicks = (
-            db.session.query(db.func.count(UrlShortenerClicks.id))
-            .join(Urlshort, UrlShortenerClicks.url_id == Urlshort.id)
-            .filter(Urlshort.user_id == user_id)
-            .scalar()
-        )
-        # sum of the donations
-        total_donations = (
-            Donation.query.filter_by(user_id=user_id)
-            .with_entities(db.func.sum(Donation.amount))
-            .scalar()
-            or 0
-        )
-
+        counters = get_user_counters(user_id)
         return {
-            "total_qr": total_qr,
-            "total_supporters": total_supporters,
-            "total_short_links": total_short_links,
-            "total_short_url_clicks": total_clicks,
-            "total_supports": total_donations,
+            "total_qr": counters["qr_codes"],
+            "total_supporters": counters["supporters"],
+            "total_short_links": counters["short_links"],
+            "total_short_url_clicks": counters["short_url_clicks"],
+            "total_supports": counters["donations"],
         }
     except Exception as e:
         logger.exception("traceback@user_blp/statistics")
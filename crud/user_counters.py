@@ -0,0 +1,118 @@
+from collections import Counter
+
+from sqlalchemy import func
+
+from extensions import db
+from models.giftlink import Donation
+from models.qrcode import QRCodeData
+from models.shorten_url import Urlshort
+from models.user_counters import UserCounters
+from .upsert import dialect_insert
+
+
+def add_user_counters(changes):
+    """Apply {user_id: {field: delta}} to user_counters in the current transaction.
+
+    The caller commits, so the counters move together with the rows they count.
+    """
+    rows = []
+    for user_id, deltas in changes.items():
+        if not user_id or not any(deltas.values()):
+            continue
+        row = {field: deltas.get(field, 0) for field in UserCounters.FIELDS}
+        rows.append(dict(row, user_id=user_id))
+    if not rows:
+        return
+    table = UserCounters.__table__
+    stmt = dialect_insert(UserCounters).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id"],
+        set_={
+            **{
+                field: table.c[field] + stmt.excluded[field]
+                for field in UserCounters.FIELDS
+            },
+            "updated": func.now(),
+        },
+    )
+    db.session.execute(stmt)
+
+
+def add_user_counter(user_id, **deltas):
+    add_user_counters({user_id: deltas})
+
+
+def remove_link_counters(link):
+    """Take a short url or qr code about to be deleted off its owner's counters.
+
+    A short url takes the qr code deleted with it along.
+    """
+    user_id = link.user_id
+    deltas = Counter()
+    if isinstance(link, Urlshort):
+        deltas["short_links"] -= 1
+        deltas["short_url_clicks"] -= link.clicks or 0
+        link = link.qr_code_rel
+    if link is not None:
+        deltas["qr_codes"] -= 1
+        deltas["qr_code_clicks"] -= link.clicks or 0
+    add_user_counters({user_id: deltas})
+
+
+def get_user_counters(user_id):
+    counters = db.session.get(UserCounters, user_id)
+    if not counters:
+        return {field: 0 for field in UserCounters.FIELDS}
+    return counters.to_dict()
+
+
+def rebuild_user_counters():
+    """Recompute every user's counters from the tables they summarize."""
+    totals = {}
+
+    def collect(field, query):
+        for user_id, value in query:
+            if user_id:
+                totals.setdefault(user_id, Counter())[field] = value or 0
+
+    collect(
+        "short_links",
+        db.session.query(Urlshort.user_id, func.count(Urlshort.id)).group_by(
+            Urlshort.user_id
+        ),
+    )
+    collect(
+        "short_url_clicks",
+        db.session.query(Urlshort.user_id, func.sum(Urlshort.clicks)).group_by(
+            Urlshort.user_id
+        ),
+    )
+    collect(
+        "qr_codes",
+        db.session.query(QRCodeData.user_id, func.count(QRCodeData.id)).group_by(
+            QRCodeData.user_id
+        ),
+    )
+    collect(
+        "qr_code_clicks",
+        db.session.query(QRCodeData.user_id, func.sum(QRCodeData.clicks)).group_by(
+            QRCodeData.user_id
+        ),
+    )
+    collect(
+        "supporters",
+        db.session.query(Donation.user_id, func.count(Donation.id)).group_by(
+            Donation.user_id
+        ),
+    )
+    collect(
+        "donations",
+        db.session.query(Donation.user_id, func.sum(Donation.amount)).group_by(
+            Donation.user_id
+        ),
+    )
+
+    UserCounters.query.delete(synchronize_session=False)
+    add_user_counters(totals)
+    db.session.commit()
+    return len(totals)
@@ -1,7 +1,7 @@
 from functools import wraps
 from flask_jwt_extended import current_user
 from utils import return_response
-from flask import request
+from flask import g, request
 from http_status import HttpStatus
 from status_res import StatusRes
 import time
@@ -17,6 +17,7 @@ from crud import (
     get_current_bio_link_count,
     get_current_shortlink_count,
     get_current_qr_code_count,
+    reserved_short_links,
 )
 
 
@@ -154,15 +155,21 @@ def check_shortlink_limit(f):
         current_shortlinks = get_current_shortlink_count(
             current_user
         )  # Function to get current shortlink count
+        # links bulk jobs still have to create count as made
+        reserved = reserved_short_links(current_user.id)
 
-        if current_shortlinks >= plan.shortlinks_per_month:
-            logger.info(f"{current_shortlinks} >= {plan.shortlinks_per_month}")
+        if current_shortlinks + reserved >= plan.shortlinks_per_month:
+            logger.info(
+                f"{current_shortlinks} + {reserved} >= {plan.shortlinks_per_month}"
+            )
             return return_response(
                 HttpStatus.FORBIDDEN,
                 status=StatusRes.FAILED,
                 message="You have reached your limit for shortlinks for the month.",
             )
 
+        # bulk creation reserves its whole batch out of what is left
+        g.shortlinks_left = plan.shortlinks_per_month - current_shortlinks
         return f(*args, **kwargs)
 
     return decorated_function
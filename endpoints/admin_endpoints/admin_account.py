@@ -25,6 +25,8 @@ from utils import (
     detect_disposable_email,
 )
 from logger import logger
+from link_cache import cache_stats
+from click_stream import pipeline_metrics
 from flask_jwt_extended import current_user, jwt_required
 
 USER_PREFIX = "admin_account"
@@ -507,3 +509,45 @@ def modify_payment_plan(plan_id):
             status=StatusRes.FAILED,
             message="Network Error",
         )
+
+
+# redirect resolution cache counters
+@admin_blp.route(f"/{USER_PREFIX}/cache_stats", methods=["GET"])
+@jwt_required()
+def resolution_cache_stats():
+    try:
+        return return_response(
+            HttpStatus.OK,
+            status=StatusRes.SUCCESS,
+            message="Cache Stats",
+            data=cache_stats(),
+        )
+    except Exception as e:
+        logger.exception("traceback@admin_blp/resolution_cache_stats")
+        logger.error(f"{e}: error@admin_blp/resolution_cache_stats")
+        return return_response(
+            HttpStatus.INTERNAL_SERVER_ERROR,
+            status=StatusRes.FAILED,
+            message="Network Error",
+        )
+
+
+# click ingestion backlog and flush stats
+@admin_blp.route(f"/{USER_PREFIX}/click_pipeline_stats", methods=["GET"])
+@jwt_required()
+def click_pipeline_stats():
+    try:
+        return return_response(
+            HttpStatus.OK,
+            status=StatusRes.SUCCESS,
+            message="Click Pipeline Stats",
+            data=pipeline_metrics(),
+        )
+    except Exception as e:
+        logger.exception("traceback@admin_blp/click_pipeline_stats")
+        logger.error(f"{e}: error@admin_blp/click_pipeline_stats")
+        return return_response(
+            HttpStatus.INTERNAL_SERVER_ERROR,
+            status=StatusRes.FAILED,
+            message="Network Error",
+        )
@@ -1,20 +1,43 @@
-from flask import Blueprint
+from flask import Blueprint, Response, request, send_file, stream_with_context
 from models.qrcode import QrcodeRecord, QRCodeData
 from models.shorten_url import Urlshort, UrlShortenerClicks
 from status_res import StatusRes
 from extensions import db, limiter
 from utils import return_response, user_id_limiter
 from flask_jwt_extended import jwt_required, current_user
+import uuid
 from datetime import datetime
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from decorators import email_verified
 from logger import logger
-from sqlalchemy import extract
+from func import month_bounds
 from http_status import HttpStatus
+from models.short_code import ShortCode
+from bot_filter import bots_by_day, user_bots_by_day
+from unique_visitors import (
+    link_scope,
+    unique_between,
+    unique_by_day,
+    user_scope,
+)
 from crud import (
     get_top_7_qrcodes,
     get_most_clicked_url_short,
     get_top_location_qrcodes,
     get_top_location_short_url,
+    get_url_clicks_in_range,
+    get_qrcode_clicks_in_range,
+    get_user_counters,
+    TOP_LINK_WINDOWS,
+    GRANULARITIES,
+    MAX_RANGE_DAYS,
+    get_click_timeseries,
+    EXPORT_FORMATS,
+    export_path,
+    format_click_rows,
+    get_export_job,
+    iter_click_rows,
+    set_export_job,
 )
 
 ANALYTICS_PREFIX = "analytics"
@@ -22,6 +45,39 @@ ANALYTICS_PREFIX = "analytics"
 analytics_blp = Blueprint("analytics_blp", __name__)
 
 
+def unique_per_date(scope, start, end):
+    # unique visitors keyed like the daily click entries
+    return {
+        day.strftime("%d-%b-%Y"): count
+        for day, count in unique_by_day(scope, start, end).items()
+    }
+
+
+def bots_per_date(kind, target_ids, start, end):
+    # bot hits keyed like the daily click entries, days without any left out
+    return {
+        day.strftime("%d-%b-%Y"): count
+        for day, count in bots_by_day(kind, target_ids, start, end).items()
+        if count
+    }
+
+
+def user_bots_per_date(kind, user_id, start, end):
+    # same as bots_per_date for every link of kind of the user
+    return {
+        day.strftime("%d-%b-%Y"): count
+        for day, count in user_bots_by_day(kind, user_id, start, end).items()
+        if count
+    }
+
+
+def by_date(per_date):
+    # (date, value) pairs in date order, bot-only days are added unordered
+    return sorted(
+        per_date.items(), key=lambda item: datetime.strptime(item[0], "%d-%b-%Y")
+    )
+
+
 @analytics_blp.route(f"/{ANALYTICS_PREFIX}/all", methods=["GET"])
 @jwt_required()
 @email_verified
@@ -29,39 +85,26 @@ analytics_blp = Blueprint("analytics_blp", __name__)
 def get_all_analytics():
     try:
         user_id = current_user.id
+        top_window = request.args.get("top_window", "all")
+        if top_window not in TOP_LINK_WINDOWS:
+            return return_response(
+                HttpStatus.BAD_REQUEST,
+                status=StatusRes.FAILED,
+                message=f"top_window must be one of {', '.join(TOP_LINK_WINDOWS)}",
+            )
 
         # Prepare data for the charts
-        qr_codes = QRCodeData.query.filter_by(user_id=user_id).all()
+        counters = get_user_counters(user_id)
         # bio_pages = CreateBioPage.query.filter_by(user_id=user_id).all()
-        url_shorts = Urlshort.query.filter_by(user_id=user_id).all()
 
-        current_month = datetime.now().month
-        current_year = datetime.now().year
+        start, end = month_bounds(datetime.now())
 
         # Query to get clicks for each day of the current month and year
-        clicks_per_month_s = (
-            UrlShortenerClicks.query.join(
-                Urlshort, Urlshort.id == UrlShortenerClicks.url_id
-            )
-            .filter(
-                Urlshort.user_id == current_user.id,
-                extract("month", UrlShortenerClicks.created) == current_month,
-                extract("year", UrlShortenerClicks.created) == current_year,
-            )
-            .all()
-        )
+        clicks_per_month_s = get_url_clicks_in_range(current_user.id, start, end).all()
 
-        click_per_month_qrcode_s = (
-            QrcodeRecord.query.join(
-                QRCodeData, QRCodeData.id == QrcodeRecord.qr_code_id
-            )
-            .filter(
-                QRCodeData.user_id == current_user.id,
-                extract("month", QrcodeRecord.date) == current_month,
-                extract("year", QrcodeRecord.date) == current_year,
-            )
-            .all()
-        )
+        click_per_month_qrcode_s = get_qrcode_clicks_in_range(
+            current_user.id, start, end
+        ).all()
 
         # click_per_month_bio_s = (
         #     BioPageClicks.query.join(
@@ -79,20 +122,12 @@ def get_all_analytics():
         res2_dict = {}
         res3_dict = {}
         for clicks_per_month in clicks_per_month_s:
-            res_dict[clicks_per_month.created.strftime("%d-%b-%Y")] = (
-                clicks_per_month.count
-                if not res_dict.get(clicks_per_month.created.strftime("%d-%b-%Y"))
-                else res_dict[clicks_per_month.created.strftime("%d-%b-%Y")]
-                + clicks_per_month.count
-            )
+            day = clicks_per_month.created.strftime("%d-%b-%Y")
+            res_dict[day] = res_dict.get(day, 0) + clicks_per_month.count
 
         for clicks_per_month in click_per_month_qrcode_s:
-            res2_dict[clicks_per_month.date.strftime("%d-%b-%Y")] = (
-                clicks_per_month.clicks
-                if not res2_dict.get(clicks_per_month.date.strftime("%d-%b-%Y"))
-                else res2_dict[clicks_per_month.date.strftime("%d-%b-%Y")]
-                + clicks_per_month.clicks
-            )
+            day = clicks_per_month.date.strftime("%d-%b-%Y")
+            res2_dict[day] = res2_dict.get(day, 0) + clicks_per_month.clicks
 
         # for clicks_per_month in click_per_month_bio_s:
         #     res3_dict[clicks_per_month.created.strftime("%d-%b-%Y")] = (
@@ -101,19 +136,34 @@ def get_all_analytics():
         #         else res3_dict[clicks_per_month.created.strftime("%d-%b-%Y")]
         #              + clicks_per_month.count
         #     )
+        url_scope = user_scope(ShortCode.SHORT_URL, user_id)
+        qr_scope = user_scope(ShortCode.QRCODE, user_id)
+        url_uniques = unique_per_date(url_scope, start, end)
+        qr_uniques = unique_per_date(qr_scope, start, end)
+        url_bots = user_bots_per_date(ShortCode.SHORT_URL, user_id, start, end)
+        qr_bots = user_bots_per_date(ShortCode.QRCODE, user_id, start, end)
+        # days only crawlers visited still show up, with no human click
+        for key in url_bots:
+            res_dict.setdefault(key, 0)
+        for key in qr_bots:
+            res2_dict.setdefault(key, 0)
         res = [
             {
                 "date": key,
                 "clicks": val,
+                "unique_clicks": url_uniques.get(key, 0),
+                "bot_clicks": url_bots.get(key, 0),
             }
-            for key, val in res_dict.items()
+            for key, val in by_date(res_dict)
         ]
         res2 = [
             {
                 "date": key,
                 "clicks": val,
+                "unique_clicks": qr_uniques.get(key, 0),
+                "bot_clicks": qr_bots.get(key, 0),
             }
-            for key, val in res2_dict.items()
+            for key, val in by_date(res2_dict)
         ]
         # res3 = [
         #     {
@@ -124,13 +174,13 @@ def get_all_analytics():
         # ]
 
         # Prepare data for the charts
-        qr_code_clicks = sum(qr_code.clicks for qr_code in qr_codes)
+        qr_code_clicks = counters["qr_code_clicks"]
         # bio_page_clicks = sum(bio_page.clicks for bio_page in bio_pages)
-        url_short_clicks = sum(url_short.clicks for url_short in url_shorts)
+        url_short_clicks = counters["short_url_clicks"]
 
-        qr_code_generated = len(qr_codes)
+        qr_code_generated = counters["qr_codes"]
         # bio_pages_generated = len(bio_pages)
-        url_shorts_generated = len(url_shorts)
+        url_shorts_generated = counters["short_links"]
         return return_response(
             HttpStatus.OK,
             status=StatusRes.SUCCESS,
@@ -140,6 +190,10 @@ def get_all_analytics():
                     "qr_code_clicks": qr_code_clicks,
                     # "bio_page_clicks": bio_page_clicks,
                     "url_short_clicks": url_short_clicks,
+                    "qr_code_unique_clicks": unique_between(qr_scope, start, end),
+                    "url_short_unique_clicks": unique_between(url_scope, start, end),
+                    "qr_code_bot_clicks": sum(qr_bots.values()),
+                    "url_short_bot_clicks": sum(url_bots.values()),
                     "qr_code_generated": qr_code_generated,
                     # "bio_pages_generated": bio_pages_generated,
                     "url_shorts_generated": url_shorts_generated,
@@ -151,8 +205,12 @@ def get_all_analytics():
                     "short_url_location_history": get_top_location_short_url(
                         current_user.id
                     ),
-                    "top_7_qrcodes": get_top_7_qrcodes(current_user.id),
-                    "top_7_shorts": get_most_clicked_url_short(current_user.id),
+                    "top_7_qrcodes": get_top_7_qrcodes(
+                        current_user.id, window=top_window
+                    ),
+                    "top_7_shorts": get_most_clicked_url_short(
+                        current_user.id, window=top_window
+                    ),
                     # "res3": res3,
                 }
             },
@@ -177,35 +235,36 @@ def get_all_analytics():
 @limiter.limit("5 per minute", key_func=user_id_limiter)
 def qrcode_analytics(qr_code_id):
     try:
-        current_month = datetime.now().month
-        current_year = datetime.now().year
+        start, end = month_bounds(datetime.now())
 
         res2_dict = {}
-        click_per_month_qrcode_s = (
-            QrcodeRecord.query.join(
-                QRCodeData, QRCodeData.id == QrcodeRecord.qr_code_id
-            )
-            .filter(
-                QRCodeData.user_id == current_user.id,
-                QRCodeData.id == qr_code_id,
-                extract("month", QrcodeRecord.date) == current_month,
-                extract("year", QrcodeRecord.date) == current_year,
-            )
-            .all()
-        )
+        click_per_month_qrcode_s = get_qrcode_clicks_in_range(
+            current_user.id, start, end, qr_code_id
+        ).all()
         for clicks_per_month in click_per_month_qrcode_s:
-            res2_dict[clicks_per_month.date.strftime("%d-%b-%Y")] = (
-                clicks_per_month.clicks
-                if not res2_dict.get(clicks_per_month.date.strftime("%d-%b-%Y"))
-                else res2_dict[clicks_per_month.date.strftime("%d-%b-%Y")]
-                + clicks_per_month.clicks
-            )
+            day = clicks_per_month.date.strftime("%d-%b-%Y")
+            res2_dict[day] = res2_dict.get(day, 0) + clicks_per_month.clicks
+        # visitor counts are keyed by link only, check the link is the user's
+        owned = (
+            db.session.query(QRCodeData.id)
+            .filter_by(id=qr_code_id, user_id=current_user.id)
+            .scalar()
+        )
+        scope = link_scope(ShortCode.QRCODE, qr_code_id)
+        uniques = unique_per_date(scope, start, end) if owned else {}
+        bots = bots_per_date(
+            ShortCode.QRCODE, [qr_code_id] if owned else [], start, end
+        )
+        for key in bots:
+            res2_dict.setdefault(key, 0)
         res2 = [
             {
                 "date": key,
                 "clicks": val,
+                "unique_clicks": uniques.get(key, 0),
+                "bot_clicks": bots.get(key, 0),
             }
-            for key, val in res2_dict.items()
+            for key, val in by_date(res2_dict)
         ]
         return return_response(
             HttpStatus.OK,
@@ -217,6 +276,10 @@ def qrcode_analytics(qr_code_id):
                         current_user.id, qr_code_id
                     ),
                     "qr_code_analytics": res2,
+                    "unique_clicks": (
+                        unique_between(scope, start, end) if owned else 0
+                    ),
+                    "bot_clicks": sum(bots.values()),
                     # "top_7_qrcodes": get_top_7_qrcodes(current_user.id, qr_code_id),
                 }
             },
@@ -241,35 +304,36 @@ def qrcode_analytics(qr_code_id):
 @limiter.limit("5 per minute", key_func=user_id_limiter)
 def short_url_analytics(short_id):
     try:
-        current_month = datetime.now().month
-        current_year = datetime.now().year
+        start, end = month_bounds(datetime.now())
 
-        clicks_per_month_s = (
-            UrlShortenerClicks.query.join(
-                Urlshort, Urlshort.id == UrlShortenerClicks.url_id
-            )
-            .filter(
-                Urlshort.user_id == current_user.id,
-                Urlshort.id == short_id,
-                extract("month", UrlShortenerClicks.created) == current_month,
-                extract("year", UrlShortenerClicks.created) == current_year,
-            )
-            .all()
-        )
+        clicks_per_month_s = get_url_clicks_in_range(
+            current_user.id, start, end, short_id
+        ).all()
         res_dict = {}
         for clicks_per_month in clicks_per_month_s:
-            res_dict[clicks_per_month.created.strftime("%d-%b-%Y")] = (
-                clicks_per_month.count
-                if not res_dict.get(clicks_per_month.created.strftime("%d-%b-%Y"))
-                else res_dict[clicks_per_month.created.strftime("%d-%b-%Y")]
-                + clicks_per_month.count
-            )
+            day = clicks_per_month.created.strftime("%d-%b-%Y")
+            res_dict[day] = res_dict.get(day, 0) + clicks_per_month.count
+        # visitor counts are keyed by link only, check the link is the user's
+        owned = (
+            db.session.query(Urlshort.id)
+            .filter_by(id=short_id, user_id=current_user.id)
+            .scalar()
+        )
+        scope = link_scope(ShortCode.SHORT_URL, short_id)
+        uniques = unique_per_date(scope, start, end) if owned else {}
+        bots = bots_per_date(
+            ShortCode.SHORT_URL, [short_id] if owned else [], start, end
+        )
+        for key in bots:
+            res_dict.setdefault(key, 0)
         res = [
             {
                 "date": key,
                 "clicks": val,
+                "unique_clicks": uniques.get(key, 0),
+                "bot_clicks": bots.get(key, 0),
             }
-            for key, val in res_dict.items()
+            for key, val in by_date(res_dict)
         ]
         return return_response(
             HttpStatus.OK,
@@ -281,6 +345,10 @@ def short_url_analytics(short_id):
                         current_user.id, short_id
                     ),
                     "short_url_analytics": res,
+                    "unique_clicks": (
+                        unique_between(scope, start, end) if owned else 0
+                    ),
+                    "bot_clicks": sum(bots.values()),
                     # "top_7_shorts": get_most_clicked_url_short(
                     #     current_user.id, short_id
                     # ),
@@ -296,3 +364,249 @@ def short_url_analytics(short_id):
             status=StatusRes.FAILED,
             message="Network Error",
         )
+
+
+# clicks over any range, per hour/day/week/month
+@analytics_blp.route(f"/{ANALYTICS_PREFIX}/timeseries", methods=["GET"])
+@jwt_required()
+@email_verified
+@limiter.limit("10 per minute", key_func=user_id_limiter)
+def click_timeseries():
+    try:
+        target = request.args.get("target", ShortCode.SHORT_URL)
+        target_id = request.args.get("id")
+        granularity = request.args.get("granularity", "day")
+        tz = request.args.get("tz", "UTC")
+        if target not in (ShortCode.SHORT_URL, ShortCode.QRCODE):
+            return return_response(
+                HttpStatus.BAD_REQUEST,
+                status=StatusRes.FAILED,
+                message="target must be short_url or qrcode",
+            )
+        if granularity not in GRANULARITIES:
+            return return_response(
+                HttpStatus.BAD_REQUEST,
+                status=StatusRes.FAILED,
+                message=f"granularity must be one of {', '.join(GRANULARITIES)}",
+            )
+        try:
+            ZoneInfo(tz)
+        except (ZoneInfoNotFoundError, ValueError):
+            return return_response(
+                HttpStatus.BAD_REQUEST,
+                status=StatusRes.FAILED,
+                message="Invalid timezone",
+            )
+        # the daily tables only know utc days, weeks and months are built
+        # from them
+        if granularity != "hour" and tz != "UTC":
+            return return_response(
+                HttpStatus.BAD_REQUEST,
+                status=StatusRes.FAILED,
+                message="tz is only supported with granularity=hour, "
+                "day, week and month series are in UTC",
+            )
+        try:
+            start = datetime.strptime(request.args["start"], "%Y-%m-%d").date()
+            end = datetime.strptime(request.args["end"], "%Y-%m-%d").date()
+        except (KeyError, ValueError):
+            return return_response(
+                HttpStatus.BAD_REQUEST,
+                status=StatusRes.FAILED,
+                message="start and end are required as YYYY-MM-DD",
+            )
+        if end < start or (end - start).days >= MAX_RANGE_DAYS[granularity]:
+            return return_response(
+                HttpStatus.BAD_REQUEST,
+                status=StatusRes.FAILED,
+                message=f"a series by {granularity} covers 1 to "
+                f"{MAX_RANGE_DAYS[granularity]} days",
+            )
+        series = get_click_timeseries(
+            target, current_user.id, start, end, granularity, tz, target_id
+        )
+        return return_response(
+            HttpStatus.OK,
+            status=StatusRes.SUCCESS,
+            message="Success",
+            **{
+                "analytics": {
+                    "target": target,
+                    "granularity": granularity,
+                    "timezone": tz,
+                    "start": start.isoformat(),
+                    "end": end.isoformat(),
+                    "total_clicks": sum(point["clicks"] for point in series),
+                    "series": series,
+                }
+            },
+        )
+    except Exception as e:
+        logger.exception("traceback@analytics_blp/click_timeseries")
+        logger.error(f"{e}: error@analytics_blp/click_timeseries")
+        db.session.rollback()
+        return return_response(
+            HttpStatus.INTERNAL_SERVER_ERROR,
+            status=StatusRes.FAILED,
+            message="Network Error",
+        )
+
+
+EXPORT_MIMETYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+def export_args():
+    # (args, None) or (None, error response) for the export endpoints
+    fmt = request.args.get("format", "csv")
+    target = request.args.get("target", ShortCode.SHORT_URL)
+    if fmt not in EXPORT_FORMATS:
+        return None, return_response(
+            HttpStatus.BAD_REQUEST,
+            status=StatusRes.FAILED,
+            message=f"format must be one of {', '.join(EXPORT_FORMATS)}",
+        )
+    if target not in (ShortCode.SHORT_URL, ShortCode.QRCODE):
+        return None, return_response(
+            HttpStatus.BAD_REQUEST,
+            status=StatusRes.FAILED,
+            message="target must be short_url or qrcode",
+        )
+    try:
+        start, end = (
+            (
+                datetime.strptime(request.args[name], "%Y-%m-%d").date()
+                if request.args.get(name)
+                else None
+            )
+            for name in ("start", "end")
+        )
+    except ValueError:
+        return None, return_response(
+            HttpStatus.BAD_REQUEST,
+            status=StatusRes.FAILED,
+            message="start and end must be YYYY-MM-DD",
+        )
+    return {
+        "fmt": fmt,
+        "target_type": target,
+        "start": start,
+        "end": end,
+        "link_id": request.args.get("id"),
+    }, None
+
+
+# raw click log, streamed as it is read
+@analytics_blp.route(f"/{ANALYTICS_PREFIX}/export", methods=["GET"])
+@jwt_required()
+@email_verified
+@limiter.limit("2 per minute", key_func=user_id_limiter)
+def export_click_log():
+    try:
+        args, error = export_args()
+        if error:
+            return error
+        rows = iter_click_rows(
+            args["target_type"],
+            current_user.id,
+            args["start"],
+            args["end"],
+            args["link_id"],
+        )
+        filename = f"clicks-{args['target_type']}.{args['fmt']}"
+        return Response(
+            stream_with_context(format_click_rows(rows, args["fmt"])),
+            mimetype=EXPORT_MIMETYPES[args["fmt"]],
+            headers={"Content-Disposition": f"attachment; filename={filename}"},
+        )
+    except Exception as e:
+        logger.exception("traceback@analytics_blp/export_click_log")
+        logger.error(f"{e}: error@analytics_blp/export_click_log")
+        db.session.rollback()
+        return return_response(
+            HttpStatus.INTERNAL_SERVER_ERROR,
+            status=StatusRes.FAILED,
+            message="Network Error",
+        )
+
+
+# same export written to a gzip file by a worker
+@analytics_blp.route(f"/{ANALYTICS_PREFIX}/export/jobs", methods=["POST"])
+@jwt_required()
+@email_verified
+@limiter.limit("2 per minute", key_func=user_id_limiter)
+def create_click_export():
+    try:
+        from celery_config.utils.celery_works import export_clicks
+
+        args, error = export_args()
+        if error:
+            return error
+        job_id = uuid.uuid4().hex
+        set_export_job(
+            job_id, status="queued", user_id=current_user.id, format=args["fmt"]
+        )
+        export_clicks.delay(
+            job_id,
+            current_user.id,
+            args["target_type"],
+            args["fmt"],
+            args["start"].isoformat() if args["start"] else None,
+            args["end"].isoformat() if args["end"] else None,
+            args["link_id"],
+        )
+        return return_response(
+            HttpStatus.ACCEPTED,
+            status=StatusRes.SUCCESS,
+            message="Export started",
+            data={"job_id": job_id},
+        )
+    except Exception as e:
+        logger.exception("traceback@analytics_blp/create_click_export")
+        logger.error(f"{e}: error@analytics_blp/create_click_export")
+        return return_response(
+            HttpStatus.INTERNAL_SERVER_ERROR,
+            status=StatusRes.FAILED,
+            message="Network Error",
+        )
+
+
+@analytics_blp.route(
+    f"/{ANALYTICS_PREFIX}/export/jobs/<string:job_id>", methods=["GET"]
+)
+@jwt_required()
+@email_verified
+def click_export_status(job_id):
+    try:
+        job = get_export_job(job_id, current_user.id)
+        if not job:
+            return return_response(
+                HttpStatus.NOT_FOUND,
+                status=StatusRes.FAILED,
+                message="Export not found",
+            )
+        if request.args.get("download") and job.get("status") == "done":
+            return send_file(
+                export_path(job_id, job["format"]),
+                mimetype="application/gzip",
+                as_attachment=True,
+                download_name=f"clicks.{job['format']}.gz",
+            )
+        return return_response(
+            HttpStatus.OK,
+            status=StatusRes.SUCCESS,
+            message="Success",
+            data={
+                "job_id": job_id,
+                "status": job.get("status"),
+                "format": job.get("format"),
+                "size": int(job.get("size", 0)),
+            },
+        )
+    except Exception as e:
+        logger.exception("traceback@analytics_blp/click_export_status")
+        logger.error(f"{e}: error@analytics_blp/click_export_status")
+        return return_response(
+            HttpStatus.INTERNAL_SERVER_ERROR,
+            status=StatusRes.FAILED,
+            message="Network Error",
+        )
@@ -29,6 +29,7 @@ from extensions import db
 from logger import logger
 from flask_jwt_extended import current_user, jwt_required
 from connection.redis_connection import redis_conn
+from link_cache import invalidate_gift_link
 import json
 from models.giftlink import GiftType
 
@@ -645,8 +646,10 @@ def delete_gift_link(gift_link_id):
                 message="Gift link not found",
             )
 
+        slug = git_link.slug
         db.session.delete(git_link)
         db.session.commit()
+        invalidate_gift_link(slug)
         return return_response(
             HttpStatus.OK,
             status=StatusRes.SUCCESS,
@@ -13,16 +13,21 @@ from crud import (
     duplicate_qr_code,
     check_short_url_exist,
     validate_url,
+    delete_short_code,
+    remove_link_counters,
 )
 from extensions import db, limiter
-from utils import return_response, user_id_limiter, get_website_title
+from utils import return_response, user_id_limiter
 from flask_jwt_extended import jwt_required, current_user
 from datetime import datetime
 import pprint
 from decorators import email_verified, check_qr_code_limit, check_subscription_expired
 from logger import logger
 from connection.redis_connection import redis_conn
+from link_cache import invalidate_link
+from page_title import placeholder_title, queue_title_fetch
 import json
+import code_allocator
 
 QR_PREFIX = "qr_code"
 
@@ -129,7 +134,6 @@ def qrcode():
                         status=StatusRes.FAILED,
                         message="URL already exists in this category",
                     )
-                title = get_website_title(data.get("url")) if not title else title
 
             payload = dict(
                 url=data.get("url"),
@@ -165,12 +169,16 @@ def qrcode():
                 category=category.lower(),
                 social_media=social_media,
                 qr_style=qr_style,
-                title=title
-                or f"Untitled {datetime.now().strftime('%Y-%m-%d %I:%M:%S')}",
+                title=title or placeholder_title(),
                 qr_frame=qr_frame,
             )
 
-            save_qrcode_data(payload, current_user.id)
+            qrcode_data = save_qrcode_data(payload, current_user.id)
+            if data.get("url") and not title:
+                # the page title is fetched by a worker once the qr code exists
+                queue_title_fetch(
+                    "qrcode", qrcode_data.id, qrcode_data.url, qrcode_data.title
+                )
 
             return return_response(
                 HttpStatus.CREATED,
@@ -476,10 +484,14 @@ def delete_qrcode(qr_code_id):
                 message="To delete this QR Code, please delete the short URL related to it",
             )
 
+        short_code = res.short_url
+        delete_short_code(short_code)
+        remove_link_counters(res)
         db.session.delete(res)
         db.session.commit()
 
         redis_conn.delete(f"qrcode:{current_user.id}:{qr_code_id}")
+        invalidate_link(short_code)
 
         return return_response(
             HttpStatus.OK, status=StatusRes.SUCCESS, message="QR Code Deleted"
@@ -513,7 +525,7 @@ def duplicate_a_qrcode():
 
         if short_url:
             resp = check_short_url_exist(short_url)
-            if resp:
+            if resp or code_allocator.is_reserved(short_url):
                 return return_response(
                     HttpStatus.BAD_REQUEST,
                     status=StatusRes.FAILED,
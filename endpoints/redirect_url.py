@@ -1,13 +1,12 @@
-from flask import Blueprint, redirect, request
-from crud import (
-    get_original_url_by_short_url,
-    get_url_by_short_url,
-    get_unauth_url_by_short_url,
-)
+from flask import Blueprint, current_app, redirect, request
+from crud import resolve_short_url
 import os
-from utils import get_info, get_browser_info, get_computer_name
-import httpagentparser
-from connection.redis_connection import redis_conn
+from utils import get_info
+from user_agent import classify
+from link_cache import get_link, set_link
+from click_stream import publish_click
+from bot_filter import is_bot, record_bot_hit
+import code_filter
 
 redirect_url_blp = Blueprint("redirect_url_blp", __name__)
 
@@ -22,40 +21,42 @@ def redirect_base_url():
 
 @redirect_url_blp.route("/<short_url>", methods=["GET"])
 def redirect_url(short_url):
-    from celery_config.utils.celery_works import save_clicks_for_analytics
-
     print(short_url, "short_url")
 
+    # codes that certainly do not exist never reach the cache, the database
+    # or the click stream
+    code_filter.start(current_app._get_current_object())
+    if not code_filter.might_exist(short_url):
+        return redirect(DEFAULT_REDIRECT_URL)
+
     user_ip = request.headers.get("x-forwarded-for", request.remote_addr)
 
     ip, city, country = get_info(user_ip)
-    browser_name = get_browser_info(request)
-    user_agent = request.headers.get("User-Agent")
-    # computer_name = get_computer_name()
-    computer_name = httpagentparser.detect(user_agent)["platform"]["name"]
+    agent = classify(request.headers.get("User-Agent"))
     payload = {
         "ip_address": ip,
         "city": city,
         "country": country,
-        "browser_name": browser_name,
-        "device": computer_name,
+        "browser_name": agent.browser,
+        "device": agent.os,
     }
     print(payload, "redirect payload")
 
-    key = f"redirect:{short_url}"
-    # get from redis
-    url = redis_conn.get(key)
-    if not url:
-        url = (
-            get_url_by_short_url(short_url)
-            or get_original_url_by_short_url(short_url)
-            or get_unauth_url_by_short_url(short_url)
-        )
-        redis_conn.set(key, short_url, 3000)
+    link = get_link(short_url)
+    if link is None:
+        link = resolve_short_url(short_url)
+        set_link(short_url, link)
 
+    url = link.get("url") if link else None
     print(url, "url")
 
-    save_clicks_for_analytics.delay(short_url, payload)
+    if url:
+        # crawlers and monitors only bump a counter, they never reach the
+        # click stream nor the analytics tables
+        if is_bot(agent, ip):
+            record_bot_hit(link["kind"], link["id"], link.get("user_id"))
+        else:
+            publish_click(link["kind"], link["id"], payload)
 
     # Redirect to the found URL or the default URL if not found
     return redirect(url if url else DEFAULT_REDIRECT_URL)
@@ -1,4 +1,4 @@
-from flask import Blueprint, request
+from flask import Blueprint, g, request
 from http_status import HttpStatus
 from status_res import StatusRes
 from crud import (
@@ -6,7 +6,23 @@ from crud import (
     save_want_qr_code,
     get_shorten_url_for_user,
     check_short_url_exist,
+    check_url_exists,
+    save_shorten_url,
+    rename_short_code,
+    sync_short_code,
+    delete_short_code,
+    remove_link_counters,
+    BULK_MAX_URLS,
+    get_bulk_job,
+    parse_bulk_csv,
+    parse_bulk_json,
+    release_short_links,
+    reserve_short_links,
+    reserved_short_links,
+    set_bulk_job,
+    validate_bulk_rows,
 )
+from models.short_code import ShortCode
 from models.shorten_url import Urlshort
 from extensions import db, limiter
 from utils import (
@@ -15,14 +31,17 @@ from utils import (
     gen_short_code,
 )
 from logger import logger
-from datetime import datetime
+from sqlalchemy.exc import IntegrityError
 
 # from api_services import send_mail
 from decorators import email_verified, check_shortlink_limit, check_subscription_expired
 from flask_jwt_extended import current_user, jwt_required
-from utils import get_website_title
 from connection.redis_connection import redis_conn
+from link_cache import invalidate_link
+from page_title import placeholder_title, queue_title_fetch
 import json
+import uuid
+import code_allocator
 
 USER_PREFIX = "url_shortener"
 
@@ -64,7 +83,7 @@ def shorten_url():
                 message="want_qr_code must be a boolean value",
             )
 
-        if Urlshort.query.filter_by(user_id=current_user.id, url=original_url).first():
+        if check_url_exists(original_url, current_user.id):
             return return_response(
                 HttpStatus.CONFLICT,
                 status=StatusRes.FAILED,
@@ -81,7 +100,10 @@ def shorten_url():
             logger.info(f"custom_url: {custom_url}")
             short_url = custom_url
             has_half_back = True
-            if Urlshort.query.filter_by(short_url=short_url).first():
+            # codes the allocator hands out are kept for it
+            if check_short_url_exist(short_url) or code_allocator.is_reserved(
+                short_url
+            ):
                 return return_response(
                     HttpStatus.CONFLICT,
                     status=StatusRes.FAILED,
@@ -91,26 +113,37 @@ def shorten_url():
             has_half_back = False
             short_url = gen_short_code(url_short=True)
 
-        if not title:
-            title = (
-                get_website_title(original_url)
-                or f"Untitled {datetime.now().strftime('%Y-%m-%d %I:%M:%S')}"
+        # the page title is fetched by a worker once the link exists
+        fetch_title = not title
+        if fetch_title:
+            title = placeholder_title()
+        try:
+            url = save_shorten_url(
+                original_url,
+                short_url,
+                title,
+                want_qr_code,
+                current_user.id,
+                has_half_back=has_half_back,
             )
-        url = Urlshort(
-            user_id=current_user.id,
-            url=original_url,
-            short_url=short_url,
-            title=title,
-            want_qr_code=want_qr_code,
-            has_half_back=has_half_back,
-        )
-        url.save()
+        except IntegrityError:
+            # the registry rejected a code taken by another link in the meantime
+            db.session.rollback()
+            return return_response(
+                HttpStatus.CONFLICT,
+                status=StatusRes.FAILED,
+                message="You cannot use this custom url, please choose another one",
+            )
+        # drop a negative entry left by an earlier probe of this code
+        invalidate_link(short_url)
 
         if want_qr_code:
             logger.info("want_qr_code")
             save_want_qr_code(
                 "url", short_url, url.id, original_url, current_user.id, title
             )
+        if fetch_title:
+            queue_title_fetch("short_url", url.id, original_url, title)
 
         return return_response(
             HttpStatus.CREATED,
@@ -129,6 +162,118 @@ def shorten_url():
         )
 
 
+# create many short urls from a json array or a csv upload, in a worker
+@url_short_blp.route(f"{USER_PREFIX}/short_url/bulk", methods=["POST"])
+@jwt_required()
+@email_verified
+@check_subscription_expired
+@check_shortlink_limit
+@limiter.limit("5 per minute", key_func=user_id_limiter)
+def bulk_shorten_urls():
+    try:
+        from celery_config.utils.celery_works import create_bulk_short_urls
+
+        upload = request.files.get("file")
+        if upload:
+            rows = parse_bulk_csv(upload.stream)
+            want_qr_code = request.form.get("want_qr_code", "").lower() == "true"
+        else:
+            data = request.get_json(silent=True)
+            if isinstance(data, dict):
+                want_qr_code = bool(data.get("want_qr_code", False))
+                data = data.get("urls")
+            else:
+                want_qr_code = False
+            rows = parse_bulk_json(data)
+        if not rows:
+            return return_response(
+                HttpStatus.BAD_REQUEST,
+                status=StatusRes.FAILED,
+                message="Send a list of urls or a csv file",
+            )
+        if len(rows) > BULK_MAX_URLS:
+            return return_response(
+                HttpStatus.BAD_REQUEST,
+                status=StatusRes.FAILED,
+                message=f"At most {BULK_MAX_URLS} urls can be shortened at once",
+            )
+        rows, errors = validate_bulk_rows(rows)
+        if errors:
+            return return_response(
+                HttpStatus.BAD_REQUEST,
+                status=StatusRes.FAILED,
+                message="Invalid URL",
+                data=errors,
+            )
+        # the whole batch is reserved at once, the job gives back what it skips
+        if not reserve_short_links(current_user.id, len(rows), g.shortlinks_left):
+            left = max(g.shortlinks_left - reserved_short_links(current_user.id), 0)
+            return return_response(
+                HttpStatus.FORBIDDEN,
+                status=StatusRes.FAILED,
+                message=f"You can only create {left} more shortlinks this month.",
+            )
+        job_id = uuid.uuid4().hex
+        try:
+            set_bulk_job(
+                job_id, status="queued", user_id=current_user.id, total=len(rows)
+            )
+            create_bulk_short_urls.delay(job_id, current_user.id, rows, want_qr_code)
+        except Exception:
+            release_short_links(current_user.id, len(rows))
+            raise
+        return return_response(
+            HttpStatus.ACCEPTED,
+            status=StatusRes.SUCCESS,
+            message="Bulk creation started",
+            data={"job_id": job_id, "total": len(rows)},
+        )
+    except Exception as e:
+        logger.exception("traceback@user_blp/bulk_shorten_urls")
+        logger.error(f"{e}: error@user_blp/bulk_shorten_urls")
+        return return_response(
+            HttpStatus.INTERNAL_SERVER_ERROR,
+            status=StatusRes.FAILED,
+            message="Network Error",
+        )
+
+
+@url_short_blp.route(f"{USER_PREFIX}/short_url/bulk/<string:job_id>", methods=["GET"])
+@jwt_required()
+@email_verified
+def bulk_shorten_status(job_id):
+    try:
+        job = get_bulk_job(job_id, current_user.id)
+        if not job:
+            return return_response(
+                HttpStatus.NOT_FOUND,
+                status=StatusRes.FAILED,
+                message="Bulk job not found",
+            )
+        return return_response(
+            HttpStatus.OK,
+            status=StatusRes.SUCCESS,
+            message="Success",
+            data={
+                "job_id": job_id,
+                "status": job.get("status"),
+                "total": int(job.get("total", 0)),
+                "done": int(job.get("done", 0)),
+                "links": json.loads(job.get("links") or "[]"),
+                "skipped": int(job.get("skipped", 0)),
+                "duplicates": json.loads(job.get("duplicates") or "[]"),
+            },
+        )
+    except Exception as e:
+        logger.exception("traceback@user_blp/bulk_shorten_status")
+        logger.error(f"{e}: error@user_blp/bulk_shorten_status")
+        return return_response(
+            HttpStatus.INTERNAL_SERVER_ERROR,
+            status=StatusRes.FAILED,
+            message="Network Error",
+        )
+
+
 # get shortened urls
 @url_short_blp.route(f"{USER_PREFIX}/short_urls", methods=["GET"])
 @jwt_required()
@@ -249,8 +394,12 @@ def edit_short_url(short_url_id):
                     status=StatusRes.FAILED,
                     message="You cannot delete this short url",
                 )
+            short_code = short_url.short_url
+            delete_short_code(short_code)
+            remove_link_counters(short_url)
             short_url.delete()
             redis_conn.delete(f"short_url:{current_user.id}:{short_url_id}")
+            invalidate_link(short_code)
             return return_response(
                 HttpStatus.OK, status=StatusRes.SUCCESS, message="Short URL deleted"
             )
@@ -260,13 +409,19 @@ def edit_short_url(short_url_id):
 
         if short_link:
             resp = check_short_url_exist(short_link)
-            if resp and short_url.short_url != short_link:
+            # the link's own row comes back for a case-only rename
+            own = resp and (resp.kind, resp.target_id) == (
+                ShortCode.SHORT_URL,
+                short_url.id,
+            )
+            if not own and (resp or code_allocator.is_reserved(short_link)):
                 return return_response(
                     HttpStatus.BAD_REQUEST,
                     status=StatusRes.FAILED,
                     message="You cannot use this custom url, please choose another one",
                 )
 
+        old_short_link = short_url.short_url
         short_url.title = title or short_url.title
         short_url.short_url = short_link or short_url.short_url
         short_url.has_half_back = True if short_link else short_url.has_half_back
@@ -274,6 +429,9 @@ def edit_short_url(short_url_id):
             short_url.hidden = hide
             if short_url.want_qr_code:
                 short_url.qr_code_rel.hidden = hide
+        if short_url.short_url != old_short_link:
+            rename_short_code(old_short_link, short_url.short_url)
+        sync_short_code(short_url.short_url, hidden=hide)
         # short_url.url = url
         short_url.update()
 
@@ -283,6 +441,7 @@ def edit_short_url(short_url_id):
             short_url.qr_code_rel.update()
 
         redis_conn.delete(f"short_url:{current_user.id}:{short_url_id}")
+        invalidate_link(old_short_link, short_url.short_url)
 
         return return_response(
             HttpStatus.OK, status=StatusRes.SUCCESS, message="Short URL updated"
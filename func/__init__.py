@@ -1,6 +1,12 @@
 from random import randint
+import datetime
+import hashlib
+import os
+import time
 import uuid
 
+from url_canonical import canonical_url
+
 
 def generate_otp():
     otp = randint(100000, 999999)
@@ -11,6 +17,61 @@ def hex_id():
     return str(uuid.uuid4())
 
 
+def uuid7():
+    """Time-ordered uuid (version 7): 48 bits of unix ms then 74 random bits.
+
+    Consecutive ids land next to each other in the primary key index instead
+    of at random pages like uuid4.
+    """
+    ms = time.time_ns() // 1000000
+    rand = int.from_bytes(os.urandom(10), "big")
+    value = (
+        (ms & 0xFFFFFFFFFFFF) << 80
+        | 0x7 << 76
+        | (rand >> 68) << 64
+        | 0x2 << 62
+        | (rand & 0x3FFFFFFFFFFFFFFF)
+    )
+    return str(uuid.UUID(int=value))
+
+
+def is_uuid(value):
+    try:
+        uuid.UUID(str(value))
+    except ValueError:
+        return False
+    return True
+
+
+def url_hash(url):
+    """16 byte digest of the canonical url, indexed for duplicate checks."""
+    if not url:
+        return None
+    url = canonical_url(url)
+    return hashlib.blake2b(url.strip().encode("utf-8"), digest_size=16).digest()
+
+
 # format datetime
 def format_datetime(dt):
     return dt.strftime("%d-%m-%Y %H:%M:%S")
+
+
+# midnight of the given date/datetime, daily click rows are keyed on it
+def day_start(dt):
+    if isinstance(dt, datetime.datetime):
+        dt = dt.date()
+    return datetime.datetime.combine(dt, datetime.time())
+
+
+# half-open [start, end) bounds, compare columns against them directly so
+# the (.., created) indexes can be used
+def month_bounds(dt):
+    start = datetime.datetime(dt.year, dt.month, 1)
+    if dt.month == 12:
+        return start, datetime.datetime(dt.year + 1, 1, 1)
+    return start, datetime.datetime(dt.year, dt.month + 1, 1)
+
+
+def day_bounds(dt):
+    start = day_start(dt)
+    return start, start + datetime.timedelta(days=1)
@@ -0,0 +1,199 @@
+import csv
+import ipaddress
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from logger import logger
+
+load_dotenv()
+
+GEOIP_DB_PATH = os.environ.get("GEOIP_DB_PATH", "geoip.bin")
+# how often (seconds) a worker stats the table file to pick up a refresh
+GEOIP_RELOAD_CHECK = int(os.environ.get("GEOIP_RELOAD_CHECK", 60))
+
+UNKNOWN = "Unknown"
+
+# file layout:
+#   header  -> MAGIC, v4 record count, v6 record count, locations blob size
+#   v4      -> sorted records of start(4) end(4) location index(4)
+#   v6      -> sorted records of start(16) end(16) location index(4)
+#   tail    -> json list of [country, city] pairs
+MAGIC = b"IGEO1"
+HEADER = struct.Struct(">5sIII")
+V4_WIDTH = 4
+V6_WIDTH = 16
+
+
+class GeoIPTable:
+    """Read-only range table backed by a memory-mapped file.
+
+    The file is shared between gunicorn workers through the page cache, a
+    lookup is a binary search over fixed width records.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.mtime = os.path.getmtime(path)
+        with open(path, "rb") as fh:
+            self._map = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.v4_count, self.v6_count, loc_size = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a compiled geoip table")
+
+        self.v4_offset = HEADER.size
+        self.v6_offset = self.v4_offset + self.v4_count * (V4_WIDTH * 2 + 4)
+        loc_offset = self.v6_offset + self.v6_count * (V6_WIDTH * 2 + 4)
+        self.locations = json.loads(self._map[loc_offset : loc_offset + loc_size])
+
+    def close(self):
+        self._map.close()
+
+    def _search(self, packed, offset, count, width):
+        record = width * 2 + 4
+        lo, hi = 0, count
+        # rightmost record whose start is <= packed
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = offset + mid * record
+            if self._map[pos : pos + width] <= packed:
+                lo = mid + 1
+            else:
+                hi = mid
+        if not lo:
+            return None
+        pos = offset + (lo - 1) * record
+        if packed > self._map[pos + width : pos + width * 2]:
+            return None
+        (index,) = struct.unpack_from(">I", self._map, pos + width * 2)
+        return self.locations[index]
+
+    def lookup(self, ip):
+        if ip.version == 4:
+            return self._search(ip.packed, self.v4_offset, self.v4_count, V4_WIDTH)
+        if ip.ipv4_mapped:
+            return self.lookup(ip.ipv4_mapped)
+        return self._search(ip.packed, self.v6_offset, self.v6_count, V6_WIDTH)
+
+
+_table = None
+_last_check = 0.0
+_lock = threading.Lock()
+
+
+def _load_table():
+    global _table, _last_check
+
+    now = time.monotonic()
+    if _table is not None and now - _last_check < GEOIP_RELOAD_CHECK:
+        return _table
+
+    with _lock:
+        if _table is not None and now - _last_check < GEOIP_RELOAD_CHECK:
+            return _table
+        _last_check = now
+        try:
+            mtime = os.path.getmtime(GEOIP_DB_PATH)
+        except OSError:
+            if _table is None:
+                logger.error(f"geoip table not found at {GEOIP_DB_PATH}")
+            return _table
+
+        if _table is None or mtime != _table.mtime:
+            previous = _table
+            try:
+                _table = GeoIPTable(GEOIP_DB_PATH)
+                logger.info(
+                    f"geoip table loaded: {_table.v4_count} v4 / "
+                    f"{_table.v6_count} v6 ranges"
+                )
+            except Exception as e:
+                logger.error(f"{e}: error@geoip/_load_table")
+            if previous is not None and previous is not _table:
+                # a lookup still holding it retries on the new table
+                previous.close()
+        return _table
+
+
+def lookup(ip_address):
+    """Resolve an ip address to (country, city).
+
+    Never raises, unknown or malformed addresses resolve to UNKNOWN.
+    """
+    try:
+        ip = ipaddress.ip_address(ip_address.split(",")[0].strip())
+    except (AttributeError, ValueError):
+        return UNKNOWN, UNKNOWN
+
+    table = _load_table()
+    if table is None:
+        return UNKNOWN, UNKNOWN
+
+    try:
+        location = table.lookup(ip)
+    except ValueError:
+        # the table was reloaded and closed under this lookup
+        table = _load_table()
+        location = table.lookup(ip) if table is not None else None
+    if not location:
+        return UNKNOWN, UNKNOWN
+    country, city = location
+    return country or UNKNOWN, city or UNKNOWN
+
+
+def _parse_row(row):
+    # plain "start,end,country,city" or the db-ip city lite layout
+    # "start,end,continent,country,state,city,..."
+    if len(row) >= 6:
+        return row[0], row[1], row[3], row[5]
+    return row[0], row[1], row[2], row[3]
+
+
+def compile_table(csv_path, output_path=GEOIP_DB_PATH):
+    """Compile a csv of ip ranges into the binary table read by lookup().
+
+    The output is written next to the target and renamed over it, running
+    workers pick the new table up on their next reload check.
+    """
+    locations = {}
+    v4, v6 = [], []
+
+    with open(csv_path, newline="", encoding="utf-8") as fh:
+        for row in csv.reader(fh):
+            if not row or row[0].startswith("#"):
+                continue
+            try:
+                start, end, country, city = _parse_row(row)
+                start = ipaddress.ip_address(start.strip())
+                end = ipaddress.ip_address(end.strip())
+            except (IndexError, ValueError):
+                continue
+            if start.version != end.version:
+                continue
+            loc = (country.strip(), city.strip())
+            index = locations.setdefault(loc, len(locations))
+            (v4 if start.version == 4 else v6).append((start.packed, end.packed, index))
+
+    v4.sort()
+    v6.sort()
+    loc_blob = json.dumps(list(locations), separators=(",", ":")).encode("utf-8")
+
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, "wb") as fh:
+        fh.write(HEADER.pack(MAGIC, len(v4), len(v6), len(loc_blob)))
+        for records in (v4, v6):
+            for start, end, index in records:
+                fh.write(start)
+                fh.write(end)
+                fh.write(struct.pack(">I", index))
+        fh.write(loc_blob)
+    os.replace(tmp_path, output_path)
+
+    logger.info(f"geoip table compiled: {len(v4)} v4 / {len(v6)} v6 ranges")
+    return len(v4), len(v6)
@@ -0,0 +1,127 @@
+import json
+import os
+import threading
+from collections import Counter
+
+from dotenv import load_dotenv
+
+from connection.redis_connection import redis_conn
+from logger import logger
+
+load_dotenv()
+
+RESOLUTION_CACHE_TTL = int(os.environ.get("RESOLUTION_CACHE_TTL", 3000))
+# unknown codes are remembered for a short while only, a code created right
+# after a miss is also evicted explicitly by the creation path
+RESOLUTION_NEGATIVE_TTL = int(os.environ.get("RESOLUTION_NEGATIVE_TTL", 60))
+# local counters are pushed to redis every N lookups
+STATS_FLUSH_EVERY = int(os.environ.get("RESOLUTION_STATS_FLUSH_EVERY", 100))
+
+STATS_KEY = "stats:resolution_cache"
+MISSING = {"missing": True}
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _key(short_url):
+    return f"redirect:{short_url.lower()}"
+
+
+def _gift_link_key(slug):
+    return f"user_load_gift_link:{slug}"
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+        if sum(_stats.values()) < STATS_FLUSH_EVERY:
+            return
+        pending = dict(_stats)
+        _stats.clear()
+    try:
+        pipe = redis_conn.pipeline()
+        for field, value in pending.items():
+            pipe.hincrby(STATS_KEY, field, value)
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"{e}: error@link_cache/_count")
+
+
+def get_link(short_url):
+    """Return the cached resolution for short_url.
+
+    None means a cache miss, MISSING means the code is known not to exist,
+    anything else is the dict stored by set_link.
+    """
+    try:
+        cached = redis_conn.get(_key(short_url))
+    except Exception as e:
+        logger.error(f"{e}: error@link_cache/get_link")
+        cached = None
+
+    if cached is None:
+        _count("misses")
+        return None
+
+    link = json.loads(cached)
+    _count("negative_hits" if link.get("missing") else "hits")
+    return link
+
+
+def set_link(short_url, link):
+    """Cache a resolved link, or a negative entry when link is None."""
+    try:
+        if link is None:
+            redis_conn.set(
+                _key(short_url), json.dumps(MISSING), RESOLUTION_NEGATIVE_TTL
+            )
+        else:
+            redis_conn.set(_key(short_url), json.dumps(link), RESOLUTION_CACHE_TTL)
+    except Exception as e:
+        logger.error(f"{e}: error@link_cache/set_link")
+
+
+def invalidate_link(*short_urls):
+    keys = [_key(short_url) for short_url in short_urls if short_url]
+    if not keys:
+        return
+    try:
+        redis_conn.delete(*keys)
+    except Exception as e:
+        logger.error(f"{e}: error@link_cache/invalidate_link")
+
+
+def invalidate_gift_link(*slugs):
+    keys = [_gift_link_key(slug) for slug in slugs if slug]
+    if not keys:
+        return
+    try:
+        redis_conn.delete(*keys)
+    except Exception as e:
+        logger.error(f"{e}: error@link_cache/invalidate_gift_link")
+
+
+def cache_stats():
+    """Hit/miss counters across all workers plus this worker's unflushed ones."""
+    try:
+        totals = {
+            field: int(value)
+            for field, value in redis_conn.get_connection().hgetall(STATS_KEY).items()
+        }
+    except Exception as e:
+        logger.error(f"{e}: error@link_cache/cache_stats")
+        totals = {}
+
+    with _stats_lock:
+        for field, value in _stats.items():
+            totals[field] = totals.get(field, 0) + value
+
+    lookups = sum(totals.get(field, 0) for field in ("hits", "negative_hits", "misses"))
+    hits = totals.get("hits", 0) + totals.get("negative_hits", 0)
+    return {
+        "hits": totals.get("hits", 0),
+        "negative_hits": totals.get("negative_hits", 0),
+        "misses": totals.get("misses", 0),
+        "hit_ratio": round(hits / lookups, 4) if lookups else 0,
+    }
@@ -0,0 +1,15 @@
+from extensions import db
+
+
+# dictionary of the dimension values of click rows, the click location tables
+# only hold the small integer id of each value
+class ClickDimension(db.Model):
+    __tablename__ = "click_dimensions"
+    __table_args__ = (db.UniqueConstraint("dimension", "value"),)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    # one of ClickRollup.DIMENSIONS
+    dimension = db.Column(db.String(20), nullable=False)
+    value = db.Column(db.String(250), nullable=False)
+
+    def __repr__(self):
+        return f"ClickDimension('{self.dimension}', '{self.value}')"
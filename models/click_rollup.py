@@ -0,0 +1,32 @@
+from extensions import db
+from func import hex_id
+
+
+# clicks per link, per day, per dimension value, kept up to date by ingestion
+class ClickRollup(db.Model):
+    __tablename__ = "click_rollups"
+    __table_args__ = (
+        db.UniqueConstraint("target_type", "target_id", "day", "dimension", "value"),
+    )
+    id = db.Column(db.String(50), primary_key=True, default=hex_id)
+    # ShortCode.SHORT_URL or ShortCode.QRCODE
+    target_type = db.Column(db.String(20), nullable=False)
+    target_id = db.Column(db.String(50), nullable=False)
+    # start of the day, same convention as the daily click tables
+    day = db.Column(db.DateTime, nullable=False)
+    dimension = db.Column(db.String(20), nullable=False)
+    value = db.Column(db.String(250), nullable=False)
+    clicks = db.Column(db.Integer, nullable=False, default=0)
+
+    # dimensions, mapped to the click location column they are read from
+    COUNTRY = "country"
+    CITY = "city"
+    DEVICE = "device"
+    BROWSER = "browser"
+    DIMENSIONS = (COUNTRY, CITY, DEVICE, BROWSER)
+
+    def __repr__(self):
+        return (
+            f"ClickRollup('{self.target_id}', '{self.day}', "
+            f"'{self.dimension}', '{self.value}')"
+        )
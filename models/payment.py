@@ -1,5 +1,5 @@
 from extensions import db
-from func import hex_id, format_datetime
+from func import hex_id, uuid7, format_datetime
 from datetime import datetime, timedelta
 from logger import logger
 
@@ -132,7 +132,7 @@ class Subscriptions(db.Model):
 
 class Transactions(db.Model):
     __tablename__ = "transactions"
-    id = db.Column(db.String(50), primary_key=True, default=hex_id)
+    id = db.Column(db.Uuid(as_uuid=False), primary_key=True, default=uuid7)
     user_id = db.Column(db.String(50), db.ForeignKey("users.id"))
     description = db.Column(db.Text)
     amount = db.Column(db.Float)
@@ -1,5 +1,5 @@
 from extensions import db
-from func import hex_id
+from func import hex_id, url_hash, uuid7
 from sqlalchemy import func
 from flask import request
 
@@ -35,8 +35,15 @@ class QRCodeCategories(db.Model):
 
 class QRCodeData(db.Model):
     __tablename__ = "qrcode_data"
+    __table_args__ = (
+        # monthly quota counts and per-user listings filter on a created range
+        db.Index("ix_qrcode_data_user_id_created", "user_id", "created"),
+        # duplicate checks probe one user's urls by digest
+        db.Index("ix_qrcode_data_user_id_url_hash", "user_id", "url_hash"),
+    )
     id = db.Column(db.String(50), primary_key=True, default=hex_id)
     url = db.Column(db.Text)
+    url_hash = db.Column(db.LargeBinary(16))
     title = db.Column(db.String(150))
     phone_number = db.Column(db.String(50))
     message = db.Column(db.Text)
@@ -114,6 +121,12 @@ class QRCodeData(db.Model):
         db.session.delete(self)
         db.session.commit()
 
+    @db.validates("url")
+    def _hash_url(self, key, url):
+        # kept in step with url on every write through the orm
+        self.url_hash = url_hash(url)
+        return url
+
     def __repr__(self):
         return f"<QRCodeData {self.category}>"
 
@@ -282,9 +295,11 @@ class QrcodeRecord(db.Model):
         db.Index(
             "idx_qr_code_record_qr_code_id", "qr_code_id"
         ),  # Added index for faster queries
+        # one row per qr code per day, date holds the start of that day
+        db.UniqueConstraint("qr_code_id", "date"),
     )
 
-    id = db.Column(db.String(50), primary_key=True, default=hex_id)
+    id = db.Column(db.Uuid(as_uuid=False), primary_key=True, default=uuid7)
     qr_code_id = db.Column(
         db.String(50),
         db.ForeignKey("qrcode_data.id", ondelete="CASCADE"),  # Added cascade
@@ -322,12 +337,20 @@ class QrCodeClickLocation(db.Model):
         ),  # Added index for time-based queries
     )
 
-    id = db.Column(db.String(50), primary_key=True, default=hex_id)
+    id = db.Column(db.Uuid(as_uuid=False), primary_key=True, default=uuid7)
+    # legacy text columns, emptied by flask clicks encode-dimensions
     ip_address = db.Column(db.String(39))  # Reduced length for IPv6
     country = db.Column(db.String(56))  # ISO country code max length
     city = db.Column(db.String(100))  # Reduced length
     device = db.Column(db.String(50))  # Reduced length
     browser = db.Column(db.String(50))  # Reduced length
+    # dictionary encoded dimensions, see models.click_dimension
+    country_id = db.Column(db.Integer, db.ForeignKey("click_dimensions.id"))
+    city_id = db.Column(db.Integer, db.ForeignKey("click_dimensions.id"))
+    device_id = db.Column(db.Integer, db.ForeignKey("click_dimensions.id"))
+    browser_id = db.Column(db.Integer, db.ForeignKey("click_dimensions.id"))
+    # keyed hash of the client ip instead of the address itself
+    ip_hash = db.Column(db.LargeBinary(16))
     qr_code_id = db.Column(
         db.String(50),
         db.ForeignKey("qrcode_data.id", ondelete="CASCADE"),  # Added cascade
@@ -341,17 +364,8 @@ class QrCodeClickLocation(db.Model):
         server_default=db.func.now(),  # Added server default
     )
 
-    def to_dict(self, city=False, country=False, device=False, browser=False):
-        pre_dict = {
+    def to_dict(self):
+        return {
             "id": self.id,
-            "ip_address": self.ip_address,
+            "ip_hash": self.ip_hash.hex() if self.ip_hash else None,
         }
-        if city:
-            pre_dict["city"] = self.city
-        if country:
-            pre_dict["country"] = self.country
-        if device:
-            pre_dict["device"] = self.device
-        if browser:
-            pre_dict["browser"] = self.browser
-        return pre_dict
@@ -1,5 +1,5 @@
 from extensions import db
-from func import hex_id
+from func import hex_id, url_hash
 from flask import request
 from sqlalchemy import func
 from utils import gen_short_code, return_host_url
@@ -7,8 +7,13 @@ from utils import gen_short_code, return_host_url
 
 class QRCodeDataUnauth(db.Model):
     __tablename__ = "qrcode_data_unauth"
+    __table_args__ = (
+        # duplicate checks probe the urls by digest
+        db.Index("ix_qrcode_data_unauth_url_hash", "url_hash"),
+    )
     id = db.Column(db.String(50), primary_key=True, default=hex_id)
     url = db.Column(db.Text)
+    url_hash = db.Column(db.LargeBinary(16))
     title = db.Column(db.String(150))
     phone_number = db.Column(db.String(50))
     message = db.Column(db.Text)
@@ -40,6 +45,12 @@ class QRCodeDataUnauth(db.Model):
     user_agent = db.Column(db.Text)
     created = db.Column(db.DateTime, nullable=False, default=db.func.now())
 
+    @db.validates("url")
+    def _hash_url(self, key, url):
+        # kept in step with url on every write through the orm
+        self.url_hash = url_hash(url)
+        return url
+
     def save(self):
         db.session.add(self)
         db.session.commit()
@@ -0,0 +1,31 @@
+from extensions import db
+
+
+# one row per live short code, whatever table owns it
+class ShortCode(db.Model):
+    __tablename__ = "short_codes"
+    # lower-cased code, the primary key doubles as the unique case-normalized
+    # index that keeps codes unique across short urls and qr codes
+    code = db.Column(db.String(250), primary_key=True)
+    short_url = db.Column(db.String(250), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    target_id = db.Column(db.String(50), nullable=False, index=True)
+    url = db.Column(db.Text)
+    hidden = db.Column(db.Boolean, default=False, nullable=False)
+    created = db.Column(db.DateTime, nullable=False, default=db.func.now())
+
+    # kinds
+    SHORT_URL = "short_url"
+    QRCODE = "qrcode"
+    QRCODE_UNAUTH = "qrcode_unauth"
+
+    def __repr__(self):
+        return f"ShortCode('{self.short_url}', '{self.kind}', '{self.target_id}')"
+
+    def to_link(self):
+        return {
+            "url": self.url,
+            "kind": self.kind,
+            "id": self.target_id,
+            "hidden": bool(self.hidden),
+        }
@@ -6,27 +6,29 @@ import uuid
 from urllib import request
 from urllib.error import HTTPError, URLError
 
-from hashids import Hashids
 from sqlalchemy import extract, func
 
 from extensions import db
-from func import hex_id
+from func import hex_id, url_hash, uuid7
 from logger import logger
 from utils import return_host_url, remove_host_url
 from flask import request
 
 # from sqlalchemy.dialects.postgresql import BYTEA
 
-secret = "any-secret-key-you-choose"
-
-hashids = Hashids(min_length=6, salt=secret)
-
 
 # url shortener table
 class Urlshort(db.Model):
     __tablename__ = "url_shortener"
+    __table_args__ = (
+        # monthly quota counts and per-user listings filter on a created range
+        db.Index("ix_url_shortener_user_id_created", "user_id", "created"),
+        # duplicate checks probe one user's urls by digest
+        db.Index("ix_url_shortener_user_id_url_hash", "user_id", "url_hash"),
+    )
     id = db.Column(db.String(50), primary_key=True, default=hex_id)
     url = db.Column(db.Text)
+    url_hash = db.Column(db.LargeBinary(16))
     short_url = db.Column(db.String(250))
     title = db.Column(db.String(250))
     clicks = db.Column(db.Integer, default=0)
@@ -45,6 +47,12 @@ class Urlshort(db.Model):
         "UrlShortenerClicks", backref="url_shortener", cascade="all, delete"
     )
 
+    @db.validates("url")
+    def _hash_url(self, key, url):
+        # kept in step with url on every write through the orm
+        self.url_hash = url_hash(url)
+        return url
+
     def __repr__(self):
         return f"Urlshort('{self.url}', '{self.short_url}', '{self.created}')"
 
@@ -83,7 +91,11 @@ class Urlshort(db.Model):
 # clicks model
 class UrlShortenerClicks(db.Model):
     __tablename__ = "url_shortener_clicks"
-    id = db.Column(db.String(50), primary_key=True, default=hex_id)
+    __table_args__ = (
+        # one row per link per day, created holds the start of that day
+        db.UniqueConstraint("url_id", "created"),
+    )
+    id = db.Column(db.Uuid(as_uuid=False), primary_key=True, default=uuid7)
     count = db.Column(db.Integer, default=0)
     url_id = db.Column(db.String(50), db.ForeignKey("url_shortener.id"))
     created = db.Column(db.DateTime, nullable=False, default=db.func.now())
@@ -110,12 +122,23 @@ class UrlShortenerClicks(db.Model):
 
 class ShortUrlClickLocation(db.Model):
     __tablename__ = "short_url_click_location"
-    id = db.Column(db.String(50), primary_key=True, default=hex_id)
+    __table_args__ = (
+        db.Index("idx_short_url_click_location_url_id_created", "url_id", "created"),
+    )
+    id = db.Column(db.Uuid(as_uuid=False), primary_key=True, default=uuid7)
+    # legacy text columns, emptied by flask clicks encode-dimensions
     ip_address = db.Column(db.String(250))
     country = db.Column(db.String(250))
     city = db.Column(db.String(250))
     device = db.Column(db.String(250))
     browser = db.Column(db.String(250))
+    # dictionary encoded dimensions, see models.click_dimension
+    country_id = db.Column(db.Integer, db.ForeignKey("click_dimensions.id"))
+    city_id = db.Column(db.Integer, db.ForeignKey("click_dimensions.id"))
+    device_id = db.Column(db.Integer, db.ForeignKey("click_dimensions.id"))
+    browser_id = db.Column(db.Integer, db.ForeignKey("click_dimensions.id"))
+    # keyed hash of the client ip instead of the address itself
+    ip_hash = db.Column(db.LargeBinary(16))
     url_id = db.Column(db.String(50), db.ForeignKey("url_shortener.id"))
     created = db.Column(db.DateTime, nullable=False, default=db.func.now())
 
@@ -129,16 +152,8 @@ class ShortUrlClickLocation(db.Model):
     def update(self):
         db.session.commit()
 
-    def to_dict(self, city=False, country=False, device=False, browser=False):
-        pre_dict = {
+    def to_dict(self):
+        return {
             "id": self.id,
+            "ip_hash": self.ip_hash.hex() if self.ip_hash else None,
         }
-        if city:
-            pre_dict["city"] = self.city
-        if country:
-            pre_dict["country"] = self.country
-        if device:
-            pre_dict["device"] = self.device
-        if browser:
-            pre_dict["browser"] = self.browser
-        return pre_dict
@@ -0,0 +1,31 @@
+from extensions import db
+
+
+# running dashboard totals per user, kept in step with the rows they count
+class UserCounters(db.Model):
+    __tablename__ = "user_counters"
+    user_id = db.Column(db.String(50), db.ForeignKey("users.id"), primary_key=True)
+    short_links = db.Column(db.Integer, nullable=False, default=0)
+    qr_codes = db.Column(db.Integer, nullable=False, default=0)
+    short_url_clicks = db.Column(db.Integer, nullable=False, default=0)
+    qr_code_clicks = db.Column(db.Integer, nullable=False, default=0)
+    supporters = db.Column(db.Integer, nullable=False, default=0)
+    donations = db.Column(db.Float, nullable=False, default=0)
+    updated = db.Column(
+        db.DateTime, nullable=False, default=db.func.now(), onupdate=db.func.now()
+    )
+
+    FIELDS = (
+        "short_links",
+        "qr_codes",
+        "short_url_clicks",
+        "qr_code_clicks",
+        "supporters",
+        "donations",
+    )
+
+    def __repr__(self):
+        return f"UserCounters('{self.user_id}')"
+
+    def to_dict(self):
+        return {field: getattr(self, field) or 0 for field in self.FIELDS}
@@ -0,0 +1,138 @@
+import datetime
+import hashlib
+import html
+import os
+import re
+import time
+from urllib.parse import urlsplit
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+from connection.redis_connection import redis_conn
+from logger import logger
+
+load_dotenv()
+
+TITLE_CONNECT_TIMEOUT = float(os.environ.get("TITLE_CONNECT_TIMEOUT", 2))
+TITLE_READ_TIMEOUT = float(os.environ.get("TITLE_READ_TIMEOUT", 3))
+# the read timeout is per socket read, this bounds a page that trickles in
+TITLE_DEADLINE = float(os.environ.get("TITLE_DEADLINE", 5))
+# bytes read from a page before giving up on finding its title
+TITLE_MAX_BYTES = int(os.environ.get("TITLE_MAX_BYTES", 65536))
+TITLE_MAX_LENGTH = int(os.environ.get("TITLE_MAX_LENGTH", 250))
+TITLE_CACHE_TTL = int(os.environ.get("TITLE_CACHE_TTL", 86400))
+# a domain that timed out or refused is not asked again for this long
+TITLE_DOMAIN_FAILURE_TTL = int(os.environ.get("TITLE_DOMAIN_FAILURE_TTL", 600))
+
+TITLE_PATTERN = re.compile(rb"<title[^>]*>(.*?)</title\s*>", re.IGNORECASE | re.DOTALL)
+TITLE_END = re.compile(rb"</title\s*>", re.IGNORECASE)
+CHARSET_PATTERN = re.compile(rb"<meta[^>]+charset=[\"']?([\w-]+)", re.IGNORECASE)
+
+_session = None
+
+
+def placeholder_title():
+    """Title a link gets until the one of its page is known."""
+    return f"Untitled {datetime.datetime.now().strftime('%Y-%m-%d %I:%M:%S')}"
+
+
+def _get_session():
+    # one pooled session per process, connections to a host are reused
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=20, pool_maxsize=20, max_retries=0)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.max_redirects = 5
+        session.headers.update(
+            {"User-Agent": "Mozilla/5.0 (compatible; IszifyBot/1.0)"}
+        )
+        _session = session
+    return _session
+
+
+def _url_key(url):
+    return f"page_title:url:{hashlib.sha1(url.encode('utf-8')).hexdigest()}"
+
+
+def _domain_key(url):
+    return f"page_title:domain:{(urlsplit(url).hostname or '').lower()}"
+
+
+def parse_title(head, encoding=None):
+    """Text of the <title> tag in the first bytes of a page, or None."""
+    match = TITLE_PATTERN.search(head)
+    if not match:
+        return None
+    if not encoding:
+        charset = CHARSET_PATTERN.search(head)
+        encoding = charset.group(1).decode("ascii") if charset else "utf-8"
+    try:
+        title = match.group(1).decode(encoding, errors="replace")
+    except LookupError:
+        title = match.group(1).decode("utf-8", errors="replace")
+    title = " ".join(html.unescape(title).split())
+    return title[:TITLE_MAX_LENGTH] or None
+
+
+def _download_head(url):
+    timeout = (TITLE_CONNECT_TIMEOUT, TITLE_READ_TIMEOUT)
+    deadline = time.monotonic() + TITLE_DEADLINE
+    with _get_session().get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        if "html" not in response.headers.get("Content-Type", "text/html"):
+            return b"", None
+        head = b""
+        for chunk in response.iter_content(chunk_size=8192):
+            head += chunk
+            # the end tag may straddle two chunks, look a little back
+            if TITLE_END.search(head, max(0, len(head) - len(chunk) - 16)):
+                break
+            if len(head) >= TITLE_MAX_BYTES or time.monotonic() > deadline:
+                break
+        # requests falls back to latin-1 for any text/* without a charset
+        encoding = (
+            response.encoding
+            if "charset" in response.headers.get("Content-Type", "")
+            else None
+        )
+        return head[:TITLE_MAX_BYTES], encoding
+
+
+def fetch_title(url):
+    """Title of the page at url, None when it has none or cannot be read.
+
+    Results are cached per url, a failing domain is skipped for a while.
+    """
+    if not url:
+        return None
+    cached = redis_conn.get(_url_key(url))
+    if cached is not None:
+        return cached or None
+    if redis_conn.get(_domain_key(url)):
+        return None
+    try:
+        title = parse_title(*_download_head(url))
+    except (requests.ConnectionError, requests.Timeout) as e:
+        logger.error(f"{e}: error@page_title/fetch_title")
+        redis_conn.set(_domain_key(url), "1", TITLE_DOMAIN_FAILURE_TTL)
+        return None
+    except Exception as e:
+        logger.error(f"{e}: error@page_title/fetch_title")
+        title = None
+    redis_conn.set(_url_key(url), title or "", TITLE_CACHE_TTL)
+    return title
+
+
+def queue_title_fetch(kind, link_id, url, placeholder):
+    """Fill the placeholder title of a new link from a worker."""
+    from celery_config.utils.celery_works import fetch_link_title
+
+    try:
+        fetch_link_title.delay(kind, link_id, url, placeholder)
+    except Exception as e:
+        # the link keeps its placeholder, creating it must not fail
+        logger.error(f"{e}: error@page_title/queue_title_fetch")
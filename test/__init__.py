@@ -0,0 +1,5 @@
+import os
+
+# settings the app refuses to start without
+os.environ.setdefault("RESEND_API_KEY", "test")
+os.environ.setdefault("SHORT_CODE_SALT", "test-salt")
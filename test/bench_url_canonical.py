@@ -0,0 +1,22 @@
+"""Cost of canonicalize per url, run with python -m test.bench_url_canonical"""
+import timeit
+
+from url_canonical import canonicalize
+
+URLS = [
+    "https://www.example.com/some/path?id=42&ref=abc",
+    "Example.com",
+    "https://example.com/%7euser/caf%c3%a9?q=a%20b",
+    "http://bücher.de/katalog",
+]
+ROUNDS = 20000
+
+
+def main():
+    for url in URLS:
+        took = min(timeit.repeat(lambda: canonicalize(url), number=ROUNDS, repeat=5))
+        print(f"{took / ROUNDS * 1e6:6.2f}us  {url}")
+
+
+if __name__ == "__main__":
+    main()
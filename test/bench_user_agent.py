@@ -0,0 +1,34 @@
+"""Cost of classify per request, run with python -m test.bench_user_agent"""
+
+import timeit
+
+import user_agent
+from test.test_user_agent import CHROME_ANDROID, CHROME_WINDOWS, GOOGLEBOT
+from test.test_user_agent import SAFARI_IPHONE
+
+HEADERS = [CHROME_WINDOWS, SAFARI_IPHONE, CHROME_ANDROID, GOOGLEBOT]
+ROUNDS = 20000
+
+
+def main():
+    for header in HEADERS:
+        # the parsing alone, then a header already in the memo
+        cold = min(
+            timeit.repeat(
+                lambda: user_agent._classify.__wrapped__(header),
+                number=ROUNDS,
+                repeat=5,
+            )
+        )
+        user_agent.classify(header)
+        cached = min(
+            timeit.repeat(lambda: user_agent.classify(header), number=ROUNDS, repeat=5)
+        )
+        print(
+            f"{cold / ROUNDS * 1e6:6.2f}us parsed  "
+            f"{cached / ROUNDS * 1e6:6.2f}us memoized  {header[:60]}"
+        )
+
+
+if __name__ == "__main__":
+    main()
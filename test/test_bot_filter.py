@@ -0,0 +1,37 @@
+import ipaddress
+import unittest
+
+from bot_filter import RangeSet, is_bot, parse_ranges
+from user_agent import classify
+
+FIREFOX = "Mozilla/5.0 (X11; Linux x86_64; rv:125.0) Gecko/20100101 Firefox/125.0"
+
+
+class TestBotFilter(unittest.TestCase):
+    def test_parse_plain_and_json_lists(self):
+        plain = parse_ranges("# crawlers\n66.249.64.0/27\nnot a range\n\n")
+        self.assertEqual([str(n) for n in plain], ["66.249.64.0/27"])
+
+        published = parse_ranges(
+            '{"prefixes": [{"ipv4Prefix": "40.77.167.0/24"},'
+            ' {"ipv6Prefix": "2001:4860:4801:10::/64"}]}'
+        )
+        self.assertEqual(
+            [str(n) for n in published],
+            ["40.77.167.0/24", "2001:4860:4801:10::/64"],
+        )
+
+    def test_range_lookup(self):
+        ranges = RangeSet(
+            parse_ranges("10.0.0.0/24\n10.0.1.0/24\n10.0.0.128/25\n2001:db8::/32")
+        )
+        # adjacent and nested networks are merged
+        self.assertEqual(len(ranges), 2)
+        for ip in ("10.0.0.1", "10.0.1.255", "::ffff:10.0.0.7", "2001:db8::1"):
+            self.assertIn(ipaddress.ip_address(ip), ranges)
+        for ip in ("10.0.2.0", "9.255.255.255", "2001:db9::1"):
+            self.assertNotIn(ipaddress.ip_address(ip), ranges)
+
+    def test_is_bot(self):
+        self.assertTrue(is_bot(classify("Twitterbot/1.0"), "8.8.8.8"))
+        self.assertFalse(is_bot(classify(FIREFOX), "not an ip"))
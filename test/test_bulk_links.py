@@ -0,0 +1,140 @@
+import io
+import json
+import unittest
+from unittest import mock
+
+from crud import bulk_links
+from crud.bulk_links import parse_bulk_csv, parse_bulk_json, validate_bulk_rows
+from func import url_hash
+
+
+def fake_links(rows):
+    # the columns create_short_urls reads back from _insert_chunk
+    return [
+        {
+            "id": row["url"],
+            "url": row["url"],
+            "url_hash": url_hash(row["url"]),
+            "short_url": f"code{row['url'][-1]}",
+        }
+        for row in rows
+    ]
+
+
+class TestBulkLinks(unittest.TestCase):
+    def test_parse_json_and_csv(self):
+        self.assertEqual(
+            parse_bulk_json(["https://a.com", {"url": "https://b.com", "title": "B"}]),
+            [
+                {"url": "https://a.com", "title": None},
+                {"url": "https://b.com", "title": "B"},
+            ],
+        )
+        self.assertIsNone(parse_bulk_json({"url": "https://a.com"}))
+
+        upload = io.BytesIO(
+            b"\xef\xbb\xbfURL,title\nhttps://a.com,A\n\nhttps://b.com\n"
+        )
+        self.assertEqual(
+            parse_bulk_csv(upload),
+            [
+                {"url": "https://a.com", "title": "A"},
+                {"url": "https://b.com", "title": None},
+            ],
+        )
+
+    def test_validate_rows(self):
+        valid, errors = validate_bulk_rows(
+            [
+                {"url": " https://a.com ", "title": "  "},
+                {"url": "", "title": None},
+                {"url": 12, "title": None},
+            ]
+        )
+        self.assertEqual(valid, [{"url": "https://a.com/", "title": None}])
+        self.assertEqual([error["index"] for error in errors], [1, 2])
+
+    def test_failed_job_keeps_the_committed_chunks(self):
+        rows = [{"url": f"https://a.com/{i}", "title": None} for i in range(3)]
+
+        def insert_chunk(user_id, chunk, want_qr_code):
+            if chunk[0]["url"].endswith("/2"):
+                raise RuntimeError("lost the database")
+            return fake_links(chunk)
+
+        with mock.patch.object(bulk_links, "BULK_CHUNK_SIZE", 2), mock.patch.object(
+            bulk_links, "_insert_chunk", side_effect=insert_chunk
+        ), mock.patch.object(
+            bulk_links, "_existing_links", return_value={}
+        ), mock.patch.object(
+            bulk_links, "set_bulk_job"
+        ) as set_bulk_job, mock.patch.object(
+            bulk_links, "release_short_links"
+        ) as release:
+            with self.assertRaises(RuntimeError):
+                bulk_links.create_short_urls("job", "user", rows)
+
+        # the first chunk as it is done, the rest when the job fails
+        self.assertEqual(
+            release.call_args_list, [mock.call("user", 2), mock.call("user", 1)]
+        )
+        fields = set_bulk_job.call_args.kwargs
+        self.assertEqual(fields["done"], 2)
+        self.assertEqual(
+            [link["short_link"] for link in json.loads(fields["links"])],
+            ["code0", "code1"],
+        )
+
+    def test_duplicates_are_skipped_and_reported(self):
+        urls = ["https://a.com/1", "https://a.com/2", "https://a.com/1"]
+        urls += ["https://a.com/3", "https://a.com/2"]
+        rows = [{"url": url, "title": None} for url in urls]
+        existing = {url_hash("https://a.com/3"): "Old3"}
+
+        with mock.patch.object(bulk_links, "BULK_CHUNK_SIZE", 2), mock.patch.object(
+            bulk_links,
+            "_insert_chunk",
+            side_effect=lambda u, chunk, q: fake_links(chunk),
+        ) as insert_chunk, mock.patch.object(
+            bulk_links,
+            "_existing_links",
+            side_effect=lambda u, hashes: {
+                digest: code for digest, code in existing.items() if digest in hashes
+            },
+        ) as existing_links, mock.patch.object(
+            bulk_links, "set_bulk_job"
+        ) as set_bulk_job, mock.patch.object(
+            bulk_links, "release_short_links"
+        ) as release:
+            links = bulk_links.create_short_urls("job", "user", rows)
+
+        self.assertEqual([link["url"] for link in links], urls[:2])
+        # one probe per chunk, only for urls the job has not created itself
+        self.assertEqual(existing_links.call_count, 3)
+        self.assertEqual(insert_chunk.call_count, 1)
+        self.assertEqual(sum(call.args[1] for call in release.call_args_list), 5)
+        fields = set_bulk_job.call_args.kwargs
+        self.assertEqual((fields["done"], fields["skipped"]), (5, 3))
+        self.assertEqual(
+            json.loads(fields["duplicates"]),
+            [
+                {"url": "https://a.com/1", "short_link": "code1"},
+                {"url": "https://a.com/3", "short_link": "Old3"},
+                {"url": "https://a.com/2", "short_link": "code2"},
+            ],
+        )
+
+    def test_reservation_over_the_allowance_is_given_back(self):
+        with mock.patch.object(bulk_links, "redis_conn") as redis_conn:
+            pipe = redis_conn.pipeline.return_value
+            conn = redis_conn.get_connection.return_value
+            conn.decrby.return_value = 3
+
+            pipe.execute.return_value = [3, True]
+            self.assertTrue(bulk_links.reserve_short_links("user", 3, 5))
+            conn.decrby.assert_not_called()
+
+            # another job already holds 3 of the 5
+            pipe.execute.return_value = [6, True]
+            self.assertFalse(bulk_links.reserve_short_links("user", 3, 5))
+            conn.decrby.assert_called_once_with("bulk_links:reserved:user", 3)
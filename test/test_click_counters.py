@@ -0,0 +1,178 @@
+import datetime
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+import app_config  # noqa: F401 registers every model on db
+from config import config_obj
+from crud import ingest_click_events, save_qrcode_clicks, save_shorten_url
+from crud import save_want_qr_code, increment_link_clicks, get_user_counters
+from crud import backfill_click_rollups
+from extensions import db
+from models.click_rollup import ClickRollup
+from models.qrcode import QRCodeData, QrcodeRecord
+from models.shorten_url import Urlshort, UrlShortenerClicks, ShortUrlClickLocation
+from models.users import Users
+
+THREADS = 8
+CLICKS_PER_THREAD = 25
+
+
+class TestClickCounters(unittest.TestCase):
+    def setUp(self):
+        # threads need a database shared between connections, set
+        # TEST_DATABASE_URI to run this against postgres
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        uri = os.environ.get("TEST_DATABASE_URI")
+        self.app = Flask(__name__)
+        self.app.config.from_object(config_obj["testing"])
+        if uri:
+            self.app.config["SQLALCHEMY_DATABASE_URI"] = uri
+        else:
+            path = os.path.join(self.tmp_dir.name, "clicks.sqlite")
+            self.app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{path}"
+            self.app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+                "connect_args": {"timeout": 30}
+            }
+        db.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        user = Users(
+            email="john_doe@example.com",
+            password="password",
+            first_name="john",
+            last_name="doe",
+            username="johndoe",
+        )
+        db.session.add(user)
+        db.session.commit()
+
+        self.user_id = user.id
+        self.url = save_shorten_url(
+            "https://example.com", "Abc12", "title", True, user.id
+        )
+        self.linked_qr = save_want_qr_code(
+            "url", "Abc12", self.url.id, self.url.url, user.id, "title"
+        )
+        self.qr_code = QRCodeData(
+            url="https://example.org", category="url", user_id=user.id
+        )
+        self.qr_code.save()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.tmp_dir.cleanup()
+
+    def hammer(self, work):
+        errors = []
+
+        def run():
+            with self.app.app_context():
+                try:
+                    for _ in range(CLICKS_PER_THREAD):
+                        work()
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    db.session.remove()
+
+        threads = [threading.Thread(target=run) for _ in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_ingest_counts_every_click(self):
+        url_id = self.url.id
+
+        def click():
+            event = {"kind": "short_url", "target_id": url_id, "ts": int(time.time())}
+            ingest_click_events([event])
+
+        self.hammer(click)
+
+        total = THREADS * CLICKS_PER_THREAD
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Urlshort, url_id).clicks, total)
+        self.assertEqual(db.session.get(QRCodeData, self.linked_qr.id).clicks, total)
+        daily = UrlShortenerClicks.query.filter_by(url_id=url_id).all()
+        self.assertEqual([row.count for row in daily], [total])
+        daily = QrcodeRecord.query.filter_by(qr_code_id=self.linked_qr.id).all()
+        self.assertEqual([row.clicks for row in daily], [total])
+        counters = get_user_counters(self.user_id)
+        self.assertEqual(counters["short_url_clicks"], total)
+        self.assertEqual(counters["qr_code_clicks"], total)
+
+    def test_single_click_path_counts_every_click(self):
+        qr_id = self.qr_code.id
+
+        def click():
+            save_qrcode_clicks(
+                qr_id,
+                {
+                    "ip_address": "127.0.0.1",
+                    "country": "NG",
+                    "city": "Lagos",
+                    "device": "Linux",
+                    "browser_name": "Firefox",
+                },
+            )
+            increment_link_clicks(QRCodeData, {qr_id: 1})
+            db.session.commit()
+
+        self.hammer(click)
+
+        total = THREADS * CLICKS_PER_THREAD
+        db.session.expire_all()
+        self.assertEqual(db.session.get(QRCodeData, qr_id).clicks, total)
+        daily = QrcodeRecord.query.filter_by(qr_code_id=qr_id).all()
+        self.assertEqual([row.clicks for row in daily], [total])
+
+    def test_rebuild_keeps_rollups_of_dropped_partitions(self):
+        dropped_day = datetime.datetime(2024, 1, 15)
+        kept_day = datetime.datetime(2024, 3, 15)
+        for day, country in ((dropped_day, "NG"), (kept_day, "GH")):
+            db.session.add(
+                ClickRollup(
+                    target_type="short_url",
+                    target_id=self.url.id,
+                    day=day,
+                    dimension=ClickRollup.COUNTRY,
+                    value=country,
+                    clicks=5,
+                )
+            )
+        # only the raw rows of march are left after the retention
+        db.session.add(
+            ShortUrlClickLocation(
+                url_id=self.url.id,
+                country="GH",
+                created=kept_day.replace(hour=10),
+            )
+        )
+        db.session.commit()
+
+        marker = datetime.datetime(2024, 2, 1)
+        with mock.patch(
+            "crud.click_rollup.retention_applied_before",
+            side_effect=lambda table: marker,
+        ), mock.patch("crud.click_rollup.mark_rollups_ready"):
+            backfill_click_rollups(workers=1)
+
+        rows = ClickRollup.query.filter_by(
+            target_id=self.url.id, dimension=ClickRollup.COUNTRY
+        ).order_by(ClickRollup.day)
+        self.assertEqual(
+            [(row.day, row.value, row.clicks) for row in rows],
+            [(dropped_day, "NG", 5), (kept_day, "GH", 1)],
+        )
@@ -0,0 +1,56 @@
+import unittest
+from unittest import mock
+
+import code_allocator
+from code_allocator import BlockAllocator, allocate, allocate_many, hashids
+from code_allocator import is_reserved
+
+
+class TestCodeAllocator(unittest.TestCase):
+    def incrby(self, key, amount):
+        self.sequence += amount
+        return self.sequence
+
+    def setUp(self):
+        self.sequence = 0
+        self.redis = mock.MagicMock()
+        # a counter left by earlier codes, no registry scan is needed
+        self.redis.exists.return_value = True
+        self.redis.incrby.side_effect = self.incrby
+        patcher = mock.patch.object(code_allocator.redis_conn, "get_connection")
+        patcher.start().return_value = self.redis
+        self.addCleanup(patcher.stop)
+
+    def test_workers_never_share_numbers(self):
+        workers = [BlockAllocator(block_size=10) for _ in range(3)]
+        numbers = [worker.take() for _ in range(25) for worker in workers]
+        self.assertEqual(len(set(numbers)), 75)
+        # one INCRBY per block, not per code
+        self.assertEqual(self.redis.incrby.call_count, 9)
+
+    def test_codes_keep_their_kind(self):
+        with mock.patch.object(code_allocator, "_allocator", BlockAllocator()):
+            codes = [allocate(url_short=True) for _ in range(200)]
+            qr_code = allocate()
+            unauth = allocate(un_auth=True)
+        self.assertEqual(len({code.lower() for code in codes}), 200)
+        self.assertTrue(all(code[0].upper() in "ABCDEFGHI" for code in codes))
+        self.assertIn(qr_code[0].upper(), "RSTUVWXYZ")
+        self.assertIn(unauth[0].upper(), "JKLMNOPQ")
+        self.assertEqual(hashids.decode(codes[0][1:].lower()), (1,))
+
+    def test_batches_take_one_range(self):
+        codes = allocate_many(50, url_short=True)
+        self.assertEqual(self.redis.incrby.call_count, 1)
+        self.assertEqual(
+            [hashids.decode(code[1:].lower())[0] for code in codes], list(range(1, 51))
+        )
+        # the next worker block starts after the batch
+        self.assertEqual(BlockAllocator().take(), 51)
+
+    def test_custom_codes_cannot_take_future_codes(self):
+        future = f"B{hashids.encode(10**6)}"
+        self.assertTrue(is_reserved(future))
+        self.assertTrue(is_reserved(future.upper()))
+        for code in ("my-launch", "Abc12", "summer2024", "café-menu", future[:-1]):
+            self.assertFalse(is_reserved(code), code)
@@ -0,0 +1,42 @@
+import unittest
+from unittest import mock
+
+import code_filter
+from code_filter import BloomFilter
+
+
+class TestCodeFilter(unittest.TestCase):
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(10000, fp_rate=0.01)
+        codes = [f"code{i}" for i in range(10000)]
+        for code in codes:
+            bloom.add(code)
+        self.assertTrue(all(code in bloom for code in codes))
+
+        false_positives = sum(f"miss{i}" in bloom for i in range(10000))
+        self.assertLess(false_positives / 10000, 0.02)
+
+    def test_might_exist(self):
+        bloom = BloomFilter(100)
+        bloom.add("abc123")
+        with mock.patch.object(code_filter, "_filter", None):
+            # not built yet, every code goes through the normal lookup
+            self.assertTrue(code_filter.might_exist("zzz999"))
+        with mock.patch.object(code_filter, "_filter", bloom):
+            self.assertTrue(code_filter.might_exist("ABC123"))
+            self.assertFalse(code_filter.might_exist("zzz999"))
+
+    def test_misses_not_trusted_while_rebuilding(self):
+        bloom = BloomFilter(100)
+        seen = []
+
+        def build(app):
+            seen.append(code_filter.might_exist("zzz999"))
+            raise SystemExit
+
+        with mock.patch.object(code_filter, "_filter", bloom), mock.patch.object(
+            code_filter, "redis_conn"
+        ), mock.patch.object(code_filter, "_build", side_effect=build):
+            with self.assertRaises(SystemExit):
+                code_filter._follow(None)
+        self.assertEqual(seen, [True])
@@ -0,0 +1,58 @@
+import ipaddress
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import geoip
+
+
+class TestGeoIP(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        csv_path = os.path.join(self.tmp_dir.name, "ranges.csv")
+        with open(csv_path, "w") as fh:
+            fh.write("# start,end,country,city\n")
+            fh.write("41.58.0.0,41.58.255.255,NG,Lagos\n")
+            fh.write("8.8.8.0,8.8.8.255,US,Mountain View\n")
+            fh.write("2c0f:f5c0::,2c0f:f5c0:ffff:ffff:ffff:ffff:ffff:ffff,NG,Abuja\n")
+            fh.write("102.89.0.0,102.89.255.255,continent,NG,state,Ibadan,0,0\n")
+        self.path = os.path.join(self.tmp_dir.name, "geoip.bin")
+        geoip.compile_table(csv_path, self.path)
+        self.table = geoip.GeoIPTable(self.path)
+
+    def tearDown(self):
+        self.table.close()
+        self.tmp_dir.cleanup()
+
+    def lookup(self, ip):
+        return self.table.lookup(ipaddress.ip_address(ip))
+
+    def test_ipv4_ranges(self):
+        self.assertEqual(self.lookup("41.58.10.1"), ["NG", "Lagos"])
+        self.assertEqual(self.lookup("8.8.8.8"), ["US", "Mountain View"])
+        self.assertEqual(self.lookup("102.89.3.4"), ["NG", "Ibadan"])
+        self.assertIsNone(self.lookup("8.8.9.0"))
+        self.assertIsNone(self.lookup("1.1.1.1"))
+
+    def test_ipv6_ranges(self):
+        self.assertEqual(self.lookup("2c0f:f5c0::1"), ["NG", "Abuja"])
+        self.assertEqual(self.lookup("::ffff:8.8.8.8"), ["US", "Mountain View"])
+        self.assertIsNone(self.lookup("2001:db8::1"))
+
+    def test_lookup_falls_back_to_unknown(self):
+        self.assertEqual(geoip.lookup("not an ip"), (geoip.UNKNOWN, geoip.UNKNOWN))
+        self.assertEqual(geoip.lookup(None), (geoip.UNKNOWN, geoip.UNKNOWN))
+
+    def test_reload_closes_the_previous_table(self):
+        with mock.patch.object(geoip, "GEOIP_DB_PATH", self.path), mock.patch.object(
+            geoip, "GEOIP_RELOAD_CHECK", 0
+        ), mock.patch.object(geoip, "_table", None):
+            first = geoip._load_table()
+            self.assertEqual(geoip.lookup("8.8.8.8"), ("US", "Mountain View"))
+            os.utime(self.path, (0, first.mtime + 10))
+            second = geoip._load_table()
+            self.assertIsNot(second, first)
+            self.assertTrue(first._map.closed)
+            self.assertEqual(geoip.lookup("41.58.10.1"), ("NG", "Lagos"))
+            second.close()
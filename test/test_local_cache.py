@@ -0,0 +1,66 @@
+import os
+import unittest
+from unittest import mock
+
+from connection.local_cache import LocalCache
+from connection.redis_connection import RedisConnection
+
+
+class TestLocalCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = LocalCache(mock.MagicMock(), size=2, ttls={"redirect": 30})
+        # pretend the invalidation listener of this worker is running
+        self.cache._pid = os.getpid()
+        self.cache._live = True
+
+    def test_only_listed_namespaces_are_kept(self):
+        self.cache.put("redirect:abc", "1")
+        self.cache.put("wallet:1", "2")
+        self.assertEqual(self.cache.get("redirect:abc"), "1")
+        self.assertIsNone(self.cache.get("wallet:1"))
+
+    def test_ttl_and_lru_bounds(self):
+        with mock.patch("connection.local_cache.time.monotonic", return_value=100):
+            self.cache.put("redirect:a", "a", expire=5)
+            self.cache.put("redirect:b", "b")
+            self.cache.get("redirect:a")
+            self.cache.put("redirect:c", "c")
+            # b was the least recently used entry
+            self.assertIsNone(self.cache.get("redirect:b"))
+        with mock.patch("connection.local_cache.time.monotonic", return_value=106):
+            # a expired with the shorter redis ttl, c lives for 30 seconds
+            self.assertIsNone(self.cache.get("redirect:a"))
+            self.assertEqual(self.cache.get("redirect:c"), "c")
+
+    def test_nothing_is_served_without_the_listener(self):
+        self.cache.put("redirect:a", "a")
+        self.cache._live = False
+        self.assertIsNone(self.cache.get("redirect:a"))
+
+    def test_broadcast_evicts_and_publishes(self):
+        self.cache.put("redirect:a", "a")
+        self.cache.broadcast("redirect:a", "wallet:1")
+        self.assertIsNone(self.cache.get("redirect:a"))
+        pipe = self.cache.redis.get_connection.return_value.pipeline.return_value
+        pipe.publish.assert_called_once_with(
+            "cache:invalidate", f"{self.cache.sender}|redirect:a"
+        )
+
+    def test_fill_racing_an_eviction_is_dropped(self):
+        conn = RedisConnection.__new__(RedisConnection)
+        conn.local = self.cache
+        conn.connection = mock.MagicMock()
+
+        def read(key):
+            # the key changes and is evicted while the old value is read
+            self.cache.evict(key)
+            return "old"
+
+        conn.connection.get.side_effect = read
+        self.assertEqual(conn.get("redirect:a"), "old")
+        self.assertIsNone(self.cache.get("redirect:a"))
+
+        conn.connection.get.side_effect = None
+        conn.connection.get.return_value = "new"
+        self.assertEqual(conn.get("redirect:a"), "new")
+        self.assertEqual(self.cache.get("redirect:a"), "new")
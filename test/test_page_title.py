@@ -0,0 +1,70 @@
+import unittest
+from unittest import mock
+
+import page_title
+from page_title import fetch_title, parse_title
+
+
+class FakeResponse:
+    def __init__(self, chunks, content_type="text/html; charset=utf-8"):
+        self.chunks = chunks
+        self.read = 0
+        self.headers = {"Content-Type": content_type}
+        self.encoding = "utf-8"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for chunk in self.chunks:
+            self.read += 1
+            yield chunk
+
+
+class TestPageTitle(unittest.TestCase):
+    def test_parse_title(self):
+        self.assertEqual(
+            parse_title(b"<html><TITLE lang=en>\n Caf&eacute;  &amp; bar </TITLE>"),
+            "Caf\xe9 & bar",
+        )
+        self.assertEqual(
+            parse_title(
+                '<meta charset="iso-8859-1"><title>Caf\xe9</title>'.encode("latin-1")
+            ),
+            "Caf\xe9",
+        )
+        self.assertIsNone(parse_title(b"<html><title></title>"))
+        self.assertIsNone(parse_title(b"<html><body>no title"))
+
+    def test_stops_reading_after_the_title(self):
+        response = FakeResponse([b"<html><head><title>Ho", b"me</ti", b"tle>", b"x"])
+        session = mock.MagicMock()
+        session.get.return_value = response
+        with mock.patch.object(page_title, "_session", session), mock.patch.object(
+            page_title, "redis_conn"
+        ) as redis:
+            redis.get.return_value = None
+            self.assertEqual(fetch_title("https://example.com"), "Home")
+        self.assertEqual(response.read, 3)
+        redis.set.assert_called_once_with(
+            page_title._url_key("https://example.com"),
+            "Home",
+            page_title.TITLE_CACHE_TTL,
+        )
+
+    def test_cached_and_failed_domains_are_not_fetched(self):
+        session = mock.MagicMock()
+        with mock.patch.object(page_title, "_session", session), mock.patch.object(
+            page_title, "redis_conn"
+        ) as redis:
+            redis.get.side_effect = lambda key: "" if "url" in key else None
+            self.assertIsNone(fetch_title("https://example.com/cached"))
+            redis.get.side_effect = lambda key: "1" if "domain" in key else None
+            self.assertIsNone(fetch_title("https://down.example.com"))
+        session.get.assert_not_called()
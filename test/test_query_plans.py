@@ -0,0 +1,77 @@
+import datetime
+import os
+import unittest
+
+from flask import Flask
+
+import app_config  # noqa: F401 registers every model on db
+from config import config_obj
+from crud import get_qrcode_clicks_in_range, get_url_clicks_in_range
+from extensions import db
+from func import month_bounds, url_hash
+from models.qrcode import QRCodeData
+from models.shorten_url import Urlshort
+
+DATABASE_URI = os.environ.get("TEST_DATABASE_URI", "")
+
+
+@unittest.skipUnless(
+    DATABASE_URI.startswith("postgresql"),
+    "set TEST_DATABASE_URI to a postgres database to check query plans",
+)
+class TestQueryPlans(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config.from_object(config_obj["testing"])
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URI
+        db.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.start, self.end = month_bounds(datetime.datetime.utcnow())
+        # the tables are tiny, make the planner pick an index whenever it can
+        db.session.execute(db.text("SET enable_seqscan = off"))
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def explain(self, query):
+        compiled = query.statement.compile(dialect=db.engine.dialect)
+        result = db.session.connection().exec_driver_sql(
+            f"EXPLAIN {compiled}", compiled.params
+        )
+        return "\n".join(row[0] for row in result)
+
+    def assert_index_scan(self, plan, table):
+        self.assertNotIn(f"Seq Scan on {table}", plan)
+        self.assertIn("Index", plan)
+
+    def test_daily_url_clicks_use_index(self):
+        query = get_url_clicks_in_range("user", self.start, self.end, "url")
+        self.assert_index_scan(self.explain(query), "url_shortener_clicks")
+
+    def test_daily_qrcode_clicks_use_index(self):
+        query = get_qrcode_clicks_in_range("user", self.start, self.end, "qr")
+        self.assert_index_scan(self.explain(query), "qr_code_record")
+
+    def test_monthly_link_counts_use_index(self):
+        for model in (Urlshort, QRCodeData):
+            query = model.query.filter(
+                model.user_id == "user",
+                model.created >= self.start,
+                model.created < self.end,
+            )
+            plan = self.explain(query)
+            self.assert_index_scan(plan, model.__tablename__)
+            self.assertIn(f"ix_{model.__tablename__}_user_id_created", plan)
+
+    def test_duplicate_url_checks_use_index(self):
+        for model in (Urlshort, QRCodeData):
+            query = model.query.filter_by(
+                user_id="user", url_hash=url_hash("https://example.com/a")
+            )
+            plan = self.explain(query)
+            self.assert_index_scan(plan, model.__tablename__)
+            self.assertIn(f"ix_{model.__tablename__}_user_id_url_hash", plan)
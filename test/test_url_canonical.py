@@ -0,0 +1,75 @@
+import unittest
+
+from func import url_hash
+from url_canonical import canonical_url, canonicalize, is_valid
+
+
+class TestUrlCanonical(unittest.TestCase):
+    def test_same_url_written_differently(self):
+        for url in (
+            "HTTP://Example.com/",
+            "http://example.com",
+            "example.com",
+            " http://EXAMPLE.com.:80 ",
+        ):
+            self.assertEqual(canonicalize(url), "http://example.com/")
+        self.assertEqual(
+            canonicalize("https://Example.com:443/Path/?B=1"),
+            "https://example.com/Path/?B=1",
+        )
+        self.assertEqual(
+            canonicalize("https://example.com:8443/a"), "https://example.com:8443/a"
+        )
+        # a url in the query does not give the link a scheme
+        self.assertEqual(
+            canonicalize("example.com/r?to=http://x.com"),
+            "http://example.com/r?to=http://x.com",
+        )
+
+    def test_idna_and_escapes(self):
+        self.assertEqual(
+            canonicalize("http://Bücher.de/caf%c3%a9/%7euser%2fx y"),
+            "http://xn--bcher-kva.de/caf%C3%A9/~user%2Fx%20y",
+        )
+        self.assertEqual(
+            canonicalize("http://[::1]:8080/#a b"), "http://[::1]:8080/#a%20b"
+        )
+
+    def test_tracking_params(self):
+        url = "https://example.com/?utm_source=x&id=1&fbclid=abc&UTM_Medium=y"
+        self.assertEqual(canonicalize(url), url)
+        self.assertEqual(
+            canonicalize(url, strip_tracking=True), "https://example.com/?id=1"
+        )
+        self.assertEqual(
+            canonicalize("https://example.com/?utm_source=x", strip_tracking=True),
+            "https://example.com/",
+        )
+
+    def test_trailing_slash(self):
+        self.assertEqual(
+            canonicalize("https://example.com/a/"), "https://example.com/a/"
+        )
+        for url in ("https://example.com/a/", "https://example.com/a//"):
+            self.assertEqual(
+                canonicalize(url, strip_trailing_slash=True), "https://example.com/a"
+            )
+        self.assertEqual(
+            canonicalize("https://example.com/a/?b=1#c/", strip_trailing_slash=True),
+            "https://example.com/a?b=1#c/",
+        )
+        # the root path stays
+        self.assertEqual(
+            canonicalize("https://example.com", strip_trailing_slash=True),
+            "https://example.com/",
+        )
+
+    def test_invalid_urls(self):
+        for url in ("ftp://example.com", "http://", "http://a.com:99999", None):
+            self.assertFalse(is_valid(url))
+        self.assertEqual(canonical_url("not a url"), "not a url")
+        self.assertIsNone(canonical_url(None))
+
+    def test_hash_follows_the_canonical_form(self):
+        self.assertEqual(url_hash("Example.com"), url_hash("http://example.com/"))
+        self.assertNotEqual(url_hash("example.com/a"), url_hash("example.com/A"))
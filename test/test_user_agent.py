@@ -0,0 +1,85 @@
+import unittest
+
+import user_agent
+from user_agent import BOT, DESKTOP, MOBILE, TABLET, UNKNOWN, classify
+
+CHROME_WINDOWS = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36"
+)
+EDGE_WINDOWS = CHROME_WINDOWS + " Edg/124.0.2478.51"
+SAFARI_IPHONE = (
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_4 like Mac OS X) AppleWebKit/605.1.15 "
+    "(KHTML, like Gecko) Version/17.4 Mobile/15E148 Safari/604.1"
+)
+SAFARI_IPAD = (
+    "Mozilla/5.0 (iPad; CPU OS 17_4 like Mac OS X) AppleWebKit/605.1.15 "
+    "(KHTML, like Gecko) Version/17.4 Mobile/15E148 Safari/604.1"
+)
+CHROME_ANDROID = (
+    "Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/124.0.0.0 Mobile Safari/537.36"
+)
+FIREFOX_LINUX = "Mozilla/5.0 (X11; Linux x86_64; rv:125.0) Gecko/20100101 Firefox/125.0"
+OPERA_MAC = (
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36 OPR/109.0.0.0"
+)
+GOOGLEBOT = "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)"
+CUBOT_ANDROID = (
+    "Mozilla/5.0 (Linux; Android 11; CUBOT_X50) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/96.0.4664.104 Mobile Safari/537.36"
+)
+
+
+class TestUserAgent(unittest.TestCase):
+    def test_browsers_and_os(self):
+        cases = {
+            CHROME_WINDOWS: ("Chrome", "Windows", DESKTOP),
+            EDGE_WINDOWS: ("Edge", "Windows", DESKTOP),
+            SAFARI_IPHONE: ("Safari", "iOS", MOBILE),
+            SAFARI_IPAD: ("Safari", "iOS", TABLET),
+            CHROME_ANDROID: ("Chrome", "Android", MOBILE),
+            CUBOT_ANDROID: ("Chrome", "Android", MOBILE),
+            FIREFOX_LINUX: ("Firefox", "Linux", DESKTOP),
+            OPERA_MAC: ("Opera", "Mac OS", DESKTOP),
+        }
+        for header, (browser, os_name, device) in cases.items():
+            agent = classify(header)
+            self.assertEqual(
+                (agent.browser, agent.os, agent.device, agent.is_bot),
+                (browser, os_name, device, False),
+                header,
+            )
+
+    def test_bots(self):
+        for header in (
+            GOOGLEBOT,
+            "WhatsApp/2.23.20.0 A",
+            "Slackbot-LinkExpanding 1.0 (+https://api.slack.com/robots)",
+            "Twitterbot/1.0",
+            "Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)",
+            "Mozilla/5.0 (compatible; AhrefsBot/7.0; +http://ahrefs.com/robot/)",
+            "Mozilla/5.0 (compatible; bot; +https://example.com)",
+            "facebookexternalhit/1.1",
+            "Mozilla/5.0 (compatible; UptimeRobot/2.0; http://www.uptimerobot.com/)",
+            "curl/8.4.0",
+            "python-requests/2.31.0",
+            "",
+            None,
+        ):
+            agent = classify(header)
+            self.assertTrue(agent.is_bot, header)
+            self.assertEqual(agent.device, BOT)
+
+    def test_unknown_agent(self):
+        self.assertEqual(
+            classify("Mozilla/5.0 (compatible)"),
+            (UNKNOWN, UNKNOWN, UNKNOWN, False),
+        )
+
+    def test_results_are_memoized(self):
+        before = user_agent.cache_info().hits
+        classify(FIREFOX_LINUX)
+        classify(FIREFOX_LINUX)
+        self.assertGreater(user_agent.cache_info().hits, before)
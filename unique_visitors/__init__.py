@@ -0,0 +1,77 @@
+import datetime
+import os
+
+from dotenv import load_dotenv
+
+from connection.redis_connection import redis_conn
+from logger import logger
+
+load_dotenv()
+
+# one HyperLogLog per scope per day, at most ~12KB each whatever the traffic
+UNIQUE_VISITORS_TTL_DAYS = int(os.environ.get("UNIQUE_VISITORS_TTL_DAYS", 400))
+
+
+def link_scope(kind, target_id):
+    return f"link:{kind}:{target_id}"
+
+
+def user_scope(kind, user_id):
+    return f"user:{kind}:{user_id}"
+
+
+def _key(scope, day):
+    return f"uv:{scope}:{day:%Y%m%d}"
+
+
+def _days(start, end):
+    day = start.date() if isinstance(start, datetime.datetime) else start
+    end = end.date() if isinstance(end, datetime.datetime) else end
+    while day < end:
+        yield day
+        day += datetime.timedelta(days=1)
+
+
+def add_visitors(visitors):
+    """PFADD {(scope, day): {visitor, ...}} in one round trip."""
+    if not visitors:
+        return
+    ttl = UNIQUE_VISITORS_TTL_DAYS * 86400
+    try:
+        pipe = redis_conn.pipeline()
+        for (scope, day), members in visitors.items():
+            pipe.pfadd(_key(scope, day), *members)
+            pipe.expire(_key(scope, day), ttl)
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"{e}: error@unique_visitors/add_visitors")
+
+
+def unique_by_day(scope, start, end):
+    """Estimated unique visitors of scope for every day in [start, end)."""
+    days = list(_days(start, end))
+    try:
+        pipe = redis_conn.pipeline()
+        for day in days:
+            pipe.pfcount(_key(scope, day))
+        counts = pipe.execute()
+    except Exception as e:
+        logger.error(f"{e}: error@unique_visitors/unique_by_day")
+        counts = [0] * len(days)
+    return dict(zip(days, counts))
+
+
+def unique_between(scope, start, end):
+    """Estimated unique visitors of scope over [start, end).
+
+    PFCOUNT over several keys counts their union, a visitor coming back on
+    another day of the range is counted once.
+    """
+    keys = [_key(scope, day) for day in _days(start, end)]
+    if not keys:
+        return 0
+    try:
+        return redis_conn.get_connection().pfcount(*keys)
+    except Exception as e:
+        logger.error(f"{e}: error@unique_visitors/unique_between")
+        return 0
@@ -0,0 +1,163 @@
+import os
+import re
+from functools import lru_cache
+from urllib.parse import quote, urlsplit
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# campaign tags are how marketing tells its links apart, they are only
+# dropped (and links differing by them merged) when this is switched on
+URL_STRIP_TRACKING_PARAMS = (
+    os.environ.get("URL_STRIP_TRACKING_PARAMS", "false").lower() == "true"
+)
+
+# "/a/" and "/a" are different urls to a server and many answer them
+# differently, they are only taken as the same url when this is switched on;
+# the bare "/" of a host is kept either way
+URL_STRIP_TRAILING_SLASH = (
+    os.environ.get("URL_STRIP_TRAILING_SLASH", "false").lower() == "true"
+)
+
+TRACKING_PARAMS = frozenset(
+    (
+        "fbclid",
+        "gclid",
+        "dclid",
+        "gbraid",
+        "wbraid",
+        "msclkid",
+        "yclid",
+        "igshid",
+        "mc_cid",
+        "mc_eid",
+        "_ga",
+        "_gl",
+    )
+)
+TRACKING_PREFIXES = ("utm_",)
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+SCHEMES = frozenset(DEFAULT_PORTS)
+
+# %XX escapes of unreserved characters mean the character itself
+UNRESERVED = frozenset(
+    "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~"
+)
+ESCAPE_PATTERN = re.compile(r"%([0-9A-Fa-f]{2})")
+# characters left alone when escaping the rest, "%" keeps existing escapes
+PATH_SAFE = "/%:@!$&'()*+,;=-._~"
+QUERY_SAFE = PATH_SAFE + "?"
+# a scheme at the very start, "://" further on may be inside the query
+SCHEME_PATTERN = re.compile(r"[A-Za-z][A-Za-z0-9+.-]*://")
+HOST_PATTERN = re.compile(r"[a-z0-9\-_.]+|[0-9a-f:.]+")
+# no escapes, no space, nothing outside ascii: nothing to requote
+PLAIN_PATTERN = re.compile(r"[A-Za-z0-9\-._~/:@!$&'()*+,;=?]*")
+
+
+def _unescape(match):
+    char = chr(int(match.group(1), 16))
+    return char if char in UNRESERVED else f"%{match.group(1).upper()}"
+
+
+def _normalize_escapes(text, safe):
+    if PLAIN_PATTERN.fullmatch(text):
+        return text
+    if "%" in text:
+        text = ESCAPE_PATTERN.sub(_unescape, text)
+    return quote(text, safe=safe)
+
+
+def _is_tracking(pair):
+    key = pair.split("=", 1)[0].lower()
+    return key in TRACKING_PARAMS or key.startswith(TRACKING_PREFIXES)
+
+
+@lru_cache(maxsize=1024)
+def _punycode(hostname):
+    # the idna codec is slow next to the rest, the same hosts come back
+    try:
+        return hostname.encode("idna").decode("ascii")
+    except UnicodeError:
+        raise ValueError(f"invalid host {hostname!r}")
+
+
+def _host(hostname):
+    hostname = hostname.rstrip(".")
+    if not hostname.isascii():
+        hostname = _punycode(hostname)
+    if not HOST_PATTERN.fullmatch(hostname):
+        raise ValueError(f"invalid host {hostname!r}")
+    return hostname
+
+
+def canonicalize(url, strip_tracking=None, strip_trailing_slash=None):
+    """One spelling for every way of writing the same http(s) url.
+
+    Scheme and host are lower-cased, internationalized hosts become
+    punycode, default ports and a trailing dot on the host go, an empty
+    path becomes "/", escapes of unreserved characters are decoded and the
+    others upper-cased. A url without a scheme is taken as http. Tracking
+    parameters are dropped when strip_tracking (or
+    URL_STRIP_TRACKING_PARAMS) is set, trailing slashes of the path when
+    strip_trailing_slash (or URL_STRIP_TRAILING_SLASH) is. Raises ValueError
+    for anything that is not an http(s) url with a host.
+    """
+    if strip_tracking is None:
+        strip_tracking = URL_STRIP_TRACKING_PARAMS
+    if strip_trailing_slash is None:
+        strip_trailing_slash = URL_STRIP_TRAILING_SLASH
+    url = url.strip()
+    if not SCHEME_PATTERN.match(url):
+        url = f"http://{url}"
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme not in SCHEMES or not parts.hostname:
+        raise ValueError(f"not an http url: {url!r}")
+
+    # hostname is already lower-cased and without the [] around ipv6
+    host = _host(parts.hostname)
+    if ":" in host:
+        host = f"[{host}]"
+    port = parts.port
+    if port is not None and port != DEFAULT_PORTS[scheme]:
+        host = f"{host}:{port}"
+    userinfo = parts.netloc.rpartition("@")[0] if "@" in parts.netloc else ""
+    netloc = f"{userinfo}@{host}" if userinfo else host
+
+    path = _normalize_escapes(parts.path, PATH_SAFE) or "/"
+    if strip_trailing_slash:
+        path = path.rstrip("/") or "/"
+    query = parts.query
+    if query:
+        if strip_tracking:
+            query = "&".join(
+                pair for pair in query.split("&") if pair and not _is_tracking(pair)
+            )
+        query = _normalize_escapes(query, QUERY_SAFE)
+
+    canonical = f"{scheme}://{netloc}{path}"
+    if query:
+        canonical = f"{canonical}?{query}"
+    if parts.fragment:
+        canonical = f"{canonical}#{_normalize_escapes(parts.fragment, QUERY_SAFE)}"
+    return canonical
+
+
+def is_valid(url):
+    try:
+        canonicalize(url)
+    except (ValueError, AttributeError):
+        return False
+    return True
+
+
+def canonical_url(url):
+    """canonicalize(url), or url as given when it is empty or not http(s)."""
+    if not url:
+        return url
+    try:
+        return canonicalize(url)
+    except (ValueError, AttributeError):
+        return url
@@ -0,0 +1,108 @@
+import os
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# distinct user agents remembered per process, real traffic only has a few
+# thousand of them
+UA_CACHE_SIZE = int(os.environ.get("UA_CACHE_SIZE", 4096))
+# longer user agents are cut before parsing, they are almost always junk
+UA_MAX_LENGTH = 512
+
+UNKNOWN = "Unknown"
+
+BOT = "bot"
+MOBILE = "mobile"
+TABLET = "tablet"
+DESKTOP = "desktop"
+
+UserAgent = namedtuple("UserAgent", "browser os device is_bot")
+
+# checked in order, browsers built on chromium also announce Chrome and Safari
+# so they come first
+BROWSERS = tuple(
+    (name, re.compile(pattern))
+    for name, pattern in (
+        ("Edge", r"Edg(?:e|A|iOS)?/"),
+        ("Opera", r"OPR/|Opera"),
+        ("Samsung Internet", r"SamsungBrowser/"),
+        ("Firefox", r"Firefox/|FxiOS/"),
+        ("Chrome", r"Chrome/|CriOS/"),
+        ("Safari", r"Version/[0-9.]+.*Safari"),
+        ("Internet Explorer", r"MSIE |Trident/"),
+    )
+)
+
+# names match the ones httpagentparser reported, already stored in the
+# device column of the click rows
+OPERATING_SYSTEMS = tuple(
+    (name, re.compile(pattern))
+    for name, pattern in (
+        ("Android", r"Android"),
+        ("iOS", r"iPhone|iPad|iPod"),
+        ("ChromeOS", r"CrOS"),
+        ("Windows", r"Windows"),
+        ("Mac OS", r"Macintosh|Mac OS X"),
+        ("Linux", r"Linux|X11"),
+    )
+)
+
+# "bot" alone or after a known crawler name, a bare "bot" suffix would
+# also catch phones such as the Cubot ones; matched against the lower-cased
+# header, IGNORECASE makes this alternation twice as slow
+BOT_PATTERN = re.compile(
+    r"(?<![a-z])bot\b|(?<![a-z])bot[/_]|(?:google|bing|yandex|duckduck|apple|"
+    r"twitter|slack|discord|telegram|linkedin|pinterest|reddit|skype|petal|"
+    r"ahrefs|semrush|mj12|dot|seznam|amazon|gpt|claude|qwant|ro)bot|"
+    r"crawl|spider|slurp|archiver|facebookexternalhit|"
+    r"whatsapp|embedly|iframely|vkshare|preview|monitor|uptime|pingdom|"
+    r"statuscake|headless|lighthouse|phantomjs|curl/|wget/|python-requests|"
+    r"python-urllib|aiohttp|go-http-client|okhttp|java/|httpclient|libwww|"
+    r"scrapy"
+)
+TABLET_PATTERN = re.compile(r"iPad|Tablet|Android(?!.*Mobile)")
+MOBILE_PATTERN = re.compile(r"Mobi|iPhone|iPod|Windows Phone")
+
+
+def _first(patterns, user_agent):
+    for name, pattern in patterns:
+        if pattern.search(user_agent):
+            return name
+    return UNKNOWN
+
+
+@lru_cache(maxsize=UA_CACHE_SIZE)
+def _classify(user_agent):
+    browser = _first(BROWSERS, user_agent)
+    os_name = _first(OPERATING_SYSTEMS, user_agent)
+    if BOT_PATTERN.search(user_agent.lower()):
+        return UserAgent(browser, os_name, BOT, True)
+    if TABLET_PATTERN.search(user_agent):
+        device = TABLET
+    elif MOBILE_PATTERN.search(user_agent):
+        device = MOBILE
+    elif os_name != UNKNOWN:
+        device = DESKTOP
+    else:
+        device = UNKNOWN
+    return UserAgent(browser, os_name, device, False)
+
+
+def classify(user_agent):
+    """(browser, os, device, is_bot) of a User-Agent header.
+
+    Every value is computed in one pass over precompiled patterns and the
+    result is memoized per user agent string. A missing header is a bot, no
+    browser sends a request without one.
+    """
+    if not user_agent:
+        return UserAgent(UNKNOWN, UNKNOWN, BOT, True)
+    return _classify(str(user_agent)[:UA_MAX_LENGTH])
+
+
+def cache_info():
+    return _classify.cache_info()
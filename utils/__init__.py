@@ -12,12 +12,13 @@ import hashlib
 import base64
 from io import BytesIO
 import time, json, socket
-from urllib.request import urlopen
 import requests
 import string
 import secrets
-from bs4 import BeautifulSoup
 
+import code_allocator
+import geoip
+from user_agent import classify
 from logger import logger
 
 
@@ -109,26 +110,7 @@ def generate_signature(params_to_sign, api_secret):
 
 
 def get_browser_info(request):
-    user_agent = request.user_agent
-    user_agent = str(user_agent)
-    browsers = {
-        "Chrome": r"Chrome\/([0-9\.]+)",
-        "Firefox": r"Firefox\/([0-9\.]+)",
-        "Safari": r"Version\/([0-9\.]+).*Safari",
-        "Edge": r"Edge\/([0-9\.]+)",
-        "Opera": r"OPR\/([0-9\.]+)",
-    }
-
-    browser_name = "Unknown"
-    # browser_version = 'Unknown'
-
-    for name, pattern in browsers.items():
-        match = re.search(pattern, user_agent)
-        if match:
-            browser_name = name
-            # browser_version = match.group(1)
-            break
-    return browser_name
+    return classify(request.headers.get("User-Agent")).browser
 
 
 def get_computer_name():
@@ -137,13 +119,9 @@ def get_computer_name():
 
 
 def get_info(user_ip):
-    url = f"http://ipinfo.io/{user_ip}/json"
-    response = urlopen(url)
-    data = json.load(response)
-
-    ip = data["ip"]
-    city = data["city"]
-    country = data["country"]
+    # resolved from the local geoip table, never leaves the process
+    ip = (user_ip or "").split(",")[0].strip()
+    country, city = geoip.lookup(ip)
 
     return ip, city, country
 
@@ -166,43 +144,7 @@ def user_id_limiter():
 
 
 def gen_short_code(url_short=False, un_auth=False):
-    # length = random.choice([6, 7, 8])
-    length = 5
-    # Randomly pick an initial from the list and randomly decide upper or lowercase
-    if url_short:
-        initial = random.choice(["A", "B", "C", "D", "E", "F", "G", "H", "I"])
-    elif un_auth:
-        initial = random.choice(["J", "K", "L", "M", "N", "O", "P", "Q"])
-    else:
-        initial = random.choice(["R", "S", "T", "U", "V", "W", "X", "Y", "Z"])
-    initial = random.choice([initial.lower(), initial.upper()])
-    # Define the possible characters for the short code (A-Z, a-z, 0-9)
-    characters = string.ascii_uppercase + string.ascii_lowercase + string.digits
-    # Generate a random string of the specified length with mixed case
-    short_code = "".join(secrets.choice(characters) for _ in range(length))
-
-    return f"{initial}{short_code}"
-
-
-def get_website_title(url):
-    try:
-        # Send a GET request to the website
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an error for bad responses
-
-        # Parse the HTML content
-        soup = BeautifulSoup(response.text, "html.parser")
-
-        # Find the title tag and get its text
-        title = soup.title.string if soup.title else None
-        logger.info(f"{title}: title from getWebsiteTitle")
-        return title
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error fetching the URL: {e}")
-        return None
-    except Exception as e:
-        logger.error(f"{e}: error@getWebsiteTitle")
-        return None
+    return code_allocator.allocate(url_short=url_short, un_auth=un_auth)
 
 
 def return_host_url(host_url):